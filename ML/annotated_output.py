@@ -0,0 +1,242 @@
+"""
+Writers for the annotated output video
+"""
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from ML.utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# full: one annotated file; parallel: one file rendered in parallel segments after tracking;
+# segments: rotating files uploaded while encoding; none: no annotated video
+ANNOTATED_OUTPUT_MODES = ["full", "parallel", "segments", "none"]
+
+BOX_COLOR = (0, 255, 0)
+TEXT_COLOR = (0, 0, 0)
+
+
+@lru_cache(maxsize=4096)
+def label_size(label_text: str) -> Tuple[int, int, int]:
+    """
+    Measure a label; labels repeat across frames, so the sizes are cached
+
+    Args:
+        label_text: Text drawn above a box
+
+    Returns:
+        Text width, text height and baseline in pixels
+    """
+    (text_width, text_height), baseline = cv2.getTextSize(label_text, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
+    return text_width, text_height, baseline
+
+
+def draw_detections(frame: np.ndarray, xyxy: np.ndarray, labels: Iterable[str],
+                    confidences: Iterable[float]) -> np.ndarray:
+    """
+    Draw boxes and labels onto a frame in place
+
+    Args:
+        frame: Frame to draw on; pass a copy if the original is still needed
+        xyxy: Boxes [x1, y1, x2, y2], array of shape (N, 4)
+        labels: Class name of each box
+        confidences: Confidence of each box
+
+    Returns:
+        The same frame
+    """
+    for (x1, y1, x2, y2), label, confidence in zip(xyxy.astype(int).tolist(), labels, confidences):
+        cv2.rectangle(frame, (x1, y1), (x2, y2), BOX_COLOR, 2)
+
+        # Label with its background above the box
+        label_text = f"{label} {confidence:.2f}"
+        text_width, text_height, baseline = label_size(label_text)
+        cv2.rectangle(frame, (x1, y1 - text_height - baseline), (x1 + text_width, y1), BOX_COLOR, -1)
+        cv2.putText(frame, label_text, (x1, y1 - baseline), cv2.FONT_HERSHEY_SIMPLEX, 0.5, TEXT_COLOR, 1)
+    return frame
+
+
+def draw_frame_detections(frame: np.ndarray, detections: Any) -> np.ndarray:
+    """
+    Draw the detections of a frame in place (render function of the Ultralytics models)
+
+    Args:
+        frame: Frame to draw on
+        detections: Detections of the frame, already filtered by confidence
+
+    Returns:
+        The same frame
+    """
+    return draw_detections(frame, detections.xyxy, detections.labels, detections.confidence)
+
+
+@lru_cache(maxsize=1)
+def supervision_annotators() -> Tuple[Any, Any]:
+    """Get the supervision box and label annotators used for YOLO-World"""
+    import supervision as sv
+    return sv.BoxAnnotator(thickness=2), sv.LabelAnnotator()
+
+
+def draw_supervision_detections(frame: np.ndarray, detections: Any) -> np.ndarray:
+    """
+    Draw the detections of a frame with the supervision annotators (render function of YOLO-World)
+
+    Args:
+        frame: Frame to draw on
+        detections: Detections of the frame, already filtered by confidence
+
+    Returns:
+        The annotated frame
+    """
+    box_annotator, label_annotator = supervision_annotators()
+    sv_detections = detections.to_supervision()
+    frame = box_annotator.annotate(scene=frame, detections=sv_detections)
+    if len(sv_detections) > 0:
+        labels = [f"{label} {confidence:.2f}" for label, confidence in zip(detections.labels, detections.confidence)]
+        frame = label_annotator.annotate(scene=frame, detections=sv_detections, labels=labels)
+    return frame
+
+
+def segment_prefix(video_name: str) -> str:
+    """
+    Get the S3 key prefix under which a video's annotated segments are uploaded
+
+    Args:
+        video_name: Name of the video
+
+    Returns:
+        Key prefix ending with '/'
+    """
+    return f"annotated/{video_name}/"
+
+
+class SegmentedVideoWriter:
+    """
+    VideoWriter that starts a new file every segment_frames frames
+
+    Each finished segment is handed to the upload function on a background
+    thread while encoding continues, and is deleted locally once uploaded.
+    Segment files are named '<base>.segNNNNN<ext>', so they sort in order.
+    """
+
+    def __init__(self, annotated_video_path: str, fourcc: int, fps: float, frame_size: Tuple[int, int],
+                 segment_frames: int, upload: Optional[Callable[[str], Optional[str]]] = None,
+                 max_uploads: int = 2, metrics: Optional[Any] = None) -> None:
+        """
+        Initialize the writer
+
+        Args:
+            annotated_video_path: Path the full annotated video would have
+            fourcc: Codec of the segments
+            fps: Frame rate of the segments
+            frame_size: Width and height of the frames
+            segment_frames: Frames per segment
+            upload: Function uploading a finished segment file, returning its key or None on failure
+            max_uploads: Number of segments uploaded concurrently
+            metrics: metrics.StageMetrics recording each upload as the 's3_upload' stage
+        """
+        self.base, self.ext = os.path.splitext(annotated_video_path)
+        self.fourcc = fourcc
+        self.fps = fps
+        self.frame_size = frame_size
+        self.segment_frames = max(1, segment_frames)
+        self.upload = upload
+        self.metrics = metrics
+        self.segment_paths: List[str] = []
+        self.uploaded_keys: List[str] = []
+        self._writer = None
+        self._frames_in_segment = 0
+        self._uploads: List[Future] = []
+        self._executor = ThreadPoolExecutor(max_workers=max_uploads, thread_name_prefix="segment-upload") if upload else None
+
+    def _finish_segment(self) -> None:
+        if self._writer is None:
+            return
+        self._writer.release()
+        self._writer = None
+        if self._executor is not None:
+            self._uploads.append(self._executor.submit(self._upload_segment, self.segment_paths[-1]))
+
+    def _upload_segment(self, path: str) -> Optional[str]:
+        size = os.path.getsize(path)
+        start = time.perf_counter()
+        key = self.upload(path)
+        if self.metrics is not None:
+            self.metrics.observe("s3_upload", time.perf_counter() - start)
+            if key:
+                self.metrics.count("s3_upload_bytes", size)
+        if key:
+            os.remove(path)
+        else:
+            logger.error(f"Upload of annotated segment {path} failed; keeping the local file")
+        return key
+
+    def write(self, frame: Any) -> None:
+        """
+        Write a frame, starting a new segment when the current one is full
+
+        Args:
+            frame: Annotated frame
+        """
+        if self._writer is None or self._frames_in_segment >= self.segment_frames:
+            self._finish_segment()
+            path = f"{self.base}.seg{len(self.segment_paths):05d}{self.ext}"
+            self._writer = cv2.VideoWriter(path, self.fourcc, self.fps, self.frame_size)
+            self.segment_paths.append(path)
+            self._frames_in_segment = 0
+        self._writer.write(frame)
+        self._frames_in_segment += 1
+
+    def release(self) -> None:
+        """Finish the last segment and wait for all uploads"""
+        self._finish_segment()
+        if self._executor is not None:
+            self.uploaded_keys = [key for key in (future.result() for future in self._uploads) if key]
+            self._executor.shutdown(wait=True)
+            logger.info(f"Uploaded {len(self.uploaded_keys)}/{len(self.segment_paths)} annotated segments")
+
+
+def create_annotated_writer(mode: str, annotated_video_path: str, fps: float, frame_size: Tuple[int, int],
+                            video_name: str, segment_seconds: float = 10.0,
+                            metrics: Optional[Any] = None) -> Optional[Any]:
+    """
+    Create the writer for the annotated output video
+
+    Args:
+        mode: Annotated output mode ('full', 'parallel', 'segments' or 'none')
+        annotated_video_path: Path of the annotated video
+        fps: Frame rate of the annotated video
+        frame_size: Width and height of the frames
+        video_name: Name of the video, used for the segments' S3 keys
+        segment_seconds: Duration of a segment in 'segments' mode
+        metrics: metrics.StageMetrics recording segment uploads in 'segments' mode
+
+    Returns:
+        A cv2.VideoWriter, a SegmentedVideoWriter, or None in 'none' and
+        'parallel' mode (which renders after tracking, see parallel_render.py)
+
+    Raises:
+        ValueError: If mode is not recognized
+    """
+    if mode not in ANNOTATED_OUTPUT_MODES:
+        raise ValueError(f"Unknown annotated output mode: {mode}. Available modes: {ANNOTATED_OUTPUT_MODES}")
+    if mode in ("none", "parallel"):
+        return None
+
+    # Use MP4V codec for compatibility
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # Codec for MP4
+    if mode == "full":
+        return cv2.VideoWriter(annotated_video_path, fourcc, fps, frame_size)
+
+    from ML.utils.connections import upload_to_s3
+    prefix = segment_prefix(video_name)
+    return SegmentedVideoWriter(
+        annotated_video_path, fourcc, fps, frame_size, segment_frames=int(segment_seconds * fps),
+        upload=lambda path: upload_to_s3(path, prefix + os.path.basename(path)), metrics=metrics
+    )
@@ -0,0 +1,5 @@
+"""
+Benchmarks for the ML package
+
+Each module can be run directly, e.g. ``python -m ML.benchmarks.batch_inference``.
+"""
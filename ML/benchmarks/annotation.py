@@ -0,0 +1,99 @@
+"""
+Benchmark of annotation and encoding cost per frame at 1080p
+
+Draws N synthetic detections per frame and measures ms/frame for:
+
+    copy:      the previous path, frame.copy() and cv2.getTextSize per box
+    in-place:  draw_detections on the decoded frame with cached label sizes
+    none:      ANNOTATED_OUTPUT=none, no annotation or encode work
+
+Each drawing mode is measured without and with mp4v encoding to a temporary file.
+"""
+import argparse
+import os
+import tempfile
+import time
+from typing import Callable, Optional
+
+import cv2
+import numpy as np
+
+from ML.annotated_output import draw_detections
+
+LABELS = np.array(["person", "car", "bicycle", "dog", "traffic light"], dtype=object)
+WIDTH, HEIGHT = 1920, 1080
+
+
+def copy_frame(frame: np.ndarray, xyxy: np.ndarray, labels: np.ndarray, confidences: np.ndarray) -> np.ndarray:
+    """The previous path: a copy per frame and an uncached text measurement per box"""
+    annotated_frame = frame.copy()
+    for (x1, y1, x2, y2), label, confidence in zip(xyxy.astype(int).tolist(), labels, confidences):
+        cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        label_text = f"{label} {confidence:.2f}"
+        (text_width, text_height), baseline = cv2.getTextSize(label_text, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
+        cv2.rectangle(annotated_frame, (x1, y1 - text_height - baseline), (x1 + text_width, y1), (0, 255, 0), -1)
+        cv2.putText(annotated_frame, label_text, (x1, y1 - baseline), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1)
+    return annotated_frame
+
+
+def make_frames(num_frames: int) -> np.ndarray:
+    """A moving gradient, so that the encoder sees realistic motion rather than noise"""
+    x = np.arange(WIDTH, dtype=np.uint16)[None, :]
+    y = np.arange(HEIGHT, dtype=np.uint16)[:, None]
+    frames = np.empty((num_frames, HEIGHT, WIDTH, 3), dtype=np.uint8)
+    for i in range(num_frames):
+        frames[i, :, :, 0] = (x + 4 * i) % 256
+        frames[i, :, :, 1] = (y + 2 * i) % 256
+        frames[i, :, :, 2] = ((x + y) // 4 + i) % 256
+    return frames
+
+
+def run(frames: np.ndarray, num_frames: int, detections: int, draw: Optional[Callable], encode: bool,
+        seed: int = 0) -> float:
+    """Milliseconds per frame for one mode"""
+    rng = np.random.default_rng(seed)
+    top_left = rng.uniform(0, [WIDTH - 200, HEIGHT - 200], (detections, 2))
+    xyxy = np.concatenate([top_left, top_left + rng.uniform(40, 200, (detections, 2))], axis=1).astype(np.float32)
+    labels = LABELS[np.arange(detections) % len(LABELS)]
+    confidences = rng.uniform(0.3, 1.0, detections).astype(np.float32)
+
+    path = os.path.join(tempfile.mkdtemp(), "annotated.mp4")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), 30, (WIDTH, HEIGHT)) if encode and draw else None
+    # Stands in for the decoder's output buffer; refilled outside the timed section
+    decoded = np.empty_like(frames[0])
+    elapsed = 0.0
+    for i in range(num_frames):
+        np.copyto(decoded, frames[i % len(frames)])
+        start = time.perf_counter()
+        if draw is not None:
+            annotated = draw(decoded, xyxy, labels, confidences)
+            if writer is not None:
+                writer.write(annotated)
+        elapsed += time.perf_counter() - start
+    if writer is not None:
+        start = time.perf_counter()
+        writer.release()
+        elapsed += time.perf_counter() - start
+    if os.path.exists(path):
+        os.remove(path)
+    return elapsed / num_frames * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark annotation modes at 1080p")
+    parser.add_argument("--detections", type=int, nargs="+", default=[5, 20, 100])
+    parser.add_argument("--frames", type=int, default=120)
+    args = parser.parse_args()
+
+    frames = make_frames(min(args.frames, 30))
+    modes = [("copy", copy_frame), ("in-place", draw_detections), ("none", None)]
+    print(f"{'detections':>10} | {'mode':>8} | {'draw ms/frame':>13} | {'draw+encode ms/frame':>20}")
+    for detections in args.detections:
+        for name, draw in modes:
+            draw_ms = run(frames, args.frames, detections, draw, encode=False)
+            encode_ms = run(frames, args.frames, detections, draw, encode=True)
+            print(f"{detections:>10} | {name:>8} | {draw_ms:>13.2f} | {encode_ms:>20.2f}")
+
+
+if __name__ == "__main__":
+    main()
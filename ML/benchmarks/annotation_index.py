@@ -0,0 +1,81 @@
+"""
+Benchmark of the memory of annotate_video's per-frame box lookup
+
+Generates synthetic tracked objects in start_time order, as the sorted
+cursor returns them, with a fixed number of tracks visible at any time. For
+videos of increasing length, it measures the peak Python memory and time of
+looking up the boxes of every frame with:
+
+    index:      list(objects) and build_frame_index, the whole video up front
+    streaming:  StreamingFrameIndex over the cursor, objects swept as they start and end
+
+Peak memory of the index mode grows with the number of detections in the
+video; that of the streaming mode with the number of concurrent tracks.
+"""
+import argparse
+import time
+import tracemalloc
+from typing import Any, Dict, Iterator, Tuple
+
+import numpy as np
+
+from annotate_video import StreamingFrameIndex, build_frame_index
+
+FPS = 30
+
+
+def generate_objects(minutes: float, concurrent: int, track_seconds: float, seed: int = 0) -> Iterator[Dict[str, Any]]:
+    """Yield objects sorted by start_time with about `concurrent` tracks visible at any time"""
+    rng = np.random.default_rng(seed)
+    num_tracks = int(minutes * 60 * concurrent / track_seconds)
+    starts = np.sort(rng.uniform(0, minutes * 60 - track_seconds, num_tracks))
+    track_frames = int(track_seconds * FPS)
+    for track, start in enumerate(starts.tolist()):
+        first_frame = int(start * FPS)
+        x, y = rng.uniform(0, 1000, 2).tolist()
+        yield {
+            "_id": f"track_{track:06d}",
+            "track_id": track,
+            "start_time": first_frame / FPS,
+            "frames": [{"frame": first_frame + i, "box": [x, y, x + 80, y + 80]} for i in range(track_frames)],
+        }
+
+
+def run(mode: str, minutes: float, concurrent: int, track_seconds: float) -> Tuple[float, float, int]:
+    """Peak MiB, seconds and number of boxes of looking up every frame of a video"""
+    num_frames = int(minutes * 60 * FPS)
+    boxes = 0
+    tracemalloc.start()
+    start = time.perf_counter()
+    objects = generate_objects(minutes, concurrent, track_seconds)
+    if mode == "index":
+        frame_objects = build_frame_index(list(objects))
+        for frame_number in range(num_frames):
+            boxes += len(frame_objects.get(frame_number, []))
+    else:
+        index = StreamingFrameIndex(objects)
+        for frame_number in range(num_frames):
+            boxes += len(index.boxes(frame_number, frame_number / FPS))
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return peak, elapsed, boxes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark memory of the annotation frame index")
+    parser.add_argument("--minutes", type=float, nargs="+", default=[5, 10, 20])
+    parser.add_argument("--concurrent", type=int, default=20, help="tracks visible at any time")
+    parser.add_argument("--track-seconds", type=float, default=30, help="duration of each track")
+    args = parser.parse_args()
+
+    print(f"{args.concurrent} concurrent tracks of {args.track_seconds:g}s")
+    print(f"{'minutes':>7} | {'mode':>9} | {'peak MiB':>8} | {'seconds':>7} | {'boxes':>9}")
+    for minutes in args.minutes:
+        for mode in ("index", "streaming"):
+            peak, elapsed, boxes = run(mode, minutes, args.concurrent, args.track_seconds)
+            print(f"{minutes:>7g} | {mode:>9} | {peak:>8.1f} | {elapsed:>7.2f} | {boxes:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark frames/sec of YOLODetector for different inference batch sizes
+"""
+import argparse
+import time
+from typing import List
+
+import cv2
+import numpy as np
+
+from ML.models.yolo_detector import YOLODetector
+from ML.utils.config import config
+
+
+def load_frames(video_path: str, num_frames: int) -> List[np.ndarray]:
+    """
+    Decode the first frames of a video, or generate random 1280x720 frames
+
+    Args:
+        video_path: Path to a video file, or None for synthetic frames
+        num_frames: Number of frames to load
+
+    Returns:
+        List of BGR frames
+    """
+    if video_path is None:
+        rng = np.random.default_rng(0)
+        return [rng.integers(0, 255, (720, 1280, 3), dtype=np.uint8) for _ in range(num_frames)]
+
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < num_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def benchmark(detector: YOLODetector, frames: List[np.ndarray], batch_size: int) -> float:
+    """
+    Measure detector throughput for one batch size
+
+    Args:
+        detector: Loaded detector
+        frames: Frames to run inference on
+        batch_size: Number of frames per inference call
+
+    Returns:
+        Frames per second
+    """
+    # Warm up with one batch so that model setup is not timed
+    detector.predict_batch(frames[:batch_size])
+
+    start = time.perf_counter()
+    for i in range(0, len(frames), batch_size):
+        detector.predict_batch(frames[i:i + batch_size])
+    elapsed = time.perf_counter() - start
+    return len(frames) / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark batched YOLO inference")
+    parser.add_argument("--video", type=str, default=None, help="Video to read frames from (default: random frames)")
+    parser.add_argument("--model-path", type=str, default=config.DEFAULT_MODEL_PATH)
+    parser.add_argument("--device", type=str, default=config.DEFAULT_DEVICE, choices=["cpu", "cuda"])
+    parser.add_argument("--frames", type=int, default=128, help="Number of frames to run")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    frames = load_frames(args.video, args.frames)
+    detector = YOLODetector(model_path=args.model_path, device=args.device)
+
+    print(f"{'batch size':>10} | {'frames/sec':>10}")
+    for batch_size in args.batch_sizes:
+        fps = benchmark(detector, frames, batch_size)
+        print(f"{batch_size:>10} | {fps:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Benchmark of annotate_video.download_and_merge_chunks against a GridFS stand-in
+
+Encodes a synthetic video, splits it into 5-second fragments the way the
+upload server does (ffmpeg segment muxer, videoID/startTime/duration/endTime
+metadata) and stores them in GridFS. It then measures the time and the peak
+Python memory of the merge for different numbers of fetch workers, and
+checks that the merged video has every frame.
+
+GridFS is mongomock's by default (pip install mongomock). Pass --mongodb-uri
+to use a real mongod instead. --latency-ms adds a delay to every GridFS chunk
+read, to emulate the round trip to a remote server.
+
+Run from the repository root, since annotate_video.py lives there.
+"""
+import argparse
+import glob
+import os
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Tuple
+
+import cv2
+import gridfs
+from bson import ObjectId
+
+import annotate_video
+from ML.utils.config import config
+
+
+def make_fragments(directory: str, seconds: int, fps: int, fragment_seconds: int) -> list:
+    """Encode a test pattern and split it into fragments without re-encoding"""
+    source = os.path.join(directory, "source.mp4")
+    subprocess.run(["ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", f"testsrc2=size=1280x720:rate={fps}",
+                    "-t", str(seconds), "-c:v", "libx264", "-preset", "ultrafast", "-g", str(fps), source], check=True)
+    subprocess.run(["ffmpeg", "-v", "error", "-i", source, "-c", "copy", "-f", "segment",
+                    "-segment_time", str(fragment_seconds), "-reset_timestamps", "1",
+                    os.path.join(directory, "output_%03d.mp4")], check=True)
+    return sorted(glob.glob(os.path.join(directory, "output_*.mp4")))
+
+
+def upload_fragments(db: Any, fragments: list) -> ObjectId:
+    """Store fragments in the filesBucket GridFS bucket with the upload server's metadata"""
+    fs = gridfs.GridFS(db, "filesBucket")
+    video_id = ObjectId()
+    start = 0.0
+    for path in fragments:
+        cap = cv2.VideoCapture(path)
+        duration = round(cap.get(cv2.CAP_PROP_FRAME_COUNT) / cap.get(cv2.CAP_PROP_FPS), 1)
+        cap.release()
+        metadata = {"videoID": video_id, "duration": duration, "startTime": round(start, 1),
+                    "endTime": round(start + duration, 1)}
+        start += duration
+        with open(path, "rb") as f:
+            fs.put(f, filename=os.path.basename(path), metadata=metadata)
+    return video_id
+
+
+def add_latency(latency_ms: float) -> None:
+    """Delay every GridFS chunk read"""
+    from gridfs.synchronous.grid_file import GridOut
+
+    readchunk = GridOut.readchunk
+
+    def delayed_readchunk(self):
+        time.sleep(latency_ms / 1000)
+        return readchunk(self)
+
+    GridOut.readchunk = delayed_readchunk
+
+
+def run(db: Any, video_id: ObjectId, workers: int) -> Tuple[float, float, int, dict]:
+    """Seconds, peak MiB, merged frame count and video info of one merge"""
+    config.CHUNK_FETCH_WORKERS = workers
+    with tempfile.TemporaryDirectory() as temp_dir:
+        tracemalloc.start()
+        start = time.perf_counter()
+        info = annotate_video.download_and_merge_chunks(db, str(video_id), temp_dir)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+        if info is None:
+            raise RuntimeError("Merge failed; see annotation.log")
+        cap = cv2.VideoCapture(info["path"])
+        frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+    return elapsed, peak, frames, info
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark merging GridFS video fragments")
+    parser.add_argument("--seconds", type=int, default=120, help="duration of the synthetic video")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--fragment-seconds", type=int, default=5)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--latency-ms", type=float, default=4.0, help="delay per GridFS chunk read")
+    parser.add_argument("--mongodb-uri", default=None, help="use this server instead of mongomock")
+    args = parser.parse_args()
+
+    if args.mongodb_uri:
+        from pymongo import MongoClient
+        client = MongoClient(args.mongodb_uri)
+    else:
+        import mongomock
+        import mongomock.gridfs
+        mongomock.gridfs.enable_gridfs_integration()
+        client = mongomock.MongoClient()
+    db = client["chunk_merge_benchmark"]
+
+    with tempfile.TemporaryDirectory() as directory:
+        fragments = make_fragments(directory, args.seconds, args.fps, args.fragment_seconds)
+        video_id = upload_fragments(db, fragments)
+    if args.latency_ms > 0:
+        add_latency(args.latency_ms)
+
+    expected = args.seconds * args.fps
+    print(f"{len(fragments)} fragments, {expected} frames, {args.latency_ms} ms per GridFS chunk read")
+    print(f"{'workers':>7} | {'seconds':>7} | {'peak MiB':>8} | {'frames':>6} | info")
+    try:
+        for workers in args.workers:
+            elapsed, peak, frames, info = run(db, video_id, workers)
+            summary = {key: info[key] for key in ("fps", "width", "height", "duration")}
+            print(f"{workers:>7} | {elapsed:>7.2f} | {peak:>8.1f} | {frames:>6} | {summary}")
+            if frames != expected:
+                print(f"  merged video has {frames} frames, expected {expected}")
+    finally:
+        if args.mongodb_uri:
+            client.drop_database("chunk_merge_benchmark")
+
+
+if __name__ == "__main__":
+    main()
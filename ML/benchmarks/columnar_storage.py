@@ -0,0 +1,103 @@
+"""
+Benchmark columnar trajectory storage against inline frame arrays
+
+Builds object documents in the inline format written by the detection sinks
+for tracks of several lengths, converts them to columnar segments, and
+compares their BSON size and the time to decode them from BSON into arrays
+(what a reader such as a spatial query needs) and into frame dicts.
+No database is needed; documents are encoded and decoded with bson.
+"""
+import argparse
+import time
+from typing import Any, Callable, Dict, List
+
+import bson
+import numpy as np
+
+from ML.columnar import columns_to_frames, decode_segments, ms_to_timestamp, timestamp_to_ms
+from ML.migrate_columnar import convert_object
+
+
+def make_object(num_frames: int, fps: float = 30.0, frame_size=(1920, 1080), seed: int = 0) -> Dict[str, Any]:
+    """
+    Build an inline object document for a track moving across the frame
+
+    Returns:
+        Object document with num_frames frames
+    """
+    rng = np.random.default_rng(seed)
+    width, height = frame_size
+    top_left = rng.uniform(0, [width - 100, height - 100]) + np.cumsum(rng.normal(0, 1, (num_frames, 2)), axis=0)
+    boxes = np.concatenate([top_left, top_left + [80, 60]], axis=1)
+    frames = []
+    for i, box in enumerate(boxes.tolist()):
+        center_x, center_y = (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+        frames.append({
+            "frame": i,
+            "timestamp": ms_to_timestamp(i * 1000 / fps),
+            "box": box,
+            "relative_position": [center_x / width, center_y / height],
+            "confidence": float(rng.uniform(0.3, 1.0)),
+        })
+    return {
+        "_id": "video.mp4_person_0",
+        "video_id": "video.mp4",
+        "object_name": "person",
+        "start_time": 0.0,
+        "end_time": timestamp_to_ms(frames[-1]["timestamp"]) / 1000,
+        "frames": frames,
+    }
+
+
+def inline_to_columns(doc: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    """Convert the frames of an inline document to arrays"""
+    frames = doc["frames"]
+    return {
+        "frame": np.array([f["frame"] for f in frames], dtype=np.uint32),
+        "box": np.array([f["box"] for f in frames], dtype=np.float32),
+        "confidence": np.array([f["confidence"] for f in frames], dtype=np.float32),
+    }
+
+
+def time_per_call(function: Callable[[], Any], repeat: int) -> float:
+    """Average milliseconds per call"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark columnar trajectory storage")
+    parser.add_argument("--frames", type=int, nargs="+", default=[30, 300, 1800, 18000])
+    parser.add_argument("--bucket-seconds", type=float, default=60.0)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'frames':>6} | {'inline KB':>9} | {'columnar KB':>11} | {'ratio':>5} | "
+          f"{'inline->arrays ms':>17} | {'columnar->arrays ms':>19} | {'columnar->dicts ms':>18}")
+    for num_frames in args.frames:
+        doc = make_object(num_frames)
+        fields, segments = convert_object(doc, args.bucket_seconds)
+        summary = {key: value for key, value in doc.items() if key != "frames"}
+        summary.update(fields)
+
+        inline_bytes = bson.encode(doc)
+        columnar_bytes: List[bytes] = [bson.encode(summary)] + [bson.encode(s) for s in segments]
+        segment_bytes = columnar_bytes[1:]
+
+        inline_ms = time_per_call(lambda: inline_to_columns(bson.decode(inline_bytes)), args.repeat)
+        columnar_ms = time_per_call(
+            lambda: decode_segments([bson.decode(data) for data in segment_bytes]), args.repeat
+        )
+        dicts_ms = time_per_call(
+            lambda: columns_to_frames(decode_segments([bson.decode(data) for data in segment_bytes])), args.repeat
+        )
+        inline_kb = len(inline_bytes) / 1024
+        columnar_kb = sum(len(data) for data in columnar_bytes) / 1024
+        print(f"{num_frames:>6} | {inline_kb:>9.1f} | {columnar_kb:>11.1f} | {inline_kb / columnar_kb:>5.1f} | "
+              f"{inline_ms:>17.2f} | {columnar_ms:>19.2f} | {dicts_ms:>18.2f}")
+
+
+if __name__ == "__main__":
+    main()
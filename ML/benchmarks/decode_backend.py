@@ -0,0 +1,72 @@
+"""
+Benchmark of decoding frames at detector resolution
+
+Reads a video and measures ms/frame until every frame is available at the
+target width:
+
+    opencv:  cv2.VideoCapture at source resolution, then cv2.resize
+    ffmpeg:  FFmpegCapture, scaled in ffmpeg's filter graph and piped as raw BGR
+
+With --fps, the ffmpeg backend also drops frames in the decoder.
+"""
+import argparse
+import time
+
+import cv2
+
+from ML.ffmpeg_capture import FFmpegCapture, scaled_size
+
+
+def run_opencv(video_path: str, width: int) -> tuple:
+    """Frames and milliseconds per frame for OpenCV decoding and resizing"""
+    cap = cv2.VideoCapture(video_path)
+    size = scaled_size(int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), width)
+    frames = 0
+    start = time.perf_counter()
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if size != (frame.shape[1], frame.shape[0]):
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_LINEAR)
+        frames += 1
+    elapsed = time.perf_counter() - start
+    cap.release()
+    return frames, elapsed / max(frames, 1) * 1000
+
+
+def run_ffmpeg(video_path: str, width: int, fps: float, threads: int) -> tuple:
+    """Frames and milliseconds per frame for the ffmpeg pipe backend"""
+    start = time.perf_counter()
+    cap = FFmpegCapture(video_path, width=width, fps=fps, threads=threads)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not decode {video_path} with ffmpeg")
+    frames = 0
+    while True:
+        ret, _ = cap.read()
+        if not ret:
+            break
+        frames += 1
+    elapsed = time.perf_counter() - start
+    cap.release()
+    return frames, elapsed / max(frames, 1) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the decode backends")
+    parser.add_argument("video_path")
+    parser.add_argument("--widths", type=int, nargs="+", default=[640, 0], help="0 = source width")
+    parser.add_argument("--fps", type=float, default=0.0, help="frame rate for the ffmpeg backend (0 = source)")
+    parser.add_argument("--threads", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'width':>6} | {'backend':>7} | {'frames':>6} | {'ms/frame':>8}")
+    for width in args.widths:
+        frames, ms = run_opencv(args.video_path, width)
+        print(f"{width or 'source':>6} | {'opencv':>7} | {frames:>6} | {ms:>8.2f}")
+        frames, ms = run_ffmpeg(args.video_path, width, args.fps, args.threads)
+        print(f"{width or 'source':>6} | {'ffmpeg':>7} | {frames:>6} | {ms:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
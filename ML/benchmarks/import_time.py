@@ -0,0 +1,85 @@
+"""
+Import-time budget of the ML package
+
+Imports each module in a fresh interpreter with ``python -X importtime`` and
+checks that:
+
+    - the cumulative import time stays within its budget (best of N runs)
+    - none of the heavy optional packages (model frameworks, database and
+      S3 clients) are imported; they are imported on first use
+
+Exits with status 1 if a module is over budget or imports a deferred package,
+so the script can run as a CI check.
+"""
+import argparse
+import subprocess
+import sys
+from typing import List, Set, Tuple
+
+# Budgets in milliseconds; generous enough for slower CI machines
+BUDGETS_MS = {
+    "ML.utils.connections": 100,
+    "ML.models": 300,
+    "ML.video_processor": 800,
+    "ML.main": 800,
+}
+
+# Packages that must only be imported when they are used
+DEFERRED_PACKAGES = ["torch", "ultralytics", "inference", "supervision", "pymongo", "boto3", "botocore", "scipy"]
+
+
+def import_time(module: str) -> Tuple[float, Set[str]]:
+    """
+    Import a module in a fresh interpreter
+
+    Args:
+        module: Dotted module name
+
+    Returns:
+        Cumulative import time in milliseconds and the top-level packages imported
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+    cumulative_us = 0
+    packages = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # header line
+        packages.add(name.strip().split(".")[0])
+        if name.strip() == module:
+            cumulative_us = int(cumulative)
+    return cumulative_us / 1000, packages
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check import times of the ML package against a budget")
+    parser.add_argument("--modules", nargs="+", default=list(BUDGETS_MS))
+    parser.add_argument("--runs", type=int, default=3, help="runs per module; the fastest counts")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply all budgets, e.g. for slow machines")
+    args = parser.parse_args()
+
+    failures: List[str] = []
+    print(f"{'module':>22} | {'import ms':>9} | {'budget ms':>9} | deferred packages imported")
+    for module in args.modules:
+        runs = [import_time(module) for _ in range(args.runs)]
+        elapsed = min(ms for ms, _ in runs)
+        imported = sorted(set(DEFERRED_PACKAGES) & set().union(*(packages for _, packages in runs)))
+        budget = BUDGETS_MS.get(module, max(BUDGETS_MS.values())) * args.scale
+        print(f"{module:>22} | {elapsed:>9.1f} | {budget:>9.0f} | {', '.join(imported) or '-'}")
+        if elapsed > budget:
+            failures.append(f"{module} took {elapsed:.0f} ms (budget {budget:.0f} ms)")
+        if imported:
+            failures.append(f"{module} imports {', '.join(imported)}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
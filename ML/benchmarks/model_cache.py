@@ -0,0 +1,59 @@
+"""
+Benchmark of per-video model setup, cold vs. warm
+
+Times what a video pays before its first detections, for N processors
+created one after another as process_video_file does:
+
+    uncached:  MODEL_CACHE=false, MODEL_WARMUP=false; every processor loads
+               the weights and its first batch pays for one-time setup
+    cached:    the process-wide model cache with warm-up; only the first
+               processor loads, later ones get the warm model
+
+Each row is VideoProcessor construction plus the first detect_batch call.
+"""
+import argparse
+import time
+from typing import List, Tuple
+
+import numpy as np
+
+from ML.models import clear_model_cache
+from ML.utils.config import config
+from ML.video_processor import VideoProcessor
+
+
+def run(model_name: str, model_path: str, device: str, videos: int, cache: bool,
+        batch_size: int) -> List[Tuple[float, float]]:
+    """Setup and first-batch seconds of each processor"""
+    config.MODEL_CACHE = cache
+    config.MODEL_WARMUP = cache
+    clear_model_cache()
+    frames = [np.random.default_rng(0).integers(0, 255, (720, 1280, 3), dtype=np.uint8)] * batch_size
+    timings = []
+    for _ in range(videos):
+        start = time.perf_counter()
+        processor = VideoProcessor(model_name=model_name, model_path=model_path, device=device)
+        created = time.perf_counter()
+        processor.detect_batch(frames)
+        timings.append((created - start, time.perf_counter() - created))
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark cold and warm model setup")
+    parser.add_argument("--model", default=config.DEFAULT_MODEL)
+    parser.add_argument("--model-path", default=config.DEFAULT_MODEL_PATH)
+    parser.add_argument("--device", default=config.DEFAULT_DEVICE)
+    parser.add_argument("--videos", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'mode':>8} | {'video':>5} | {'setup s':>7} | {'first batch s':>13} | {'total s':>7}")
+    for name, cache in [("uncached", False), ("cached", True)]:
+        timings = run(args.model, args.model_path, args.device, args.videos, cache, args.batch_size)
+        for index, (setup, first_batch) in enumerate(timings):
+            print(f"{name:>8} | {index:>5} | {setup:>7.3f} | {first_batch:>13.3f} | {setup + first_batch:>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Benchmark of parallel segment-wise rendering of an annotated video
+
+Encodes a synthetic video with a keyframe every second and draws synthetic
+detections on every frame, either sequentially (one decode, draw and encode
+loop, like ANNOTATED_OUTPUT=full) or with parallel_render for each number of
+worker processes. Segments start at the known keyframes and are joined with
+FFmpeg's concat demuxer.
+
+With --verify, all outputs are also encoded with the lossless FFV1 codec and
+their decoded frames are compared with those of the sequential renderer.
+"""
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from ML.annotated_output import draw_frame_detections
+from ML.models.detections import Detections
+from ML.parallel_render import RenderTask, plan_render_segments, render_parallel, segment_path, split_payloads
+
+LABELS = np.array(["person", "car", "bicycle", "dog", "traffic light"], dtype=object)
+
+
+def make_video(path: str, seconds: int, fps: int, width: int, height: int) -> None:
+    """Encode a test pattern with a keyframe every second"""
+    subprocess.run(["ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate={fps}",
+                    "-t", str(seconds), "-c:v", "libx264", "-preset", "veryfast", "-g", str(fps), path], check=True)
+
+
+def make_detections(num_frames: int, detections: int, width: int, height: int, seed: int = 0) -> dict:
+    """Boxes moving across the frame, per frame number"""
+    rng = np.random.default_rng(seed)
+    start = rng.uniform(0, [width - 200, height - 200], (detections, 2))
+    velocity = rng.uniform(-3, 3, (detections, 2))
+    size = rng.uniform(40, 200, (detections, 2))
+    labels = LABELS[np.arange(detections) % len(LABELS)]
+    confidence = rng.uniform(0.3, 1.0, detections).astype(np.float32)
+    payloads = {}
+    for frame_number in range(num_frames):
+        top_left = np.abs((start + velocity * frame_number) % [2 * (width - 200), 2 * (height - 200)]
+                          - [width - 200, height - 200])
+        xyxy = np.concatenate([top_left, top_left + size], axis=1).astype(np.float32)
+        payloads[frame_number] = Detections(xyxy, confidence, np.arange(detections) % len(LABELS), labels)
+    return payloads
+
+
+def render_sequential(video_path: str, output_path: str, payloads: dict, fps: float, size: tuple, fourcc: str) -> int:
+    """The sequential renderer: one decode, draw and encode loop"""
+    cap = cv2.VideoCapture(video_path)
+    out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+    written = 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        draw_frame_detections(frame, payloads[written])
+        out.write(frame)
+        written += 1
+    cap.release()
+    out.release()
+    return written
+
+
+def render_segments(video_path: str, output_path: str, payloads: dict, fps: float, size: tuple, fourcc: str,
+                    workers: int, keyframes: list) -> int:
+    """Render with parallel_render, one segment per worker"""
+    segments = plan_render_segments(0, len(payloads), workers, keyframes, min_segment_frames=int(fps * 2))
+    tasks = [
+        RenderTask(video_path, segment_path(output_path, index), start, end, fps, size,
+                   draw_frame_detections, part, fourcc=fourcc)
+        for index, ((start, end), part) in enumerate(zip(segments, split_payloads(payloads, segments)))
+    ]
+    return render_parallel(tasks, output_path, min(workers, len(tasks)))
+
+
+def identical_frames(path_a: str, path_b: str) -> tuple:
+    """Number of frames and number of identical decoded frames of two videos"""
+    cap_a, cap_b = cv2.VideoCapture(path_a), cv2.VideoCapture(path_b)
+    frames = same = 0
+    while True:
+        ret_a, frame_a = cap_a.read()
+        ret_b, frame_b = cap_b.read()
+        if not (ret_a and ret_b):
+            frames += ret_a or ret_b  # a length mismatch counts as a differing frame
+            break
+        frames += 1
+        same += np.array_equal(frame_a, frame_b)
+    cap_a.release()
+    cap_b.release()
+    return frames, same
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark parallel segment-wise rendering")
+    parser.add_argument("--seconds", type=int, default=60)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--detections", type=int, default=20, help="boxes per frame")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--verify", action="store_true", help="compare decoded frames using the lossless FFV1 codec")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        video_path = os.path.join(directory, "source.mp4")
+        make_video(video_path, args.seconds, args.fps, args.width, args.height)
+        num_frames = args.seconds * args.fps
+        payloads = make_detections(num_frames, args.detections, args.width, args.height)
+        keyframes = list(range(0, num_frames, args.fps))
+        size = (args.width, args.height)
+
+        codecs = [("mp4v", ".mp4")] + ([("FFV1", ".mkv")] if args.verify else [])
+        print(f"{num_frames} frames at {args.width}x{args.height}, {args.detections} boxes per frame, "
+              f"{os.cpu_count()} cores")
+        print(f"{'codec':>5} | {'renderer':>12} | {'seconds':>7} | {'speed-up':>8} | {'frames':>6} | identical")
+        for fourcc, ext in codecs:
+            sequential_path = os.path.join(directory, f"sequential{ext}")
+            start = time.perf_counter()
+            written = render_sequential(video_path, sequential_path, payloads, args.fps, size, fourcc)
+            sequential_seconds = time.perf_counter() - start
+            print(f"{fourcc:>5} | {'sequential':>12} | {sequential_seconds:>7.2f} | {1.0:>8.2f} | {written:>6} |")
+            for workers in args.workers:
+                output_path = os.path.join(directory, f"parallel{workers}{ext}")
+                start = time.perf_counter()
+                written = render_segments(video_path, output_path, payloads, args.fps, size, fourcc,
+                                          workers, keyframes)
+                elapsed = time.perf_counter() - start
+                frames, same = identical_frames(sequential_path, output_path)
+                print(f"{fourcc:>5} | {f'{workers} workers':>12} | {elapsed:>7.2f} | {sequential_seconds / elapsed:>8.2f} | "
+                      f"{written:>6} | {same}/{frames}")
+                os.remove(output_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark frame sampling against the full-rate path
+
+Processes a video once at full rate and once per sampling configuration,
+keeping detections in memory, and reports the speed-up together with the
+drift in object start and end times relative to the full-rate run.
+"""
+import argparse
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from ML.detection_sink import MemoryDetectionSink
+from ML.utils.config import config
+from ML.video_processor import VideoProcessor
+
+
+def run(video_path: str, args: argparse.Namespace, mode: str, stride: int) -> Tuple[float, List[Dict[str, Any]]]:
+    """
+    Process a video with one sampling configuration
+
+    Args:
+        video_path: Path to the video file
+        args: Parsed command line arguments
+        mode: Sampling mode
+        stride: Sampling stride
+
+    Returns:
+        Wall-clock seconds and the instance documents produced
+    """
+    sink = MemoryDetectionSink()
+    processor = VideoProcessor(
+        model_name=args.model, model_path=args.model_path, device=args.device,
+        sink=sink, sampling_mode=mode, sample_stride=stride, write_summary=False,
+        write_spatial_index=False
+    )
+    start = time.perf_counter()
+    processor.process_video(video_path)
+    return time.perf_counter() - start, list(sink.documents.values())
+
+
+def match_instance(doc: Dict[str, Any], reference: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Find the reference instance of the same class that overlaps doc the most in time"""
+    best, best_overlap = None, 0.0
+    for ref in reference:
+        if ref["object_name"] != doc["object_name"]:
+            continue
+        overlap = min(ref["end_time"], doc["end_time"]) - max(ref["start_time"], doc["start_time"])
+        if overlap >= best_overlap:
+            best, best_overlap = ref, overlap
+    return best
+
+
+def drift(docs: List[Dict[str, Any]], reference: List[Dict[str, Any]]) -> Tuple[float, float]:
+    """
+    Compute the mean absolute start and end time drift against the reference run
+
+    Returns:
+        Mean start drift and mean end drift in seconds
+    """
+    start_drift, end_drift, matched = 0.0, 0.0, 0
+    for doc in docs:
+        ref = match_instance(doc, reference)
+        if ref is None:
+            continue
+        start_drift += abs(doc["start_time"] - ref["start_time"])
+        end_drift += abs(doc["end_time"] - ref["end_time"])
+        matched += 1
+    if matched == 0:
+        return 0.0, 0.0
+    return start_drift / matched, end_drift / matched
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark frame sampling against the full-rate path")
+    parser.add_argument("video", type=str, help="Path to video file")
+    parser.add_argument("--model", type=str, default=config.DEFAULT_MODEL)
+    parser.add_argument("--model-path", type=str, default=config.DEFAULT_MODEL_PATH)
+    parser.add_argument("--device", type=str, default=config.DEFAULT_DEVICE, choices=["cpu", "cuda"])
+    parser.add_argument("--strides", type=int, nargs="+", default=[2, 5, 10])
+    parser.add_argument("--keyframe", action="store_true", help="Also benchmark keyframe sampling")
+    args = parser.parse_args()
+
+    full_seconds, reference = run(args.video, args, "all", 1)
+    print(f"{'mode':>12} | {'seconds':>8} | {'speed-up':>8} | {'instances':>9} | {'start drift':>11} | {'end drift':>9}")
+    print(f"{'all':>12} | {full_seconds:>8.2f} | {1.0:>8.2f} | {len(reference):>9} | {0.0:>11.3f} | {0.0:>9.3f}")
+
+    configurations = [("stride", stride) for stride in args.strides]
+    if args.keyframe:
+        configurations.append(("keyframe", 1))
+    for mode, stride in configurations:
+        seconds, docs = run(args.video, args, mode, stride)
+        start_drift, end_drift = drift(docs, reference)
+        name = f"{mode}/{stride}" if mode == "stride" else mode
+        print(f"{name:>12} | {seconds:>8.2f} | {full_seconds / seconds:>8.2f} | {len(docs):>9} | "
+              f"{start_drift:>11.3f} | {end_drift:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Synthetic-trajectory check and throughput benchmark of the tracker backends
+
+Objects move with constant velocity and are hidden for a few frames at random
+times to simulate occlusions. Every backend is fed the same detections and
+is scored by how many instances it creates: ideally exactly one per object.
+Throughput is reported in frames per second.
+"""
+import argparse
+import time
+from typing import Dict, Tuple
+
+import numpy as np
+
+from ML.benchmarks.tracking import LABELS, make_trajectories
+from ML.tracking import AVAILABLE_TRACKERS, get_tracker
+
+
+def make_occlusions(num_frames: int, num_objects: int, occlusion_frames: int,
+                    occlusions_per_object: int, seed: int = 1) -> np.ndarray:
+    """
+    Build a visibility mask with gaps of occlusion_frames for every object
+
+    Returns:
+        Boolean array of shape (num_frames, num_objects)
+    """
+    rng = np.random.default_rng(seed)
+    visible = np.ones((num_frames, num_objects), dtype=bool)
+    for obj in range(num_objects):
+        for start in rng.integers(5, max(num_frames - occlusion_frames - 5, 6), occlusions_per_object):
+            visible[start:start + occlusion_frames, obj] = False
+    return visible
+
+
+def run(tracker_name: str, trajectories: np.ndarray, visible: np.ndarray,
+        fps: float, timeout_ms: float) -> Tuple[int, int, float]:
+    """
+    Feed the synthetic detections to a tracker backend
+
+    Returns:
+        Number of instances created, number of objects that were split into
+        more than one instance, and frames per second
+    """
+    num_frames, num_objects, _ = trajectories.shape
+    labels = np.array([LABELS[i % len(LABELS)] for i in range(num_objects)], dtype=object)
+    tracker = get_tracker(tracker_name, iou_threshold=0.3)
+    instances_per_object: Dict[int, set] = {obj: set() for obj in range(num_objects)}
+
+    start = time.perf_counter()
+    for frame_number in range(num_frames):
+        timestamp_ms = frame_number / fps * 1000
+        objects = np.flatnonzero(visible[frame_number])
+        updates = tracker.update(
+            frame_number, timestamp_ms, trajectories[frame_number, objects],
+            np.full(len(objects), 0.9), list(labels[objects])
+        )
+        for update in updates:
+            instances_per_object[int(objects[update.detection_index])].add(update.instance_id)
+        tracker.expire(timestamp_ms, timeout_ms)
+    elapsed = time.perf_counter() - start
+
+    instances = sum(len(ids) for ids in instances_per_object.values())
+    fragmented = sum(len(ids) > 1 for ids in instances_per_object.values())
+    return instances, fragmented, num_frames / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Synthetic-trajectory check and throughput of tracker backends")
+    parser.add_argument("--objects", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--speed", type=float, default=6.0, help="Maximum speed in pixels per frame")
+    parser.add_argument("--occlusion-frames", type=int, default=8)
+    parser.add_argument("--occlusions-per-object", type=int, default=2)
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--timeout-ms", type=float, default=2000.0)
+    args = parser.parse_args()
+
+    print(f"{'objects':>7} | {'tracker':>7} | {'instances':>9} | {'fragmented objects':>18} | {'frames/sec':>10}")
+    for num_objects in args.objects:
+        rng = np.random.default_rng(num_objects)
+        trajectories = make_trajectories(num_objects, args.frames)
+        # Re-draw velocities so that objects move far enough to lose IoU while occluded
+        velocity = rng.uniform(-args.speed, args.speed, (num_objects, 2))
+        offsets = velocity * np.arange(args.frames)[:, None, None]
+        trajectories = trajectories + np.concatenate([offsets, offsets], axis=2)
+        visible = make_occlusions(args.frames, num_objects, args.occlusion_frames, args.occlusions_per_object)
+
+        for tracker_name in AVAILABLE_TRACKERS:
+            instances, fragmented, fps = run(tracker_name, trajectories, visible, args.fps, args.timeout_ms)
+            print(f"{num_objects:>7} | {tracker_name:>7} | {instances:>9} | {fragmented:>18} | {fps:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark of the per-stage metrics: recording overhead and percentile accuracy
+
+Times StageMetrics.observe() and StageMetrics.timer() with metrics enabled and
+disabled, next to a bare time.perf_counter() call, and compares the
+histogram's p50/p95/p99 with the exact percentiles of log-normally
+distributed durations (the shape of per-frame decode and inference times).
+The error is bounded by the bucket width, a factor of 10^(1/20) (about 12%),
+and is well under 1% after interpolation for these distributions.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from ML.metrics import StageMetrics
+
+
+def per_call_ns(function, calls: int) -> float:
+    """Nanoseconds per call of a function"""
+    start = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return (time.perf_counter() - start) / calls * 1e9
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the per-stage metrics")
+    parser.add_argument("--calls", type=int, default=200000, help="calls per overhead measurement")
+    parser.add_argument("--samples", type=int, default=100000, help="durations per accuracy measurement")
+    parser.add_argument("--median-ms", type=float, nargs="+", default=[0.05, 4.0, 120.0],
+                        help="medians of the log-normal durations")
+    args = parser.parse_args()
+
+    enabled, disabled = StageMetrics(), StageMetrics(enabled=False)
+
+    def timed_block(metrics: StageMetrics) -> None:
+        with metrics.timer("stage"):
+            pass
+
+    print(f"{'operation':>28} | {'ns/call':>8}")
+    for name, function in [
+        ("time.perf_counter()", time.perf_counter),
+        ("observe() enabled", lambda: enabled.observe("stage", 0.004)),
+        ("observe() disabled", lambda: disabled.observe("stage", 0.004)),
+        ("with timer() enabled", lambda: timed_block(enabled)),
+        ("with timer() disabled", lambda: timed_block(disabled)),
+    ]:
+        print(f"{name:>28} | {per_call_ns(function, args.calls):>8.0f}")
+
+    rng = np.random.default_rng(0)
+    print()
+    print(f"{'median ms':>9} | {'percentile':>10} | {'exact ms':>10} | {'histogram ms':>12} | {'error':>6}")
+    for median_ms in args.median_ms:
+        samples = rng.lognormal(np.log(median_ms / 1000), 0.8, args.samples)
+        metrics = StageMetrics()
+        for seconds in samples.tolist():
+            metrics.observe("stage", seconds)
+        summary = metrics.summary()["stages"]["stage"]
+        for q in (50, 95, 99):
+            exact = float(np.percentile(samples, q)) * 1000
+            estimate = summary[f"p{q}_ms"]
+            print(f"{median_ms:>9g} | {f'p{q}':>10} | {exact:>10.4f} | {estimate:>12.4f} | "
+                  f"{(estimate - exact) / exact:>+6.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Benchmark streaming S3 downloads against downloading the whole object first
+
+Uploads a video to S3/MinIO, or to a local moto server with --moto, and
+measures two things: the time until the first frame is decoded, and the time
+until the whole video is decoded. It compares a full download followed by
+decoding with decoding from a StreamingDownload pipe. The video must be
+streamable (faststart MP4, MPEG-TS or Matroska). Remux MP4 files with
+`ffmpeg -i in.mp4 -c copy -movflags +faststart out.mp4`.
+
+A local server is much faster than a real bucket, so --mbps limits the
+bandwidth of every connection to simulate one.
+"""
+import argparse
+import io
+import os
+import tempfile
+import time
+from typing import Any, Dict, Tuple
+
+import boto3
+import cv2
+
+from ML.utils.config import config
+from ML.utils.downloads import StreamingDownload, is_streamable
+
+
+class ThrottledClient:
+    """S3 client wrapper that limits the bandwidth of each request"""
+
+    def __init__(self, client: Any, mbps: float) -> None:
+        self.client = client
+        self.bytes_per_second = mbps * 125000
+
+    def _throttle(self, size: int) -> None:
+        if self.bytes_per_second > 0:
+            time.sleep(size / self.bytes_per_second)
+
+    def head_object(self, **kwargs: Any) -> Dict[str, Any]:
+        return self.client.head_object(**kwargs)
+
+    def get_object(self, **kwargs: Any) -> Dict[str, Any]:
+        data = self.client.get_object(**kwargs)["Body"].read()
+        self._throttle(len(data))
+        return {"Body": io.BytesIO(data)}
+
+    def download_file(self, bucket: str, key: str, path: str) -> None:
+        data = self.get_object(Bucket=bucket, Key=key)["Body"].read()
+        with open(path, "wb") as f:
+            f.write(data)
+
+
+def decode(video_path: str, start: float) -> Tuple[float, float, int]:
+    """
+    Decode every frame of a video
+
+    Returns:
+        Seconds from start to the first frame and to the last frame, and the number of frames
+    """
+    cap = cv2.VideoCapture(video_path)
+    first_frame, frames = None, 0
+    while True:
+        ret, _ = cap.read()
+        if not ret:
+            break
+        if first_frame is None:
+            first_frame = time.perf_counter() - start
+        frames += 1
+    cap.release()
+    return first_frame or 0.0, time.perf_counter() - start, frames
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark streaming S3 downloads")
+    parser.add_argument("video", type=str, help="Path to a streamable video file")
+    parser.add_argument("--moto", action="store_true", help="Run against a local moto server")
+    parser.add_argument("--moto-port", type=int, default=5055)
+    parser.add_argument("--mbps", type=float, default=100.0, help="Bandwidth per connection (0 = unlimited)")
+    parser.add_argument("--part-size", type=int, default=config.S3_STREAM_PART_SIZE)
+    parser.add_argument("--concurrency", type=int, default=config.S3_STREAM_CONCURRENCY)
+    args = parser.parse_args()
+
+    bucket = config.AWS_STORAGE_BUCKET_NAME
+    s3_config = config.get_s3_config()
+    endpoint_url = s3_config.get("endpoint_url")
+    server = None
+    if args.moto:
+        from moto.server import ThreadedMotoServer
+        server = ThreadedMotoServer(port=args.moto_port)
+        server.start()
+        endpoint_url = f"http://127.0.0.1:{args.moto_port}"
+    client = boto3.client(
+        "s3", endpoint_url=endpoint_url, region_name=s3_config["region_name"],
+        aws_access_key_id=s3_config["aws_access_key_id"],
+        aws_secret_access_key=s3_config["aws_secret_access_key"]
+    )
+    if args.moto:
+        client.create_bucket(Bucket=bucket)
+
+    key = f"benchmark-{os.path.basename(args.video)}"
+    client.upload_file(args.video, bucket, key)
+    throttled = ThrottledClient(client, args.mbps)
+    if not is_streamable(client, bucket, key):
+        print("Warning: the video is not streamable (index at the end); decoding will wait for the whole file")
+
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            start = time.perf_counter()
+            local_path = os.path.join(temp_dir, "full", key)
+            os.makedirs(os.path.dirname(local_path))
+            throttled.download_file(bucket, key, local_path)
+            full_first, full_total, full_frames = decode(local_path, start)
+
+            start = time.perf_counter()
+            download = StreamingDownload(
+                throttled, bucket, key, os.path.join(temp_dir, "stream", key),
+                part_size=args.part_size, concurrency=args.concurrency
+            )
+            os.makedirs(os.path.dirname(download.local_path))
+            stream_first, stream_total, stream_frames = decode(download.start(), start)
+            download.wait()
+    finally:
+        client.delete_object(Bucket=bucket, Key=key)
+        if server is not None:
+            server.stop()
+
+    print(f"{'mode':>10} | {'first frame (s)':>15} | {'all frames (s)':>14} | {'frames':>6}")
+    print(f"{'full':>10} | {full_first:>15.2f} | {full_total:>14.2f} | {full_frames:>6}")
+    print(f"{'streaming':>10} | {stream_first:>15.2f} | {stream_total:>14.2f} | {stream_frames:>6}")
+
+
+if __name__ == "__main__":
+    main()
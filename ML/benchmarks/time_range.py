@@ -0,0 +1,134 @@
+"""
+Benchmark of annotating a time range of a long upload vs. the whole video
+
+Stores a long synthetic upload in GridFS as 5-second fragments (one encoded
+fragment repeated, with the upload server's metadata) and synthetic tracked
+objects in the objects collection. It then times
+annotate_video.annotate_time_range for a short window and, with --full, for
+the whole video, and checks the frame count of each output.
+
+GridFS and the collections are mongomock's by default (pip install
+mongomock); pass --mongodb-uri to use a real mongod instead.
+
+Run from the repository root, since annotate_video.py lives there.
+"""
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+from typing import Any, Optional
+
+import cv2
+import gridfs
+import numpy as np
+from bson import ObjectId
+
+import annotate_video
+
+FRAGMENT_SECONDS = 5
+FPS = 30
+WIDTH, HEIGHT = 640, 360
+
+
+def make_fragment(path: str) -> None:
+    """Encode one fragment of a test pattern"""
+    subprocess.run(["ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", f"testsrc2=size={WIDTH}x{HEIGHT}:rate={FPS}",
+                    "-t", str(FRAGMENT_SECONDS), "-c:v", "libx264", "-preset", "veryfast", "-crf", "35",
+                    "-g", str(FPS), path], check=True)
+
+
+def store_upload(db: Any, fragment: str, minutes: float, tracks_per_minute: int, track_seconds: float,
+                 seed: int = 0) -> ObjectId:
+    """Store the fragments, the video document and the tracked objects of a synthetic upload"""
+    fs = gridfs.GridFS(db, "filesBucket")
+    video_id = ObjectId()
+    with open(fragment, "rb") as f:
+        data = f.read()
+    num_fragments = int(minutes * 60 / FRAGMENT_SECONDS)
+    for i in range(num_fragments):
+        metadata = {"videoID": video_id, "duration": FRAGMENT_SECONDS, "startTime": i * FRAGMENT_SECONDS,
+                    "endTime": (i + 1) * FRAGMENT_SECONDS}
+        fs.put(data, filename=f"output_{i:04d}.mp4", metadata=metadata)
+    db.videos.insert_one({"_id": video_id, "filename": f"{video_id}.mp4", "status": "ready"})
+
+    rng = np.random.default_rng(seed)
+    duration = num_fragments * FRAGMENT_SECONDS
+    documents = []
+    for track in range(int(minutes * tracks_per_minute)):
+        start = float(rng.uniform(0, max(duration - track_seconds, 0)))
+        first_frame = int(start * FPS)
+        x, y = rng.uniform(0, [WIDTH - 100, HEIGHT - 100])
+        frames = [{"frame": first_frame + i, "timestamp": (first_frame + i) * 1000 / FPS,
+                   "box": [x + i % 50, y, x + i % 50 + 80, y + 80], "confidence": 0.9}
+                  for i in range(int(track_seconds * FPS))]
+        documents.append({"_id": f"{video_id}_{track}", "video_id": str(video_id), "track_id": track,
+                          "object_name": "person", "start_time": start,
+                          "end_time": frames[-1]["frame"] / FPS, "frames": frames})
+        if len(documents) == 100:
+            db.objects.insert_many(documents)
+            documents = []
+    if documents:
+        db.objects.insert_many(documents)
+    db.objects.create_index([("video_id", 1), ("object_name", 1), ("start_time", 1), ("end_time", 1)])
+    return video_id
+
+
+def run(db: Any, video_id: ObjectId, output_dir: str, start: Optional[float], end: Optional[float]):
+    """Seconds and output frame count of one annotation"""
+    began = time.perf_counter()
+    path = annotate_video.annotate_time_range(db, str(video_id), start, end, output_dir=output_dir)
+    elapsed = time.perf_counter() - began
+    if path is None:
+        raise RuntimeError("Annotation failed; see annotation.log")
+    cap = cv2.VideoCapture(path)
+    frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    os.remove(path)
+    return elapsed, frames
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark time-range annotation of a long upload")
+    parser.add_argument("--minutes", type=float, default=120, help="duration of the synthetic upload")
+    parser.add_argument("--start", type=float, default=3600, help="start of the window in seconds")
+    parser.add_argument("--seconds", type=float, default=10, help="duration of the window")
+    parser.add_argument("--tracks-per-minute", type=int, default=2)
+    parser.add_argument("--track-seconds", type=float, default=30)
+    parser.add_argument("--full", action="store_true", help="also annotate the whole video")
+    parser.add_argument("--mongodb-uri", default=None, help="use this server instead of mongomock")
+    args = parser.parse_args()
+
+    if args.mongodb_uri:
+        from pymongo import MongoClient
+        client = MongoClient(args.mongodb_uri)
+    else:
+        import mongomock
+        import mongomock.gridfs
+        mongomock.gridfs.enable_gridfs_integration()
+        client = mongomock.MongoClient()
+    db = client["time_range_benchmark"]
+
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            fragment = os.path.join(directory, "fragment.mp4")
+            make_fragment(fragment)
+            video_id = store_upload(db, fragment, args.minutes, args.tracks_per_minute, args.track_seconds)
+
+            end = args.start + args.seconds
+            cases = [(f"{args.start:g}s-{end:g}s", args.start, end, int(round(end * FPS)) - int(round(args.start * FPS)))]
+            if args.full:
+                cases.append(("whole video", None, None, int(args.minutes * 60 * FPS)))
+            print(f"{args.minutes:g} minute upload, {int(args.minutes * 60 / FRAGMENT_SECONDS)} fragments, "
+                  f"{int(args.minutes * args.tracks_per_minute)} tracks")
+            print(f"{'range':>14} | {'seconds':>8} | {'frames':>7} | {'expected':>8}")
+            for name, start, stop, expected in cases:
+                elapsed, frames = run(db, video_id, directory, start, stop)
+                print(f"{name:>14} | {elapsed:>8.2f} | {frames:>7} | {expected:>8}")
+    finally:
+        if args.mongodb_uri:
+            client.drop_database("time_range_benchmark")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+Columnar storage of object trajectories as packed typed arrays
+
+An object stored in this format keeps its metadata in the ``objects``
+collection (without ``frames``) and its frames in time-bucketed segment
+documents in ``object_segments``. Each segment holds one bucket of the
+trajectory as little-endian arrays stored as BSON binary:
+
+    frame:        uint32   frame numbers
+    ms:           uint32   timestamps in milliseconds
+    box:          float32  [x1, y1, x2, y2] per frame
+    confidence:   float32
+    interpolated: packed bits, only present if any frame was interpolated
+
+Relative positions are not stored; they are derived from the boxes and the
+frame size kept on the segment.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+from bson import Binary
+
+COLUMNAR_FORMAT_VERSION = 1
+SEGMENTS_COLLECTION = "object_segments"
+
+# Empty columns, used when an object has no frames in the requested range
+_EMPTY_COLUMNS = {
+    "frame": np.empty(0, dtype=np.uint32),
+    "ms": np.empty(0, dtype=np.uint32),
+    "box": np.empty((0, 4), dtype=np.float32),
+    "confidence": np.empty(0, dtype=np.float32),
+    "interpolated": np.empty(0, dtype=bool),
+    "relative_position": np.empty((0, 2), dtype=np.float64),
+}
+
+
+def timestamp_to_ms(timestamp: Union[str, float]) -> int:
+    """
+    Convert a frame timestamp to milliseconds
+
+    Args:
+        timestamp: Timestamp in format HH:MM:SS.mmm, or numeric milliseconds
+
+    Returns:
+        Timestamp in milliseconds
+    """
+    if not isinstance(timestamp, str):
+        return int(round(timestamp))
+    hours, minutes, seconds = timestamp.split(':')
+    return int(round((int(hours) * 3600 + int(minutes) * 60 + float(seconds)) * 1000))
+
+
+def ms_to_timestamp(ms: int) -> str:
+    """
+    Convert milliseconds to a timestamp string
+
+    Args:
+        ms: Milliseconds
+
+    Returns:
+        Timestamp in format HH:MM:SS.mmm
+    """
+    seconds, millis = divmod(int(ms), 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours % 24:02d}:{minutes:02d}:{seconds:02d}.{millis:03d}"
+
+
+def encode_segment(object_id: str, video_id: str, object_name: str, bucket: int,
+                   frames: List[Dict[str, Any]], frame_width: int, frame_height: int) -> Dict[str, Any]:
+    """
+    Pack frames in the document format into a segment document
+
+    Args:
+        object_id: _id of the object
+        video_id: ID of the video
+        object_name: Label of the object
+        bucket: Index of the time bucket
+        frames: Frame entries with frame, timestamp, box, confidence and optional interpolated
+        frame_width: Width of the frames
+        frame_height: Height of the frames
+
+    Returns:
+        Segment document
+    """
+    count = len(frames)
+    frame_numbers = np.fromiter((f["frame"] for f in frames), dtype="<u4", count=count)
+    ms = np.fromiter((timestamp_to_ms(f["timestamp"]) for f in frames), dtype="<u4", count=count)
+    boxes = np.array([f["box"] for f in frames], dtype="<f4").reshape(-1, 4)
+    confidences = np.fromiter((f["confidence"] for f in frames), dtype="<f4", count=count)
+    interpolated = np.fromiter((bool(f.get("interpolated")) for f in frames), dtype=bool, count=count)
+
+    segment = {
+        "_id": f"{object_id}:{bucket:06d}",
+        "object_id": object_id,
+        "video_id": video_id,
+        "object_name": object_name,
+        "bucket": bucket,
+        "start_time": int(ms[0]) / 1000 if count else 0.0,
+        "end_time": int(ms[-1]) / 1000 if count else 0.0,
+        "count": count,
+        "frame_width": frame_width,
+        "frame_height": frame_height,
+        "format": COLUMNAR_FORMAT_VERSION,
+        "frame": Binary(frame_numbers.tobytes()),
+        "ms": Binary(ms.tobytes()),
+        "box": Binary(boxes.tobytes()),
+        "confidence": Binary(confidences.tobytes()),
+    }
+    if interpolated.any():
+        segment["interpolated"] = Binary(np.packbits(interpolated).tobytes())
+    return segment
+
+
+def decode_segment(segment: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    """
+    Unpack a segment document into arrays
+
+    Args:
+        segment: Segment document
+
+    Returns:
+        Columns frame, ms, box (N, 4), confidence, interpolated and relative_position (N, 2)
+    """
+    count = segment["count"]
+    boxes = np.frombuffer(segment["box"], dtype="<f4").reshape(-1, 4)
+    if "interpolated" in segment:
+        interpolated = np.unpackbits(np.frombuffer(segment["interpolated"], dtype=np.uint8), count=count).astype(bool)
+    else:
+        interpolated = np.zeros(count, dtype=bool)
+    centers = (boxes[:, :2].astype(np.float64) + boxes[:, 2:]) / 2
+    return {
+        "frame": np.frombuffer(segment["frame"], dtype="<u4"),
+        "ms": np.frombuffer(segment["ms"], dtype="<u4"),
+        "box": boxes,
+        "confidence": np.frombuffer(segment["confidence"], dtype="<f4"),
+        "interpolated": interpolated,
+        "relative_position": centers / [segment["frame_width"], segment["frame_height"]],
+    }
+
+
+def decode_segments(segments: Iterable[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """
+    Unpack and concatenate the segments of one object in bucket order
+
+    Args:
+        segments: Segment documents
+
+    Returns:
+        Concatenated columns (see decode_segment)
+    """
+    decoded = [decode_segment(segment) for segment in sorted(segments, key=lambda s: s["bucket"])]
+    if not decoded:
+        return {name: column.copy() for name, column in _EMPTY_COLUMNS.items()}
+    return {name: np.concatenate([columns[name] for columns in decoded]) for name in _EMPTY_COLUMNS}
+
+
+def columns_to_frames(columns: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    """
+    Convert decoded columns back to frame entries in the document format
+
+    Args:
+        columns: Columns from decode_segment or decode_segments
+
+    Returns:
+        Frame entries with frame, timestamp, box, relative_position, confidence
+        and, for interpolated frames, interpolated
+    """
+    frames = []
+    for frame, ms, box, confidence, interpolated, relative_position in zip(
+            columns["frame"].tolist(), columns["ms"].tolist(), columns["box"].tolist(),
+            columns["confidence"].tolist(), columns["interpolated"].tolist(),
+            columns["relative_position"].tolist()):
+        entry = {
+            "frame": frame,
+            "timestamp": ms_to_timestamp(ms),
+            "box": box,
+            "relative_position": relative_position,
+            "confidence": confidence,
+        }
+        if interpolated:
+            entry["interpolated"] = True
+        frames.append(entry)
+    return frames
+
+
+def split_into_buckets(frames: List[Dict[str, Any]], bucket_ms: float) -> List[Tuple[int, List[Dict[str, Any]]]]:
+    """
+    Group frame entries by time bucket
+
+    Args:
+        frames: Frame entries in time order
+        bucket_ms: Bucket duration in milliseconds
+
+    Returns:
+        List of (bucket index, frames) in bucket order
+    """
+    buckets: List[Tuple[int, List[Dict[str, Any]]]] = []
+    for frame in frames:
+        bucket = int(timestamp_to_ms(frame["timestamp"]) // bucket_ms)
+        if not buckets or buckets[-1][0] != bucket:
+            buckets.append((bucket, []))
+        buckets[-1][1].append(frame)
+    return buckets
+
+
+def ensure_segment_indexes(segments_collection: Any) -> None:
+    """
+    Create the indexes used to read an object's segments and a video's time range
+
+    Args:
+        segments_collection: MongoDB object_segments collection
+    """
+    segments_collection.create_index([("object_id", 1), ("bucket", 1)])
+    segments_collection.create_index([("video_id", 1), ("start_time", 1)])
+
+
+def read_object_frames(objects_collection: Any, object_id: str,
+                       segments_collection: Optional[Any] = None,
+                       start_time: Optional[float] = None,
+                       end_time: Optional[float] = None) -> Dict[str, np.ndarray]:
+    """
+    Read an object's trajectory as columns, whichever format it is stored in
+
+    Args:
+        objects_collection: MongoDB objects collection
+        object_id: _id of the object
+        segments_collection: MongoDB object_segments collection
+            (default: object_segments in the objects collection's database)
+        start_time: Only return frames at or after this time in seconds
+        end_time: Only return frames at or before this time in seconds
+
+    Returns:
+        Columns frame, ms, box, confidence, interpolated and relative_position
+
+    Raises:
+        KeyError: If the object does not exist
+    """
+    doc = objects_collection.find_one({"_id": object_id}, {"frames": 1, "storage": 1})
+    if doc is None:
+        raise KeyError(f"Object not found: {object_id}")
+
+    if doc.get("storage") == "columnar":
+        if segments_collection is None:
+            segments_collection = objects_collection.database[SEGMENTS_COLLECTION]
+        query: Dict[str, Any] = {"object_id": object_id}
+        if start_time is not None:
+            query["end_time"] = {"$gte": start_time}
+        if end_time is not None:
+            query["start_time"] = {"$lte": end_time}
+        columns = decode_segments(segments_collection.find(query))
+    else:
+        frames = doc.get("frames", [])
+        columns = {
+            "frame": np.array([f["frame"] for f in frames], dtype=np.uint32),
+            "ms": np.array([timestamp_to_ms(f["timestamp"]) for f in frames], dtype=np.uint32),
+            "box": np.array([f["box"] for f in frames], dtype=np.float32).reshape(-1, 4),
+            "confidence": np.array([f["confidence"] for f in frames], dtype=np.float32),
+            "interpolated": np.array([bool(f.get("interpolated")) for f in frames], dtype=bool),
+            "relative_position": np.array([f["relative_position"] for f in frames], dtype=np.float64).reshape(-1, 2),
+        }
+
+    if start_time is not None or end_time is not None:
+        keep = np.ones(len(columns["ms"]), dtype=bool)
+        if start_time is not None:
+            keep &= columns["ms"] >= start_time * 1000
+        if end_time is not None:
+            keep &= columns["ms"] <= end_time * 1000
+        columns = {name: column[keep] for name, column in columns.items()}
+    return columns
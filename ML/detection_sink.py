@@ -0,0 +1,528 @@
+"""
+Detection sinks for persisting per-frame detections to MongoDB
+"""
+import time
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from ML.columnar import SEGMENTS_COLLECTION, encode_segment, ensure_segment_indexes, ms_to_timestamp, timestamp_to_ms
+from ML.utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+@lru_cache(maxsize=4096)
+def _format_ms(ms: int) -> str:
+    """Format a timestamp; the detections of one video frame share it, so it is cached"""
+    return ms_to_timestamp(ms)
+
+
+def format_timestamps(frames: List[Dict[str, Any]], timestamp_format: str) -> None:
+    """
+    Convert the numeric frame timestamps of the processor to the stored format
+
+    Args:
+        frames: Frame entries, updated in place
+        timestamp_format: 'string' (HH:MM:SS.mmm) or 'ms' (numeric milliseconds, left as is)
+    """
+    if timestamp_format != "string":
+        return
+    for frame_data in frames:
+        if not isinstance(frame_data["timestamp"], str):
+            frame_data["timestamp"] = _format_ms(int(frame_data["timestamp"]))
+
+
+class DetectionSink(ABC):
+    """
+    Abstract base class for detection sinks
+
+    A sink receives instance creations and frame appends from the video
+    processor and is responsible for persisting them. Frame timestamps arrive
+    as numeric milliseconds; sinks that write frames convert them with
+    format_timestamps() when they write.
+    """
+
+    # Metrics recording the time of each database write (see set_metrics)
+    metrics: Optional[Any] = None
+
+    @abstractmethod
+    def create_instance(self, doc: Dict[str, Any]) -> None:
+        """
+        Persist a new object instance document
+
+        Args:
+            doc: Instance document including its first frame
+        """
+        pass
+
+    @abstractmethod
+    def append_frame(self, instance_id: str, frame_data: Dict[str, Any], end_time: float) -> None:
+        """
+        Append a frame to an existing object instance
+
+        Args:
+            instance_id: ID of the instance document
+            frame_data: Frame entry to append to the instance's frames
+            end_time: New end time of the instance in seconds
+        """
+        pass
+
+    def set_frame_size(self, frame_width: int, frame_height: int) -> None:
+        """
+        Set the frame size of the video whose detections follow
+
+        Args:
+            frame_width: Width of the frames
+            frame_height: Height of the frames
+        """
+        pass
+
+    def set_metrics(self, metrics: Optional[Any]) -> None:
+        """
+        Set the metrics of the video whose detections follow
+
+        Sinks that write to MongoDB record the time of each write as the
+        'mongo_write' stage and the number of operations as 'mongo_operations'.
+
+        Args:
+            metrics: metrics.StageMetrics of the video, or None to stop recording
+        """
+        self.metrics = metrics
+
+    def _record_write(self, seconds: float, operations: int) -> None:
+        """Record one database write in the metrics, if any"""
+        if self.metrics is not None:
+            self.metrics.observe("mongo_write", seconds)
+            self.metrics.count("mongo_operations", operations)
+
+    def close_instance(self, instance_id: str) -> None:
+        """
+        Signal that an instance's track has expired
+
+        Args:
+            instance_id: ID of the instance document
+        """
+        pass
+
+    def flush(self) -> None:
+        """Write any buffered operations"""
+        pass
+
+    def close(self) -> None:
+        """Flush remaining operations at the end of a video"""
+        self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get sink statistics
+
+        Returns:
+            Dictionary of counters describing the writes performed so far
+        """
+        return {}
+
+
+class DirectDetectionSink(DetectionSink):
+    """
+    Sink that writes every instance creation and frame append immediately
+    """
+
+    def __init__(self, collection: Any, timestamp_format: str = "string", **kwargs: Any) -> None:
+        """
+        Initialize the direct sink
+
+        Args:
+            collection: MongoDB collection for object instances
+            timestamp_format: Stored frame timestamps: 'string' or 'ms'
+            **kwargs: Ignored; accepted so that all sinks share a constructor
+        """
+        self.collection = collection
+        self.timestamp_format = timestamp_format
+        self.write_count = 0
+
+    def create_instance(self, doc: Dict[str, Any]) -> None:
+        format_timestamps(doc.get("frames", []), self.timestamp_format)
+        start = time.perf_counter()
+        self.collection.insert_one(doc)
+        self._record_write(time.perf_counter() - start, 1)
+        self.write_count += 1
+
+    def append_frame(self, instance_id: str, frame_data: Dict[str, Any], end_time: float) -> None:
+        format_timestamps([frame_data], self.timestamp_format)
+        start = time.perf_counter()
+        self.collection.update_one(
+            {"_id": instance_id},
+            {"$push": {"frames": frame_data}, "$set": {"end_time": end_time}}
+        )
+        self._record_write(time.perf_counter() - start, 1)
+        self.write_count += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"writes": self.write_count}
+
+
+class BulkDetectionSink(DetectionSink):
+    """
+    Sink that buffers detections in memory and flushes them with bulk_write
+
+    Frames appended to an instance that has not been inserted yet are merged
+    into the pending insert, and frames appended to an existing instance are
+    grouped into a single ``$push``/``$each`` update per flush. Each flush is
+    one unordered ``bulk_write``.
+    """
+
+    def __init__(self, collection: Any, batch_size: int = 500,
+                 flush_interval: float = 1.0, timestamp_format: str = "string",
+                 **kwargs: Any) -> None:
+        """
+        Initialize the bulk sink
+
+        Args:
+            collection: MongoDB collection for object instances
+            batch_size: Number of buffered frames that triggers a flush
+            flush_interval: Maximum number of seconds between flushes
+            timestamp_format: Stored frame timestamps: 'string' or 'ms'
+            **kwargs: Ignored; accepted so that all sinks share a constructor
+        """
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timestamp_format = timestamp_format
+
+        # Buffered state: new documents and pending appends per instance
+        self._pending_inserts: Dict[str, Dict[str, Any]] = {}
+        self._pending_frames: Dict[str, List[Dict[str, Any]]] = {}
+        self._pending_end_times: Dict[str, float] = {}
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+
+        # Counters
+        self.flush_count = 0
+        self.total_ops = 0
+        self.total_frames = 0
+        self.max_ops_per_batch = 0
+        self.total_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.last_flush_seconds = 0.0
+
+    def create_instance(self, doc: Dict[str, Any]) -> None:
+        self._pending_inserts[doc["_id"]] = doc
+        self._buffered += len(doc.get("frames", [])) or 1
+        self._maybe_flush()
+
+    def append_frame(self, instance_id: str, frame_data: Dict[str, Any], end_time: float) -> None:
+        pending_doc = self._pending_inserts.get(instance_id)
+        if pending_doc is not None:
+            # Not written yet, so extend the document itself
+            pending_doc["frames"].append(frame_data)
+            pending_doc["end_time"] = end_time
+        else:
+            self._pending_frames.setdefault(instance_id, []).append(frame_data)
+            self._pending_end_times[instance_id] = end_time
+        self._buffered += 1
+        self._maybe_flush()
+
+    def close_instance(self, instance_id: str) -> None:
+        # Force a flush so that finished tracks are durable promptly
+        if instance_id in self._pending_inserts or instance_id in self._pending_frames:
+            self.flush()
+
+    def _maybe_flush(self) -> None:
+        """Flush if the batch is full or the flush interval has elapsed"""
+        if (self._buffered >= self.batch_size or
+                time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self) -> None:
+        """Write all buffered operations with a single unordered bulk_write"""
+        self._last_flush = time.monotonic()
+        if not self._pending_inserts and not self._pending_frames:
+            return
+
+        # pymongo is imported by the first write rather than with this module
+        from pymongo import InsertOne, UpdateOne
+        operations = []
+        for doc in self._pending_inserts.values():
+            format_timestamps(doc["frames"], self.timestamp_format)
+            operations.append(InsertOne(doc))
+        for instance_id, frames in self._pending_frames.items():
+            format_timestamps(frames, self.timestamp_format)
+            operations.append(UpdateOne(
+                {"_id": instance_id},
+                {"$push": {"frames": {"$each": frames}},
+                 "$set": {"end_time": self._pending_end_times[instance_id]}}
+            ))
+        frame_count = self._buffered
+
+        self._pending_inserts = {}
+        self._pending_frames = {}
+        self._pending_end_times = {}
+        self._buffered = 0
+
+        start = time.perf_counter()
+        self.collection.bulk_write(operations, ordered=False)
+        elapsed = time.perf_counter() - start
+        self._record_write(elapsed, len(operations))
+
+        self.flush_count += 1
+        self.total_ops += len(operations)
+        self.total_frames += frame_count
+        self.max_ops_per_batch = max(self.max_ops_per_batch, len(operations))
+        self.total_flush_seconds += elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        self.last_flush_seconds = elapsed
+        logger.debug(f"Flushed {len(operations)} operations ({frame_count} frames) in {elapsed * 1000:.1f} ms")
+
+    def get_stats(self) -> Dict[str, Any]:
+        flushes = self.flush_count or 1
+        return {
+            "flushes": self.flush_count,
+            "ops": self.total_ops,
+            "frames": self.total_frames,
+            "avg_ops_per_batch": self.total_ops / flushes,
+            "max_ops_per_batch": self.max_ops_per_batch,
+            "avg_flush_ms": self.total_flush_seconds / flushes * 1000,
+            "max_flush_ms": self.max_flush_seconds * 1000,
+            "last_flush_ms": self.last_flush_seconds * 1000,
+        }
+
+
+class MemoryDetectionSink(DetectionSink):
+    """
+    Sink that keeps instance documents in memory instead of writing them
+
+    Useful for benchmarks and for collecting results before they are merged.
+    Frame timestamps are kept as numeric milliseconds.
+    """
+
+    def __init__(self, collection: Any = None, **kwargs: Any) -> None:
+        """
+        Initialize the memory sink
+
+        Args:
+            collection: Ignored; accepted so that all sinks share a constructor
+            **kwargs: Ignored; accepted so that all sinks share a constructor
+        """
+        self.documents: Dict[str, Dict[str, Any]] = {}
+
+    def create_instance(self, doc: Dict[str, Any]) -> None:
+        self.documents[doc["_id"]] = doc
+
+    def append_frame(self, instance_id: str, frame_data: Dict[str, Any], end_time: float) -> None:
+        doc = self.documents[instance_id]
+        doc["frames"].append(frame_data)
+        doc["end_time"] = end_time
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "instances": len(self.documents),
+            "frames": sum(len(doc["frames"]) for doc in self.documents.values()),
+        }
+
+
+class ColumnarDetectionSink(DetectionSink):
+    """
+    Sink that stores frames as packed arrays in time-bucketed segment documents
+
+    The instance document in the objects collection keeps the metadata but no
+    ``frames``; it is marked with ``storage: "columnar"``. Frames are buffered
+    per instance until their time bucket is complete, then encoded into one
+    segment document (see columnar.py). Segments and instance updates are
+    written with unordered ``bulk_write`` calls, so a segment is never updated
+    after it is written and no document grows with the track.
+    """
+
+    def __init__(self, collection: Any, batch_size: int = 500, flush_interval: float = 1.0,
+                 bucket_seconds: float = 60.0, segments_collection: Optional[Any] = None,
+                 **kwargs: Any) -> None:
+        """
+        Initialize the columnar sink
+
+        Args:
+            collection: MongoDB collection for object instances
+            batch_size: Number of frames in encoded segments that triggers a flush
+            flush_interval: Maximum number of seconds between flushes
+            bucket_seconds: Duration of the time bucket of a segment
+            segments_collection: MongoDB collection for segments
+                (default: object_segments in the instances' database, with the
+                same write concern)
+            **kwargs: Ignored; accepted so that all sinks share a constructor
+        """
+        self.collection = collection
+        self.segments_collection = (segments_collection if segments_collection is not None
+                                    else collection.database.get_collection(
+                                        SEGMENTS_COLLECTION, write_concern=collection.write_concern))
+        ensure_segment_indexes(self.segments_collection)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.bucket_ms = bucket_seconds * 1000
+        self.frame_width = 0
+        self.frame_height = 0
+
+        # Open instances: metadata, current bucket and its frames
+        self._instances: Dict[str, Dict[str, Any]] = {}
+        self._pending_inserts: List[Dict[str, Any]] = []
+        self._pending_segments: List[Dict[str, Any]] = []
+        self._pending_updates: Dict[str, Dict[str, Any]] = {}
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+
+        # Counters
+        self.flush_count = 0
+        self.segment_count = 0
+        self.total_frames = 0
+        self.total_flush_seconds = 0.0
+
+    def set_frame_size(self, frame_width: int, frame_height: int) -> None:
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+
+    def create_instance(self, doc: Dict[str, Any]) -> None:
+        frames = doc.get("frames", [])
+        summary = {key: value for key, value in doc.items() if key != "frames"}
+        summary.update({
+            "storage": "columnar",
+            "frame_width": self.frame_width,
+            "frame_height": self.frame_height,
+            "segments": 0,
+            "frame_count": 0,
+        })
+        self._pending_inserts.append(summary)
+        self._instances[doc["_id"]] = {
+            "video_id": doc["video_id"],
+            "object_name": doc["object_name"],
+            "bucket": None,
+            "frames": [],
+        }
+        for frame_data in frames:
+            self._add_frame(doc["_id"], frame_data, doc["end_time"])
+        self._maybe_flush()
+
+    def append_frame(self, instance_id: str, frame_data: Dict[str, Any], end_time: float) -> None:
+        self._add_frame(instance_id, frame_data, end_time)
+        self._maybe_flush()
+
+    def _add_frame(self, instance_id: str, frame_data: Dict[str, Any], end_time: float) -> None:
+        """Buffer a frame, encoding the previous bucket when a new one starts"""
+        instance = self._instances[instance_id]
+        bucket = int(timestamp_to_ms(frame_data["timestamp"]) // self.bucket_ms)
+        if instance["bucket"] != bucket:
+            self._encode_bucket(instance_id)
+            instance["bucket"] = bucket
+        instance["frames"].append(frame_data)
+        update = self._pending_updates.setdefault(instance_id, {"segments": 0, "frame_count": 0})
+        update["end_time"] = end_time
+
+    def _encode_bucket(self, instance_id: str) -> None:
+        """Encode an instance's buffered frames into a pending segment"""
+        instance = self._instances[instance_id]
+        frames = instance["frames"]
+        if not frames:
+            return
+        self._pending_segments.append(encode_segment(
+            instance_id, instance["video_id"], instance["object_name"], instance["bucket"],
+            frames, self.frame_width, self.frame_height
+        ))
+        update = self._pending_updates.setdefault(instance_id, {"segments": 0, "frame_count": 0})
+        update["segments"] += 1
+        update["frame_count"] += len(frames)
+        self._buffered += len(frames)
+        instance["frames"] = []
+
+    def close_instance(self, instance_id: str) -> None:
+        if instance_id in self._instances:
+            self._encode_bucket(instance_id)
+            del self._instances[instance_id]
+            self.flush()
+
+    def _maybe_flush(self) -> None:
+        """Flush if the batch is full or the flush interval has elapsed"""
+        if (self._buffered >= self.batch_size or
+                time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self) -> None:
+        """Write encoded segments and instance updates"""
+        self._last_flush = time.monotonic()
+        if not self._pending_inserts and not self._pending_segments and not self._pending_updates:
+            return
+
+        from pymongo import InsertOne, ReplaceOne, UpdateOne
+        instance_ops = [InsertOne(doc) for doc in self._pending_inserts]
+        for instance_id, update in self._pending_updates.items():
+            operation = {"$set": {"end_time": update["end_time"]}} if "end_time" in update else {}
+            if update["segments"]:
+                operation["$inc"] = {"segments": update["segments"], "frame_count": update["frame_count"]}
+            if operation:
+                instance_ops.append(UpdateOne({"_id": instance_id}, operation))
+        # Replace rather than insert so that a reprocessed video overwrites its segments
+        segment_ops = [ReplaceOne({"_id": segment["_id"]}, segment, upsert=True)
+                       for segment in self._pending_segments]
+        frame_count = self._buffered
+
+        self._pending_inserts = []
+        self._pending_segments = []
+        self._pending_updates = {}
+        self._buffered = 0
+
+        start = time.perf_counter()
+        # Instances first, so that a reader never finds segments of an unknown instance
+        if instance_ops:
+            self.collection.bulk_write(instance_ops, ordered=True)
+        if segment_ops:
+            self.segments_collection.bulk_write(segment_ops, ordered=False)
+        elapsed = time.perf_counter() - start
+        self._record_write(elapsed, len(instance_ops) + len(segment_ops))
+
+        self.flush_count += 1
+        self.segment_count += len(segment_ops)
+        self.total_frames += frame_count
+        self.total_flush_seconds += elapsed
+        logger.debug(f"Flushed {len(segment_ops)} segments ({frame_count} frames) in {elapsed * 1000:.1f} ms")
+
+    def close(self) -> None:
+        """Encode the buckets of all open instances and flush"""
+        for instance_id in list(self._instances):
+            self._encode_bucket(instance_id)
+        self._instances = {}
+        self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        flushes = self.flush_count or 1
+        return {
+            "flushes": self.flush_count,
+            "segments": self.segment_count,
+            "frames": self.total_frames,
+            "avg_flush_ms": self.total_flush_seconds / flushes * 1000,
+        }
+
+
+# Dictionary of available sinks
+AVAILABLE_SINKS = {
+    "direct": DirectDetectionSink,
+    "bulk": BulkDetectionSink,
+    "memory": MemoryDetectionSink,
+    "columnar": ColumnarDetectionSink,
+}
+
+
+def get_sink(sink_name: str, collection: Any, **kwargs: Any) -> DetectionSink:
+    """
+    Factory function to get a detection sink by name
+
+    Args:
+        sink_name: Name of the sink ('direct', 'bulk', 'memory' or 'columnar')
+        collection: MongoDB collection for object instances
+        **kwargs: Additional arguments to pass to the sink constructor
+
+    Returns:
+        Detection sink instance
+
+    Raises:
+        ValueError: If sink_name is not recognized
+    """
+    if sink_name not in AVAILABLE_SINKS:
+        raise ValueError(f"Unknown sink: {sink_name}. Available sinks: {list(AVAILABLE_SINKS.keys())}")
+
+    return AVAILABLE_SINKS[sink_name](collection, **kwargs)
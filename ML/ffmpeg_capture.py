@@ -0,0 +1,348 @@
+"""
+Frame source that decodes with an ffmpeg subprocess
+
+FFmpegCapture implements the part of the cv2.VideoCapture interface that
+VideoProcessor uses. ffmpeg decodes with its own threads, scales the frames
+in the decoder's filter graph (the detector resizes them anyway) and can
+drop the frame rate, then pipes raw BGR frames to stdout. Frames are read
+with readinto into a ring of preallocated buffers, so reading allocates
+nothing per frame.
+
+Timestamps come from ffmpeg's showinfo filter with -copyts, so they are the
+presentation timestamps of the source video, relative to the stream start
+like CAP_PROP_POS_MSEC of cv2.VideoCapture, and stay exact after seeks and
+frame rate reduction. Reported width and height are those of the source, so
+boxes scaled back by the caller have source coordinates; output_size is the
+size of the frames actually returned.
+"""
+import io
+import json
+import os
+import queue
+import re
+import subprocess
+import threading
+from collections import deque
+from fractions import Fraction
+from functools import lru_cache
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from ML.utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+DECODE_BACKENDS = ["opencv", "ffmpeg"]
+
+# showinfo lines: "config in time_base: 1/30000, ..." once, then per frame "n:   3 pts:   3003 pts_time:0.1001 ..."
+_TIME_BASE_PATTERN = re.compile(rb"Parsed_showinfo.*config in time_base:\s*(\d+)/(\d+)")
+_FRAME_PATTERN = re.compile(rb"Parsed_showinfo.*\] n:\s*\d+ pts:\s*(-?\d+)")
+# Seconds to wait for the timestamp of a frame that has already arrived
+_TIMESTAMP_TIMEOUT = 10.0
+
+
+def probe_video(video_path: str) -> Optional[Dict[str, Any]]:
+    """
+    Read the size, frame rate, duration and frame count of a video's first video stream
+
+    Args:
+        video_path: Path to the video file
+
+    Returns:
+        Dictionary with width, height, fps, start_time, duration and frames,
+        or None if ffprobe failed
+    """
+    cmd = [
+        "ffprobe",
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "stream=width,height,r_frame_rate,start_time,duration,nb_frames:format=duration",
+        "-of", "json",
+        video_path
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+    except FileNotFoundError:
+        logger.warning("ffprobe not found; cannot decode with ffmpeg")
+        return None
+    if result.returncode != 0:
+        logger.warning(f"FFprobe error: {result.stderr}")
+        return None
+    info = json.loads(result.stdout)
+    if not info.get("streams"):
+        return None
+    stream = info["streams"][0]
+
+    def number(value: Any, default: float = 0.0) -> float:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return default
+
+    fps = float(Fraction(stream.get("r_frame_rate", "0/1"))) if stream.get("r_frame_rate", "0/0") != "0/0" else 0.0
+    duration = number(stream.get("duration")) or number(info.get("format", {}).get("duration"))
+    frames = int(number(stream.get("nb_frames"))) or int(round(duration * fps))
+    return {
+        "width": int(stream["width"]),
+        "height": int(stream["height"]),
+        "fps": fps,
+        "start_time": number(stream.get("start_time")),
+        "duration": duration,
+        "frames": frames,
+    }
+
+
+@lru_cache(maxsize=1)
+def passthrough_option() -> Tuple[str, str]:
+    """
+    Get the ffmpeg option that passes frames through without duplicating or dropping them
+
+    -vsync is deprecated since FFmpeg 5.1 in favor of -fps_mode, so -vsync is
+    only used when the installed ffmpeg does not list -fps_mode.
+
+    Returns:
+        Option and value, e.g. ("-fps_mode", "passthrough")
+    """
+    try:
+        result = subprocess.run(["ffmpeg", "-hide_banner", "-h", "long"], capture_output=True, text=True)
+    except FileNotFoundError:
+        return ("-fps_mode", "passthrough")
+    if "-fps_mode" in result.stdout:
+        return ("-fps_mode", "passthrough")
+    return ("-vsync", "passthrough")
+
+
+def scaled_size(width: int, height: int, target_width: int) -> Tuple[int, int]:
+    """
+    Get the decoded frame size for a target width, keeping the aspect ratio
+
+    Args:
+        width: Source width
+        height: Source height
+        target_width: Width to scale to (0 or >= width keeps the source size)
+
+    Returns:
+        Even width and height of the decoded frames
+    """
+    if target_width <= 0 or target_width >= width:
+        return width, height
+    # Most pixel formats need even dimensions
+    out_height = max(2, int(round(height * target_width / width / 2)) * 2)
+    return target_width - target_width % 2, out_height
+
+
+class FFmpegCapture:
+    """
+    cv2.VideoCapture replacement reading frames from an ffmpeg subprocess
+    """
+
+    def __init__(self, video_path: str, width: int = 0, fps: float = 0.0, threads: int = 0,
+                 num_buffers: int = 8) -> None:
+        """
+        Open a video
+
+        Args:
+            video_path: Path to the video file
+            width: Width to scale frames to in the decoder (0 = source width)
+            fps: Frame rate to reduce to (0 = source frame rate)
+            threads: Decoder threads (0 = chosen by ffmpeg)
+            num_buffers: Frames that can be in use at once; a returned frame is
+                overwritten num_buffers reads later
+        """
+        self.video_path = video_path
+        self.threads = threads
+        self.info = probe_video(video_path) if os.path.isfile(video_path) else None
+        self.process: Optional[subprocess.Popen] = None
+        if self.info is None:
+            return
+
+        self.output_size = scaled_size(self.info["width"], self.info["height"], width)
+        source_fps = self.info["fps"]
+        self.frame_rate_reduced = 0 < fps < source_fps
+        self.fps = fps if self.frame_rate_reduced else source_fps
+        self.frame_count = (int(self.info["duration"] * self.fps) if self.frame_rate_reduced
+                            else self.info["frames"])
+
+        out_width, out_height = self.output_size
+        self._frame_bytes = out_width * out_height * 3
+        self._buffers = [np.empty((out_height, out_width, 3), dtype=np.uint8) for _ in range(max(1, num_buffers))]
+        self._next_buffer = 0
+        self._timestamps: "queue.Queue[Optional[float]]" = queue.Queue()
+        self._stderr_tail: Deque[bytes] = deque(maxlen=20)
+        self._position_frames = 0
+        self._position_ms = 0.0
+        self._start()
+
+    def _start(self, seek_ms: float = 0.0) -> None:
+        """Start ffmpeg, decoding from seek_ms"""
+        self._stop()
+        filters = []
+        if self.output_size != (self.info["width"], self.info["height"]):
+            filters.append(f"scale={self.output_size[0]}:{self.output_size[1]}:flags=fast_bilinear")
+        if self.frame_rate_reduced:
+            filters.append(f"fps={self.fps}")
+        filters.append("showinfo")
+
+        cmd = ["ffmpeg", "-nostdin", "-hide_banner", "-nostats", "-loglevel", "info", "-threads", str(self.threads)]
+        if seek_ms > 0:
+            # Input seeking decodes from the preceding keyframe and drops frames up to the time
+            cmd += ["-ss", f"{seek_ms / 1000:.6f}"]
+        cmd += ["-copyts", "-i", self.video_path, "-map", "0:v:0", "-vf", ",".join(filters)]
+        if not self.frame_rate_reduced:
+            # One output frame per decoded frame, never duplicated or dropped
+            cmd += list(passthrough_option())
+        cmd += ["-pix_fmt", "bgr24", "-f", "rawvideo", "pipe:1"]
+
+        self._timestamps = queue.Queue()
+        self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0)
+        threading.Thread(target=self._read_timestamps, args=(self.process, self._timestamps),
+                         name="ffmpeg-showinfo", daemon=True).start()
+
+    def _read_timestamps(self, process: subprocess.Popen, timestamps: "queue.Queue[Optional[float]]") -> None:
+        """Parse frame timestamps from ffmpeg's log, in output order"""
+        time_base = Fraction(1, 1000)
+        start_ms = Fraction(self.info["start_time"]).limit_denominator(1000000) * 1000
+        # stderr is unbuffered (bufsize=0 is for stdout's readinto); iterating the raw
+        # pipe would read one byte per system call
+        for line in io.BufferedReader(process.stderr):
+            match = _FRAME_PATTERN.search(line)
+            if match:
+                # Integer pts in the filter's time base, so the timestamp is exact
+                timestamps.put(float(int(match.group(1)) * time_base * 1000 - start_ms))
+                continue
+            match = _TIME_BASE_PATTERN.search(line)
+            if match:
+                time_base = Fraction(int(match.group(1)), int(match.group(2)))
+            elif b"Parsed_showinfo" not in line:
+                self._stderr_tail.append(line)
+        timestamps.put(None)
+
+    def _stop(self) -> None:
+        """Terminate the running ffmpeg process"""
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        self.process.stdout.close()
+        self.process = None
+
+    def isOpened(self) -> bool:
+        return self.process is not None
+
+    def _read_into(self, buffer: np.ndarray) -> bool:
+        """Read the next frame into a buffer"""
+        if self.process is None:
+            return False
+        view = memoryview(buffer).cast("B")
+        filled = 0
+        while filled < self._frame_bytes:
+            count = self.process.stdout.readinto(view[filled:])
+            if not count:
+                break
+            filled += count
+        if filled < self._frame_bytes:
+            if self.process.poll() not in (None, 0):
+                logger.error(f"ffmpeg failed on {self.video_path}: {b''.join(self._stderr_tail).decode(errors='replace')}")
+            self._stop()
+            return False
+        try:
+            timestamp_ms = self._timestamps.get(timeout=_TIMESTAMP_TIMEOUT)
+        except queue.Empty:
+            timestamp_ms = None
+        if timestamp_ms is None:
+            # Fall back to the nominal time of the frame
+            timestamp_ms = self._position_frames * 1000 / self.fps
+        self._position_ms = timestamp_ms
+        self._position_frames += 1
+        return True
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        """
+        Read the next frame
+
+        Returns:
+            Success flag and the frame, which stays valid for num_buffers - 1 more reads
+        """
+        buffer = self._buffers[self._next_buffer]
+        if not self._read_into(buffer):
+            return False, None
+        self._next_buffer = (self._next_buffer + 1) % len(self._buffers)
+        return True, buffer
+
+    def grab(self) -> bool:
+        """Skip a frame (ffmpeg still decodes it)"""
+        return self._read_into(self._buffers[self._next_buffer])
+
+    def get(self, prop_id: int) -> float:
+        if self.info is None:
+            return 0.0
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.info["width"])
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.info["height"])
+        if prop_id == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        if prop_id == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self.frame_count)
+        if prop_id == cv2.CAP_PROP_POS_MSEC:
+            return float(self._position_ms)
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            return float(self._position_frames)
+        return 0.0
+
+    def set(self, prop_id: int, value: float) -> bool:
+        """
+        Seek by time (CAP_PROP_POS_MSEC) or frame number (CAP_PROP_POS_FRAMES)
+
+        ffmpeg seeks exactly, so the next read returns the first frame at or
+        after the requested time.
+        """
+        if self.info is None or not self.fps:
+            return False
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            frame_number = int(value)
+        elif prop_id == cv2.CAP_PROP_POS_MSEC:
+            frame_number = int(round(value / 1000 * self.fps))
+        else:
+            return False
+        self._start(frame_number * 1000 / self.fps)
+        self._position_frames = frame_number
+        return True
+
+    def release(self) -> None:
+        self._stop()
+
+
+def open_capture(video_path: str, backend: str = "opencv", width: int = 0, fps: float = 0.0,
+                 threads: int = 0, num_buffers: int = 8) -> Any:
+    """
+    Open a video with the configured decode backend
+
+    The ffmpeg backend probes the file first, so videos read from a pipe
+    always use OpenCV.
+
+    Args:
+        video_path: Path to the video file
+        backend: 'opencv' or 'ffmpeg'
+        width: Width to scale frames to with the ffmpeg backend (0 = source width)
+        fps: Frame rate to reduce to with the ffmpeg backend (0 = source frame rate)
+        threads: Decoder threads with the ffmpeg backend (0 = chosen by ffmpeg)
+        num_buffers: Frames that can be in use at once with the ffmpeg backend
+
+    Returns:
+        An FFmpegCapture or cv2.VideoCapture
+
+    Raises:
+        ValueError: If backend is not recognized
+    """
+    if backend not in DECODE_BACKENDS:
+        raise ValueError(f"Unknown decode backend: {backend}. Available backends: {DECODE_BACKENDS}")
+    if backend == "ffmpeg" and os.path.isfile(video_path):
+        cap = FFmpegCapture(video_path, width=width, fps=fps, threads=threads, num_buffers=num_buffers)
+        if cap.isOpened():
+            return cap
+        logger.warning(f"Could not decode {video_path} with ffmpeg; falling back to OpenCV")
+    return cv2.VideoCapture(video_path)
@@ -7,8 +7,10 @@ import threading
 import argparse
 import logging
 from typing import Optional
+from ML.metrics import MetricsExporter, StageMetrics
 from ML.video_processor import VideoProcessor
-from ML.utils.connections import videos_collection, download_from_s3
+from ML.utils.connections import get_collection
+from ML.utils.downloads import open_video_source
 from ML.utils.config import config
 from ML.utils.logging_config import setup_logging, get_logger
 
@@ -17,7 +19,8 @@ setup_logging(log_file=os.path.join(config.LOG_DIR, 'main.log'))
 logger = get_logger(__name__)
 
 def process_video_file(video_path: str, model_name: str = "yolo", 
-                      model_path: Optional[str] = None, device: str = "cpu") -> str:
+                      model_path: Optional[str] = None, device: str = "cpu",
+                      use_pipeline: bool = False, metrics: Optional[StageMetrics] = None) -> str:
     """
     Process a video file using the specified model
     
@@ -26,6 +29,8 @@ def process_video_file(video_path: str, model_name: str = "yolo",
         model_name: Name of the model to use
         model_path: Path to the model weights
         device: Device to run inference on ('cpu' or 'cuda')
+        use_pipeline: Run decode, inference, tracking and encoding as a threaded pipeline
+        metrics: Metrics receiving the stage timings of the video (default: new metrics)
         
     Returns:
         Path to the annotated video
@@ -34,13 +39,31 @@ def process_video_file(video_path: str, model_name: str = "yolo",
     processor = VideoProcessor(
         model_name=model_name,
         model_path=model_path,
-        device=device
+        device=device,
+        use_pipeline=use_pipeline
     )
-    return processor.process_video(video_path)
+    return processor.process_video(video_path, metrics=metrics)
+
+def warm_start(model_name: str = "yolo", model_path: Optional[str] = None, device: str = "cpu") -> None:
+    """
+    Load and warm up the model before the first video arrives
+    
+    The model stays in the process-wide model cache, so the processors
+    created per video reuse it.
+    
+    Args:
+        model_name: Name of the model to use
+        model_path: Path to the model weights
+        device: Device to run inference on ('cpu' or 'cuda')
+    """
+    start = time.perf_counter()
+    VideoProcessor(model_name=model_name, model_path=model_path, device=device)
+    logger.info(f"Model {model_name} ready in {time.perf_counter() - start:.2f}s")
 
 def find_and_update_task(model_name: str = "yolo", 
                          model_path: Optional[str] = None, 
-                         device: str = "cpu") -> None:
+                         device: str = "cpu",
+                         use_pipeline: bool = False) -> None:
     """
     Background task to find videos with 'uploaded' status and process them
     
@@ -48,8 +71,13 @@ def find_and_update_task(model_name: str = "yolo",
         model_name: Name of the model to use
         model_path: Path to the model weights
         device: Device to run inference on ('cpu' or 'cuda')
+        use_pipeline: Run decode, inference, tracking and encoding as a threaded pipeline
     """
     logger.info(f"Starting find_and_update_task with model: {model_name}")
+    warm_start(model_name, model_path, device)
+    videos_collection = get_collection("videos")
+    # Cumulative stage metrics, written to METRICS_TEXTFILE_DIR/main.prom after each video
+    exporter = MetricsExporter("main", config.METRICS_TEXTFILE_DIR, config.METRICS_ENABLED)
     while True:
         try:
             # Perform the find_one_and_update operation
@@ -68,43 +96,35 @@ def find_and_update_task(model_name: str = "yolo",
                 if s3_key:
                     # Define a local path to save the file
                     local_path = os.path.join("downloads", s3_key)
+                    metrics = StageMetrics(config.METRICS_ENABLED)
 
-                    # Ensure the downloads directory exists
-                    os.makedirs(os.path.dirname(local_path), exist_ok=True)
-
-                    # Download the file from S3
-                    vid_path = download_from_s3(s3_key, local_path)
-                    logger.info(f"Downloaded {s3_key} to {local_path}")
-                    
-                    # Pass the absolute path to the processing module
-                    if vid_path:
-                        try:
+                    try:
+                        # Download the file from S3, or decode it while it downloads (S3_STREAMING)
+                        with open_video_source(s3_key, local_path, metrics=metrics) as vid_path:
+                            # Pass the absolute path to the processing module
                             annotated_path = process_video_file(
                                 vid_path, 
                                 model_name=model_name,
                                 model_path=model_path,
-                                device=device
+                                device=device,
+                                use_pipeline=use_pipeline,
+                                metrics=metrics
                             )
-                            logger.info(f"Video processed and saved to {annotated_path}")
-                            
-                            # Update the status to 'processed'
-                            videos_collection.update_one(
-                                {"_id": result.get("_id")},
-                                {"$set": {"status": "analyzed", "annotated_path": annotated_path}}
-                            )
-                        except Exception as e:
-                            logger.error(f"Error processing video: {e}", exc_info=True)
-                            # Update the status to 'error'
-                            videos_collection.update_one(
-                                {"_id": result.get("_id")},
-                                {"$set": {"status": "error", "error_message": str(e)}}
-                            )
-                    else:
-                        logger.error(f"Skipping processing for {s3_key} due to download failure.")
+                        logger.info(f"Video processed and saved to {annotated_path}")
+                        
+                        # Update the status to 'processed'
+                        update = {"status": "analyzed", "annotated_path": annotated_path}
+                        if metrics.enabled:
+                            update["stage_metrics"] = metrics.summary()
+                        videos_collection.update_one({"_id": result.get("_id")}, {"$set": update})
+                        exporter.video_done(metrics)
+                    except Exception as e:
+                        exporter.video_done(metrics, succeeded=False)
+                        logger.error(f"Error processing video: {e}", exc_info=True)
                         # Update the status to 'error'
                         videos_collection.update_one(
                             {"_id": result.get("_id")},
-                            {"$set": {"status": "error", "error_message": "Download failed"}}
+                            {"$set": {"status": "error", "error_message": str(e)}}
                         )
                 else:
                     logger.error("No S3 key found in the document.")
@@ -147,6 +167,22 @@ def parse_args() -> argparse.Namespace:
         choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"], 
         help=f"Logging level (default: {config.LOG_LEVEL})"
     )
+    parser.add_argument(
+        "--pipeline", 
+        action="store_true", 
+        help="Run decode, inference, tracking and encoding as a threaded pipeline"
+    )
+    parser.add_argument(
+        "--workers", 
+        type=int, 
+        default=1, 
+        help="Number of worker processes consuming the uploaded-video queue (default: 1)"
+    )
+    parser.add_argument(
+        "--metadata-only", 
+        action="store_true", 
+        help="Only store detections: no annotation or encoding (ANNOTATED_OUTPUT=none)"
+    )
     
     return parser.parse_args()
 
@@ -162,10 +198,19 @@ if __name__ == "__main__":
     
     logger.info(f"Starting VidMetaStream ML Package with model: {args.model}")
     
+    if args.metadata_only:
+        # Set in the environment as well, so that spawned worker processes inherit it
+        os.environ["ANNOTATED_OUTPUT"] = "none"
+        config.ANNOTATED_OUTPUT = "none"
+    
     if args.video:
         # Process a single video file
-        process_video_file(args.video, args.model, args.model_path, args.device)
+        process_video_file(args.video, args.model, args.model_path, args.device, args.pipeline)
     else:
         # Automatically start processing uploaded videos
         logger.info("Starting automatic video processing...")
-        find_and_update_task(args.model, args.model_path, args.device)
\ No newline at end of file
+        if args.workers > 1:
+            from ML.worker_pool import WorkerPool
+            WorkerPool(args.workers, args.model, args.model_path, args.device, args.pipeline).run()
+        else:
+            find_and_update_task(args.model, args.model_path, args.device, args.pipeline)
\ No newline at end of file
@@ -0,0 +1,458 @@
+"""
+Per-stage timers, counters and profiling of the ingest pipeline
+
+StageMetrics records how long each stage of process_video takes (decode,
+inference, detection extraction, IoU matching, MongoDB writes, annotation,
+encoding and S3 transfers) in log-spaced histograms with 20 buckets per
+decade, so recording a duration is one log10 and one list increment, memory
+does not grow with the video, and histograms of shards and of successive
+videos can be added up. Percentiles are interpolated within their bucket.
+A bucket spans a factor of 10^(1/20), about 12%, which bounds the error of a
+percentile; on smooth distributions the interpolation brings it under 1%
+(benchmarks/stage_metrics.py measures at most 0.7%).
+
+summary() is written to the video document when a video completes;
+write_prometheus_textfile() exposes the cumulative histograms of a
+long-running worker in the Prometheus text format, for node_exporter's
+textfile collector. profile() wraps a video in cProfile or pyinstrument when
+PROFILER is set.
+"""
+import math
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from ML.utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+PROFILERS = ["cprofile", "pyinstrument"]
+
+# Bucket i holds durations in [10^((i - _OFFSET) / _PER_DECADE), 10^((i + 1 - _OFFSET) / _PER_DECADE)) seconds
+_PER_DECADE = 20
+_MIN_EXPONENT = -7  # 100 ns; shorter durations go to the first bucket
+_MAX_EXPONENT = 4   # 10000 s; longer durations go to the last bucket
+_OFFSET = -_MIN_EXPONENT * _PER_DECADE
+_NUM_BUCKETS = (_MAX_EXPONENT - _MIN_EXPONENT) * _PER_DECADE
+# Bucket bounds exported to Prometheus: 1 and 3.16 times each power of ten from 10 us to 1000 s
+_EXPORTED_BUCKETS = range(-5 * _PER_DECADE + _OFFSET, 3 * _PER_DECADE + _OFFSET + 1, _PER_DECADE // 2)
+
+
+def _bucket_index(seconds: float) -> int:
+    """Histogram bucket of a duration"""
+    if seconds <= 0:
+        return 0
+    return min(max(int(math.floor(math.log10(seconds) * _PER_DECADE)) + _OFFSET, 0), _NUM_BUCKETS - 1)
+
+
+def _bucket_bound(index: int) -> float:
+    """Lower bound of a histogram bucket in seconds"""
+    return 10 ** ((index - _OFFSET) / _PER_DECADE)
+
+
+class StageHistogram:
+    """
+    Log-bucketed histogram of the durations of one stage
+    """
+
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self) -> None:
+        self.counts: List[int] = [0] * _NUM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def observe(self, seconds: float, count: int = 1) -> None:
+        """
+        Record a duration
+
+        Args:
+            seconds: Duration
+            count: Number of identical durations (e.g. frames of a batch timed together)
+        """
+        self.counts[_bucket_index(seconds)] += count
+        self.count += count
+        self.total += seconds * count
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other: "StageHistogram") -> None:
+        """Add the durations of another histogram"""
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q: float) -> float:
+        """
+        Estimate a percentile
+
+        Args:
+            q: Percentile between 0 and 100
+
+        Returns:
+            Duration in seconds, interpolated geometrically within its bucket
+            and clamped to the observed minimum and maximum (0 without durations)
+        """
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                fraction = (rank - cumulative) / bucket_count
+                low, high = _bucket_bound(index), _bucket_bound(index + 1)
+                return min(max(low * (high / low) ** fraction, self.min), self.max)
+            cumulative += bucket_count
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        """
+        Describe the histogram
+
+        Returns:
+            Count, total seconds, and mean, p50, p95, p99 and max in milliseconds
+        """
+        return {
+            "count": self.count,
+            "total_seconds": self.total,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p95_ms": self.percentile(95) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+
+class _Timer:
+    """Context manager recording the time spent in its block"""
+
+    __slots__ = ("metrics", "stage", "count", "start")
+
+    def __init__(self, metrics: "StageMetrics", stage: str, count: int) -> None:
+        self.metrics = metrics
+        self.stage = stage
+        self.count = count
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.metrics.observe(self.stage, time.perf_counter() - self.start, self.count)
+
+
+class _NullTimer:
+    """Timer of disabled metrics"""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullTimer":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class StageMetrics:
+    """
+    Timers and counters of the stages of one video, or of all videos of a worker
+
+    Stages of the threaded pipeline record from different threads, so updates
+    take a lock. A disabled instance records nothing and costs one attribute
+    check per call.
+    """
+
+    def __init__(self, enabled: bool = True) -> None:
+        """
+        Initialize empty metrics
+
+        Args:
+            enabled: Record timings and counters (False makes every call a no-op)
+        """
+        self.enabled = enabled
+        self.stages: Dict[str, StageHistogram] = {}
+        self.counters: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Shard workers send their metrics back to the parent; locks cannot be pickled
+        state = dict(self.__dict__)
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float, count: int = 1) -> None:
+        """
+        Record time spent in a stage
+
+        Args:
+            stage: Stage name, e.g. 'decode' or 'inference'
+            seconds: Duration
+            count: Number of items the duration stands for each
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = StageHistogram()
+            histogram.observe(seconds, count)
+
+    def timer(self, stage: str, count: int = 1) -> Any:
+        """
+        Time a block of code
+
+        Args:
+            stage: Stage name
+            count: Number of items the block's duration stands for each
+
+        Returns:
+            Context manager recording the block's duration on exit
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, stage, count)
+
+    def count(self, name: str, value: float = 1) -> None:
+        """
+        Increase a counter
+
+        Args:
+            name: Counter name, e.g. 'detections'
+            value: Amount to add
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def merge(self, other: Optional["StageMetrics"]) -> None:
+        """
+        Add the timings and counters of other metrics, e.g. of a shard or of a finished video
+
+        Args:
+            other: Metrics to add (None is ignored)
+        """
+        if not self.enabled or other is None:
+            return
+        with self._lock:
+            for stage, histogram in other.stages.items():
+                self.stages.setdefault(stage, StageHistogram()).merge(histogram)
+            for name, value in other.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Describe the recorded stages and counters, for the video document
+
+        Returns:
+            Dictionary with 'stages' (count, total seconds, and mean, p50, p95,
+            p99 and max in milliseconds per stage) and 'counters'
+        """
+        with self._lock:
+            return {
+                "stages": {stage: histogram.summary() for stage, histogram in sorted(self.stages.items())},
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+
+def _metric_name(name: str) -> str:
+    """Prometheus metric name for a counter"""
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    """Format Prometheus labels"""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped))
+
+
+def render_prometheus(totals: StageMetrics, last_video: Optional[StageMetrics] = None, videos: int = 0,
+                      labels: Optional[Dict[str, str]] = None, prefix: str = "vidmetastream") -> str:
+    """
+    Format metrics in the Prometheus text exposition format
+
+    Args:
+        totals: Cumulative metrics of all videos, exported as histograms and counters
+        last_video: Metrics of the most recent video, whose p50/p95/p99 are exported as gauges
+        videos: Number of videos processed
+        labels: Labels added to every sample, e.g. the worker
+        prefix: Prefix of the metric names
+
+    Returns:
+        Exposition text
+    """
+    labels = labels or {}
+    lines = [
+        f"# HELP {prefix}_videos_processed_total Videos processed",
+        f"# TYPE {prefix}_videos_processed_total counter",
+        f"{prefix}_videos_processed_total{{{_labels(labels)}}} {videos}",
+        f"# HELP {prefix}_stage_seconds Time spent per pipeline stage",
+        f"# TYPE {prefix}_stage_seconds histogram",
+    ]
+    with totals._lock:
+        stages = sorted(totals.stages.items())
+        counters = sorted(totals.counters.items())
+    for stage, histogram in stages:
+        stage_labels = dict(labels, stage=stage)
+        cumulative = 0
+        previous = 0
+        for index in _EXPORTED_BUCKETS:
+            cumulative += sum(histogram.counts[previous:index])
+            previous = index
+            lines.append(f"{prefix}_stage_seconds_bucket{{{_labels(dict(stage_labels, le=f'{_bucket_bound(index):.6g}'))}}} "
+                         f"{cumulative}")
+        lines.append(f"{prefix}_stage_seconds_bucket{{{_labels(dict(stage_labels, le='+Inf'))}}} {histogram.count}")
+        lines.append(f"{prefix}_stage_seconds_sum{{{_labels(stage_labels)}}} {histogram.total:.6f}")
+        lines.append(f"{prefix}_stage_seconds_count{{{_labels(stage_labels)}}} {histogram.count}")
+    for name, value in counters:
+        metric = f"{prefix}_{_metric_name(name)}_total"
+        lines += [f"# TYPE {metric} counter", f"{metric}{{{_labels(labels)}}} {value:g}"]
+    if last_video is not None and last_video.stages:
+        lines += [
+            f"# HELP {prefix}_last_video_stage_seconds Percentiles of the stage times of the most recent video",
+            f"# TYPE {prefix}_last_video_stage_seconds gauge",
+        ]
+        for stage, histogram in sorted(last_video.stages.items()):
+            for quantile in (50, 95, 99):
+                sample_labels = dict(labels, stage=stage, quantile=f"0.{quantile}")
+                lines.append(f"{prefix}_last_video_stage_seconds{{{_labels(sample_labels)}}} "
+                             f"{histogram.percentile(quantile):.6g}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus_textfile(path: str, totals: StageMetrics, last_video: Optional[StageMetrics] = None,
+                              videos: int = 0, labels: Optional[Dict[str, str]] = None) -> None:
+    """
+    Write metrics to a Prometheus text file atomically
+
+    The file is written next to its destination and renamed, so the
+    textfile collector never reads a partial file.
+
+    Args:
+        path: Path of the '.prom' file
+        totals: Cumulative metrics of all videos
+        last_video: Metrics of the most recent video
+        videos: Number of videos processed
+        labels: Labels added to every sample
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        f.write(render_prometheus(totals, last_video, videos, labels))
+    os.replace(temp_path, path)
+
+
+class MetricsExporter:
+    """
+    Cumulative metrics of a long-running worker, exported after every video
+
+    Each worker process writes its own file, so workers of a pool never
+    write the same file.
+    """
+
+    def __init__(self, name: str, textfile_dir: str = "", enabled: bool = True,
+                 labels: Optional[Dict[str, str]] = None) -> None:
+        """
+        Initialize the exporter
+
+        Args:
+            name: Name of the worker; the file is '<textfile_dir>/<name>.prom'
+            textfile_dir: Directory of the Prometheus text files ('' = do not export)
+            enabled: Whether metrics are recorded at all
+            labels: Labels added to every sample (default: worker=name)
+        """
+        self.path = os.path.join(textfile_dir, f"{name}.prom") if textfile_dir and enabled else None
+        self.labels = labels if labels is not None else {"worker": name}
+        self.totals = StageMetrics(enabled)
+        self.videos = 0
+
+    def video_done(self, metrics: StageMetrics, succeeded: bool = True) -> None:
+        """
+        Add the metrics of a finished video and rewrite the text file
+
+        Args:
+            metrics: Metrics of the video
+            succeeded: Whether the video was processed; failures are counted as 'videos_failed'
+        """
+        self.totals.merge(metrics)
+        if succeeded:
+            self.videos += 1
+        else:
+            self.totals.count("videos_failed")
+        if self.path is None:
+            return
+        try:
+            write_prometheus_textfile(self.path, self.totals, metrics, self.videos, self.labels)
+        except OSError as e:
+            logger.error(f"Could not write metrics to {self.path}: {e}")
+
+
+@contextmanager
+def profile(name: str, profiler: str = "", output_dir: str = "profiles") -> Iterator[None]:
+    """
+    Profile a block with cProfile or pyinstrument
+
+    Only the calling thread is profiled, so run without the threaded pipeline
+    for a complete profile. pyinstrument is optional; if it is not installed,
+    the block runs without profiling.
+
+    Args:
+        name: Name of the profile file, e.g. the video name
+        profiler: 'cprofile' (writes <name>.prof for pstats or snakeviz),
+            'pyinstrument' (writes <name>.html) or '' to not profile
+        output_dir: Directory of the profile files
+
+    Raises:
+        ValueError: If profiler is not recognized
+    """
+    if not profiler:
+        yield
+        return
+    if profiler not in PROFILERS:
+        raise ValueError(f"Unknown profiler: {profiler}. Available profilers: {PROFILERS}")
+    base = os.path.join(output_dir, re.sub(r"[^\w.-]", "_", name))
+    os.makedirs(output_dir, exist_ok=True)
+
+    if profiler == "cprofile":
+        import cProfile
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            yield
+        finally:
+            prof.disable()
+            prof.dump_stats(f"{base}.prof")
+            logger.info(f"Wrote cProfile profile to {base}.prof")
+        return
+
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        logger.warning("pyinstrument is not installed; running without profiling")
+        yield
+        return
+    prof = Profiler()
+    prof.start()
+    try:
+        yield
+    finally:
+        prof.stop()
+        with open(f"{base}.html", "w") as f:
+            f.write(prof.output_html())
+        logger.info(f"Wrote pyinstrument profile to {base}.html")
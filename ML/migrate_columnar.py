@@ -0,0 +1,153 @@
+"""
+Convert existing object documents to columnar storage
+
+Each document in the objects collection that still stores its frames inline
+is split into time-bucketed segments (see columnar.py). The segments are
+written before ``frames`` is removed from the object document, so an
+interrupted run can simply be repeated.
+
+Usage:
+    python -m ML.migrate_columnar [--video-id VIDEO] [--bucket-seconds 60] [--dry-run]
+"""
+import argparse
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import bson
+import numpy as np
+from pymongo import ReplaceOne
+
+from ML.columnar import (SEGMENTS_COLLECTION, decode_segments, encode_segment, ensure_segment_indexes,
+                         split_into_buckets)
+from ML.utils.config import config
+from ML.utils.logging_config import get_logger, setup_logging
+
+logger = get_logger(__name__)
+
+
+def infer_frame_size(frames: List[Dict[str, Any]]) -> Tuple[int, int]:
+    """
+    Recover the frame size from the stored boxes and relative positions
+
+    Relative positions are box centers divided by the frame size, so the size
+    is the center divided by the relative position.
+
+    Args:
+        frames: Frame entries with box and relative_position
+
+    Returns:
+        Width and height of the frames, 0 where they cannot be recovered
+    """
+    boxes = np.array([f["box"] for f in frames], dtype=np.float64).reshape(-1, 4)
+    relative = np.array([f["relative_position"] for f in frames], dtype=np.float64).reshape(-1, 2)
+    centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+    size = []
+    for axis in range(2):
+        valid = relative[:, axis] > 1e-3
+        size.append(int(round(np.median(centers[valid, axis] / relative[valid, axis]))) if valid.any() else 0)
+    return size[0], size[1]
+
+
+def convert_object(doc: Dict[str, Any], bucket_seconds: float) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    Convert an object document with inline frames to columnar storage
+
+    Args:
+        doc: Object document with frames
+        bucket_seconds: Duration of the time bucket of a segment
+
+    Returns:
+        The fields to set on the object document, and its segment documents
+    """
+    frames = doc.get("frames", [])
+    frame_width, frame_height = infer_frame_size(frames) if frames else (0, 0)
+    segments = [
+        encode_segment(doc["_id"], doc["video_id"], doc["object_name"], bucket, bucket_frames,
+                       frame_width, frame_height)
+        for bucket, bucket_frames in split_into_buckets(frames, bucket_seconds * 1000)
+    ]
+    fields = {
+        "storage": "columnar",
+        "frame_width": frame_width,
+        "frame_height": frame_height,
+        "segments": len(segments),
+        "frame_count": len(frames),
+    }
+    return fields, segments
+
+
+def migrate(objects_collection: Any, segments_collection: Any, bucket_seconds: float,
+            video_id: Optional[str] = None, dry_run: bool = False) -> Dict[str, int]:
+    """
+    Convert all object documents with inline frames
+
+    Args:
+        objects_collection: MongoDB objects collection
+        segments_collection: MongoDB object_segments collection
+        bucket_seconds: Duration of the time bucket of a segment
+        video_id: Only convert the objects of this video
+        dry_run: Only compute the sizes, without writing
+
+    Returns:
+        Counts of converted objects, written segments, and BSON bytes before and after
+    """
+    query: Dict[str, Any] = {"storage": {"$ne": "columnar"}, "frames": {"$exists": True}}
+    if video_id:
+        query["video_id"] = video_id
+    if not dry_run:
+        ensure_segment_indexes(segments_collection)
+
+    stats = {"objects": 0, "segments": 0, "bytes_before": 0, "bytes_after": 0}
+    for doc in objects_collection.find(query):
+        fields, segments = convert_object(doc, bucket_seconds)
+        summary = {key: value for key, value in doc.items() if key != "frames"}
+        summary.update(fields)
+
+        # Relative positions are derived on read; report documents where they would change
+        if doc["frames"]:
+            derived = decode_segments(segments)["relative_position"]
+            stored = np.array([f["relative_position"] for f in doc["frames"]], dtype=np.float64)
+            error = float(np.abs(derived - stored).max())
+            if error > 1e-3:
+                logger.warning(f"Derived relative positions of {doc['_id']} differ by up to {error:.4f}")
+
+        stats["objects"] += 1
+        stats["segments"] += len(segments)
+        stats["bytes_before"] += len(bson.encode(doc))
+        stats["bytes_after"] += len(bson.encode(summary)) + sum(len(bson.encode(s)) for s in segments)
+        if dry_run:
+            continue
+
+        if segments:
+            segments_collection.bulk_write(
+                [ReplaceOne({"_id": s["_id"]}, s, upsert=True) for s in segments], ordered=False
+            )
+        objects_collection.update_one({"_id": doc["_id"]}, {"$set": fields, "$unset": {"frames": ""}})
+        if stats["objects"] % 1000 == 0:
+            logger.info(f"Converted {stats['objects']} objects")
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Convert object documents to columnar storage")
+    parser.add_argument("--video-id", type=str, default=None, help="Only convert the objects of this video")
+    parser.add_argument("--bucket-seconds", type=float, default=config.COLUMNAR_BUCKET_SECONDS,
+                        help="Duration of the time bucket of a segment")
+    parser.add_argument("--dry-run", action="store_true", help="Report the size reduction without writing")
+    args = parser.parse_args()
+
+    setup_logging(log_file=os.path.join(config.LOG_DIR, 'migrate_columnar.log'))
+    from ML.utils.connections import objects_collection
+    segments_collection = objects_collection.database[SEGMENTS_COLLECTION]
+    stats = migrate(objects_collection, segments_collection, args.bucket_seconds, args.video_id, args.dry_run)
+
+    reduction = 1 - stats["bytes_after"] / stats["bytes_before"] if stats["bytes_before"] else 0.0
+    logger.info(
+        f"{'Would convert' if args.dry_run else 'Converted'} {stats['objects']} objects into "
+        f"{stats['segments']} segments: {stats['bytes_before']} -> {stats['bytes_after']} bytes "
+        f"({reduction:.0%} smaller)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -4,16 +4,44 @@ Models package for VidMetaStream
 This package contains different object detection and video processing models.
 """
 
-from ML.models.yolo_detector import YOLODetector
+from importlib import import_module
 
-# Dictionary of available models
+from ML.models.detections import Detections
+from ML.models.registry import cached_models, clear_model_cache, inference_lock, load_model
+
+# Dictionary of available models: name -> "module:class", imported on first use so
+# that importing ML.models does not import the model frameworks
 AVAILABLE_MODELS = {
-    "yolo": YOLODetector,
+    "yolo": "ML.models.yolo_detector:YOLODetector",
     # Add more models here as they are implemented
-    # "faster_rcnn": FasterRCNNDetector,
-    # "ssd": SSDDetector,
+    # "faster_rcnn": "ML.models.faster_rcnn_detector:FasterRCNNDetector",
+    # "ssd": "ML.models.ssd_detector:SSDDetector",
 }
 
+def get_model_class(model_name):
+    """
+    Import the detector class of a model
+    
+    Args:
+        model_name (str): Name of the model
+        
+    Returns:
+        Detector class
+        
+    Raises:
+        ValueError: If model_name is not recognized
+    """
+    if model_name not in AVAILABLE_MODELS:
+        raise ValueError(f"Unknown model: {model_name}. Available models: {list(AVAILABLE_MODELS.keys())}")
+    module_name, class_name = AVAILABLE_MODELS[model_name].split(":")
+    return getattr(import_module(module_name), class_name)
+
+def __getattr__(name):
+    """Import YOLODetector only when it is used"""
+    if name == "YOLODetector":
+        return get_model_class("yolo")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 def get_model(model_name, **kwargs):
     """
     Factory function to get a model instance by name
@@ -28,7 +56,4 @@ def get_model(model_name, **kwargs):
     Raises:
         ValueError: If model_name is not recognized
     """
-    if model_name not in AVAILABLE_MODELS:
-        raise ValueError(f"Unknown model: {model_name}. Available models: {list(AVAILABLE_MODELS.keys())}")
-    
-    return AVAILABLE_MODELS[model_name](**kwargs) 
\ No newline at end of file
+    return get_model_class(model_name)(**kwargs) 
\ No newline at end of file
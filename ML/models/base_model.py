@@ -37,6 +37,22 @@ class BaseDetector(ABC):
         """
         pass
     
+    def predict_batch(self, frames: List[Any], **kwargs: Any) -> List[Any]:
+        """
+        Run object detection on a batch of frames
+        
+        Detectors that support batched inference should override this;
+        the default runs predict() on each frame in turn.
+        
+        Args:
+            frames: Input frames (numpy arrays)
+            **kwargs: Additional prediction parameters
+            
+        Returns:
+            List of detection results, one per frame, in the same format as predict()
+        """
+        return [self.predict(frame, **kwargs) for frame in frames]
+    
     @abstractmethod
     def get_label(self, class_id: int) -> str:
         """
@@ -0,0 +1,139 @@
+"""
+Array-backed detections shared by all detector backends
+"""
+from typing import Any, Sequence
+
+import numpy as np
+
+
+class Detections:
+    """
+    Detections of one frame as parallel arrays
+
+    Attributes:
+        xyxy: Boxes [x1, y1, x2, y2], float32 array of shape (N, 4)
+        confidence: Confidence scores, float32 array of shape (N,)
+        class_id: Class IDs, int64 array of shape (N,)
+        labels: Class names, object array of shape (N,)
+    """
+
+    __slots__ = ("xyxy", "confidence", "class_id", "labels")
+
+    def __init__(self, xyxy: np.ndarray, confidence: np.ndarray, class_id: np.ndarray,
+                 labels: np.ndarray) -> None:
+        self.xyxy = xyxy
+        self.confidence = confidence
+        self.class_id = class_id
+        self.labels = labels
+
+    def __len__(self) -> int:
+        return len(self.confidence)
+
+    def __getitem__(self, index: Any) -> "Detections":
+        """Select detections with a boolean mask, an index array or a slice"""
+        return Detections(self.xyxy[index], self.confidence[index], self.class_id[index], self.labels[index])
+
+    def scaled(self, factors: np.ndarray) -> "Detections":
+        """
+        Scale the boxes, e.g. from decoded frame to source video coordinates
+
+        Args:
+            factors: Factors for [x1, y1, x2, y2]
+
+        Returns:
+            Detections with scaled boxes
+        """
+        return Detections(self.xyxy * factors, self.confidence, self.class_id, self.labels)
+
+    def filter(self, confidence_threshold: float) -> "Detections":
+        """
+        Keep the detections at or above a confidence threshold
+
+        Args:
+            confidence_threshold: Minimum confidence
+
+        Returns:
+            These detections if all pass, otherwise the passing subset
+        """
+        keep = self.confidence >= confidence_threshold
+        return self if keep.all() else self[keep]
+
+    @classmethod
+    def empty(cls) -> "Detections":
+        """Get detections of a frame without objects"""
+        return cls(np.empty((0, 4), dtype=np.float32), np.empty(0, dtype=np.float32),
+                   np.empty(0, dtype=np.int64), np.empty(0, dtype=object))
+
+    @classmethod
+    def from_ultralytics(cls, results: Sequence[Any], class_names: np.ndarray,
+                         confidence_threshold: float = 0.0) -> "Detections":
+        """
+        Build detections from Ultralytics results in one transfer per result
+
+        Args:
+            results: Ultralytics Results of one frame
+            class_names: Class names indexed by class ID (see class_name_array)
+            confidence_threshold: Minimum confidence
+
+        Returns:
+            Detections of the frame
+        """
+        # Boxes.data is (N, 6) [x1, y1, x2, y2, conf, cls], or (N, 7) with a track ID before conf
+        arrays = [result.boxes.data.cpu().numpy() for result in results
+                  if result.boxes is not None and len(result.boxes)]
+        if not arrays:
+            return cls.empty()
+        data = arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+        data = data[data[:, -2] >= confidence_threshold]
+        class_id = data[:, -1].astype(np.int64)
+        return cls(data[:, :4], data[:, -2], class_id, class_names[class_id])
+
+    @classmethod
+    def from_supervision(cls, detections: Any, confidence_threshold: float = 0.0) -> "Detections":
+        """
+        Build detections from supervision Detections (YOLO-World)
+
+        Args:
+            detections: supervision.Detections of one frame
+            confidence_threshold: Minimum confidence
+
+        Returns:
+            Detections of the frame
+        """
+        if len(detections) == 0:
+            return cls.empty()
+        count = len(detections)
+        confidence = (np.asarray(detections.confidence, dtype=np.float32) if detections.confidence is not None
+                      else np.ones(count, dtype=np.float32))
+        class_id = (np.asarray(detections.class_id, dtype=np.int64) if detections.class_id is not None
+                    else np.full(count, -1, dtype=np.int64))
+        if "class_name" in detections.data:
+            labels = np.asarray(detections.data["class_name"], dtype=object)
+        else:
+            labels = np.full(count, "unknown", dtype=object)
+        keep = confidence >= confidence_threshold
+        return cls(np.asarray(detections.xyxy, dtype=np.float32)[keep], confidence[keep], class_id[keep], labels[keep])
+
+    def to_supervision(self) -> Any:
+        """Convert to supervision Detections, for the supervision annotators"""
+        import supervision as sv
+        return sv.Detections(xyxy=self.xyxy, confidence=self.confidence, class_id=self.class_id,
+                             data={"class_name": self.labels})
+
+
+def class_name_array(names: Any) -> np.ndarray:
+    """
+    Build the class-name lookup array of a model
+
+    Args:
+        names: Mapping of class ID to name (Ultralytics model.names) or a list of names
+
+    Returns:
+        Object array indexed by class ID; IDs missing from a mapping are "unknown"
+    """
+    if isinstance(names, dict):
+        lookup = np.full(max(names, default=-1) + 1, "unknown", dtype=object)
+        for class_id, name in names.items():
+            lookup[int(class_id)] = name
+        return lookup
+    return np.asarray(list(names), dtype=object)
@@ -0,0 +1,167 @@
+"""
+Process-wide cache of loaded detection models
+
+Loading weights (and for YOLO-World, encoding the class prompts) takes
+seconds, so models are loaded once per process and shared by every
+VideoProcessor that asks for the same model. The first inference call of a
+model also pays for one-time setup such as layer fusion, so models are warmed
+up with a blank frame when they are loaded.
+"""
+import threading
+import time
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ML.utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# (model_name, model_path, device, classes, kwargs) -> loaded model
+_models: Dict[Tuple[Hashable, ...], Any] = {}
+# id(model) -> lock serializing inference calls on a shared model
+_inference_locks: Dict[int, threading.Lock] = {}
+# Seconds spent loading and warming up each cached model
+_load_times: Dict[Tuple[Hashable, ...], Dict[str, float]] = {}
+_registry_lock = threading.Lock()
+_key_locks: Dict[Tuple[Hashable, ...], threading.Lock] = {}
+
+
+def _cache_key(model_name: str, model_path: Optional[str], device: str,
+               classes: Optional[Sequence[str]], kwargs: Dict[str, Any]) -> Tuple[Hashable, ...]:
+    """Key identifying a loaded model"""
+    return (model_name, model_path, device, tuple(classes) if classes is not None else None,
+            tuple(sorted(kwargs.items())))
+
+
+def _load_yolo_world(classes: Optional[Sequence[str]]) -> Any:
+    """Load YOLO-World from the inference package and set its classes"""
+    from inference.models.yolo_world.yolo_world import YOLOWorld
+
+    model = YOLOWorld(model_id="yolo_world/l")
+    if classes:
+        model.set_classes(list(classes))
+        logger.info(f"Loaded {len(classes)} custom classes for YOLO-World model")
+    return model
+
+
+def warm_up(model: Any, size: int = 640) -> None:
+    """
+    Run one inference on a blank frame so that one-time setup is not paid by the first video
+
+    Args:
+        model: Detector from get_model, or a YOLO-World model
+        size: Width and height of the blank frame
+    """
+    frame = np.zeros((size, size, 3), dtype=np.uint8)
+    if hasattr(model, "predict_batch"):
+        model.predict_batch([frame], verbose=False)
+    else:
+        model.infer(frame)
+
+
+def _load(key: Tuple[Hashable, ...], warmup: bool) -> Tuple[Any, Dict[str, float]]:
+    """Load and optionally warm up the model identified by a cache key, timing both"""
+    from ML.models import get_model
+
+    model_name, model_path, device, classes, kwargs = key
+    start = time.perf_counter()
+    if model_name == "yolo_world":
+        model = _load_yolo_world(classes)
+    else:
+        model = get_model(model_name, model_path=model_path, device=device, **dict(kwargs))
+    loaded = time.perf_counter()
+    if warmup:
+        warm_up(model)
+    times = {"load_seconds": loaded - start, "warmup_seconds": time.perf_counter() - loaded}
+    logger.info(f"Loaded model {model_name} ({model_path or 'default weights'}) on {device} in "
+                f"{times['load_seconds']:.2f}s, warm-up {times['warmup_seconds']:.2f}s")
+    return model, times
+
+
+def load_model(model_name: str, model_path: Optional[str] = None, device: str = "cpu",
+               classes: Optional[Sequence[str]] = None, warmup: bool = True, cache: bool = True,
+               **kwargs: Any) -> Any:
+    """
+    Get a loaded model, loading and warming it up on first use
+
+    Models are cached by name, weights path, device, class list and the
+    remaining constructor arguments, so that all processors in a process that
+    use the same model share one instance. Use inference_lock() around
+    inference calls if processors run in different threads.
+
+    Args:
+        model_name: 'yolo_world' or a name known to get_model
+        model_path: Path to the model weights (ignored by YOLO-World)
+        device: Device to run inference on ('cpu' or 'cuda')
+        classes: Class prompts (YOLO-World only)
+        warmup: Run one inference on a blank frame after loading
+        cache: Reuse and store the model in the process-wide cache; if False,
+            a new instance is always loaded
+        **kwargs: Additional arguments to pass to the model constructor
+
+    Returns:
+        Loaded model
+
+    Raises:
+        ValueError: If model_name is not recognized
+    """
+    key = _cache_key(model_name, model_path, device, classes, kwargs)
+    if not cache:
+        return _load(key, warmup)[0]
+    with _registry_lock:
+        model = _models.get(key)
+        if model is not None:
+            return model
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+
+    # Other models can be loaded while this one loads; callers of the same model wait for it
+    with key_lock:
+        model = _models.get(key)
+        if model is not None:
+            return model
+        model, times = _load(key, warmup)
+        with _registry_lock:
+            _models[key] = model
+            _inference_locks[id(model)] = threading.Lock()
+            _load_times[key] = times
+        return model
+
+
+def inference_lock(model: Any) -> threading.Lock:
+    """
+    Get the lock that serializes inference calls on a cached model
+
+    Args:
+        model: Model returned by load_model
+
+    Returns:
+        Lock shared by all users of the model
+    """
+    with _registry_lock:
+        return _inference_locks.setdefault(id(model), threading.Lock())
+
+
+def cached_models() -> List[Dict[str, Any]]:
+    """
+    Describe the models loaded in this process
+
+    Returns:
+        One dictionary per model with its name, path, device, number of
+        classes and load and warm-up times in seconds
+    """
+    with _registry_lock:
+        return [
+            {"model_name": key[0], "model_path": key[1], "device": key[2],
+             "classes": len(key[3]) if key[3] is not None else None, **_load_times[key]}
+            for key in _models
+        ]
+
+
+def clear_model_cache() -> None:
+    """Drop all cached models, e.g. to free GPU memory"""
+    with _registry_lock:
+        _models.clear()
+        _inference_locks.clear()
+        _load_times.clear()
+        _key_locks.clear()
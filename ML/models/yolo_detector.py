@@ -1,11 +1,15 @@
 """
 YOLO detector implementation
 """
-import cv2
 import numpy as np
 from typing import Any, Dict, List, Optional, Union, Tuple
 from ultralytics import YOLO
 from ML.models.base_model import BaseDetector
+from ML.models.detections import Detections, class_name_array
+from ML.annotated_output import draw_detections
+from ML.utils.logging_config import get_logger
+
+logger = get_logger(__name__)
 
 class YOLODetector(BaseDetector):
     """
@@ -20,17 +24,25 @@ class YOLODetector(BaseDetector):
             model_path: Path to the YOLO model weights
             device: Device to run inference on ('cpu' or 'cuda')
             **kwargs: Additional model-specific parameters
+                (confidence_threshold, num_threads: CPU threads for inference, default 1)
         """
         import os
-        # Prevent multiprocessing issues that cause semaphore leaks
-        os.environ['OMP_NUM_THREADS'] = '1'
-        os.environ['MKL_NUM_THREADS'] = '1'
+        import torch
+        # Prevent multiprocessing issues that cause semaphore leaks; worker pools
+        # raise this to give each worker its share of the cores
+        num_threads = max(1, int(kwargs.get('num_threads', 1)))
+        os.environ['OMP_NUM_THREADS'] = str(num_threads)
+        os.environ['MKL_NUM_THREADS'] = str(num_threads)
+        torch.set_num_threads(num_threads)
         
         self.model_path = model_path
         self.device = device
         self.model = YOLO(model_path)
         self.confidence_threshold = kwargs.get('confidence_threshold', 0.25)
-        print(f"Loaded YOLO model with classes: {self.model.names}")
+        # Class names indexed by class ID, so that labels are looked up for all boxes at once
+        self.class_names = class_name_array(self.model.names)
+        logger.info(f"Loaded YOLO model {model_path} with {len(self.class_names)} classes")
+        logger.debug(f"YOLO model classes: {self.model.names}")
     
     def predict(self, frame: np.ndarray, verbose: bool = False, **kwargs: Any) -> Any:
         """
@@ -53,6 +65,29 @@ class YOLODetector(BaseDetector):
         )
         return results
     
+    def predict_batch(self, frames: List[np.ndarray], verbose: bool = False, **kwargs: Any) -> List[Any]:
+        """
+        Run object detection on a batch of frames in a single inference call
+        
+        Args:
+            frames: Input frames (numpy arrays)
+            verbose: Whether to print verbose output
+            **kwargs: Additional prediction parameters
+            
+        Returns:
+            List of detection results, one per frame, in the same format as predict()
+        """
+        if not frames:
+            return []
+        results = self.model.predict(
+            list(frames),
+            device=self.device,
+            verbose=verbose,
+            conf=self.confidence_threshold,
+            **kwargs
+        )
+        return [[result] for result in results]
+    
     def get_label(self, class_id: int) -> str:
         """
         Get the label for a class ID
@@ -63,62 +98,39 @@ class YOLODetector(BaseDetector):
         Returns:
             Label for the class
         """
-        return self.model.names[int(class_id)]
+        return self.class_names[int(class_id)]
+    
+    def to_detections(self, results: Any, confidence_threshold: Optional[float] = None) -> Detections:
+        """
+        Convert the results of one frame to array-backed detections
+        
+        Args:
+            results: Detection results from predict()
+            confidence_threshold: Minimum confidence (default: the detector's threshold)
+            
+        Returns:
+            Detections of the frame
+        """
+        if confidence_threshold is None:
+            confidence_threshold = self.confidence_threshold
+        return Detections.from_ultralytics(results, self.class_names, confidence_threshold)
     
-    def annotate_frame(self, frame: np.ndarray, results: Any, **kwargs: Any) -> np.ndarray:
+    def annotate_frame(self, frame: np.ndarray, results: Any, in_place: bool = False, **kwargs: Any) -> np.ndarray:
         """
         Annotate a frame with detection results
         
         Args:
             frame: Input frame (numpy array)
             results: Detection results from predict()
+            in_place: Draw on the frame itself instead of a copy
             **kwargs: Additional annotation parameters
             
         Returns:
             Annotated frame
         """
-        annotated_frame = frame.copy()
-        
-        for result in results:
-            for box in result.boxes:
-                # Extract bounding box coordinates
-                x1, y1, x2, y2 = map(int, box.xyxy[0])  # Bounding box corners
-                class_id = int(box.cls[0])  # Class ID
-                label = self.get_label(class_id)  # Get label
-                confidence = float(box.conf[0])  # Confidence score
-                
-                # Draw rectangle on the frame
-                cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)  # Green box
-                
-                # Prepare label text with confidence
-                label_text = f"{label} {confidence:.2f}"
-                
-                # Calculate text size for background rectangle
-                (text_width, text_height), baseline = cv2.getTextSize(
-                    label_text, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1
-                )
-                
-                # Draw background rectangle for text
-                cv2.rectangle(
-                    annotated_frame, 
-                    (x1, y1 - text_height - baseline), 
-                    (x1 + text_width, y1), 
-                    (0, 255, 0), 
-                    -1
-                )
-                
-                # Put label text above the bounding box
-                cv2.putText(
-                    annotated_frame, 
-                    label_text, 
-                    (x1, y1 - baseline), 
-                    cv2.FONT_HERSHEY_SIMPLEX, 
-                    0.5, 
-                    (0, 0, 0), 
-                    1
-                )
-        
-        return annotated_frame
+        annotated_frame = frame if in_place else frame.copy()
+        detections = self.to_detections(results, confidence_threshold=0.0)
+        return draw_detections(annotated_frame, detections.xyxy, detections.labels, detections.confidence)
     
     def extract_detections(self, results: Any, frame_width: int, frame_height: int) -> List[Dict[str, Any]]:
         """
@@ -132,27 +144,20 @@ class YOLODetector(BaseDetector):
         Returns:
             List of detection dictionaries with class, confidence, box, and relative position
         """
-        detections = []
-        
-        for result in results:
-            for box in result.boxes:
-                # Extract object data
-                box_coordinates = box.xyxy[0].tolist()
-                class_id = int(box.cls[0])
-                label = self.get_label(class_id)
-                confidence = float(box.conf[0])
-                
-                # Calculate relative position (center of box)
-                x1, y1, x2, y2 = box_coordinates
-                x_center = (x1 + x2) / 2 / frame_width
-                y_center = (y1 + y2) / 2 / frame_height
-                relative_position = [x_center, y_center]
-                
-                detections.append({
-                    "class": label,
-                    "confidence": confidence,
-                    "box": box_coordinates,
-                    "relative_position": relative_position
-                })
+        detections = Detections.from_ultralytics(results, self.class_names)
+        # Relative position is the center of the box
+        xyxy = detections.xyxy.astype(np.float64)
+        centers = (xyxy[:, :2] + xyxy[:, 2:]) / 2 / [frame_width, frame_height]
         
-        return detections 
\ No newline at end of file
+        return [
+            {
+                "class": label,
+                "confidence": confidence,
+                "box": box_coordinates,
+                "relative_position": relative_position
+            }
+            for label, confidence, box_coordinates, relative_position in zip(
+                detections.labels.tolist(), detections.confidence.astype(np.float64).tolist(),
+                xyxy.tolist(), centers.tolist()
+            )
+        ] 
\ No newline at end of file
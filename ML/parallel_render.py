@@ -0,0 +1,242 @@
+"""
+Parallel segment-wise rendering of annotated videos
+
+The frames to render are split into segments that start at keyframes (or at
+upload fragment boundaries, which are keyframes), so that each segment can be
+decoded on its own after a cheap seek. Every segment is decoded, drawn and
+encoded in its own process, which is given only the boxes of its frames, and
+the encoded segments are joined without re-encoding by FFmpeg's concat
+demuxer (sharding.concat_videos).
+
+Each frame handed to the encoder is identical to the one the sequential
+renderer draws. Encoders with rate control, such as mp4v, restart it at each
+segment, so the first frames of a segment can be quantized slightly
+differently; with a lossless codec (fourcc 'FFV1') the decoded output is
+identical to that of the sequential renderer.
+"""
+import multiprocessing as mp
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from ML.utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class RenderTask(NamedTuple):
+    """
+    One segment of an annotated video
+
+    Attributes:
+        video_path: Video to decode
+        output_path: Encoded segment to write
+        start_frame: First frame of the segment
+        end_frame: Frame after the last frame of the segment
+        fps: Frame rate of the output (lower than the video's when frames are skipped)
+        frame_size: Width and height of the decoded (and output) frames
+        draw: Module-level function drawing one frame's payload onto the frame, returning
+            the annotated frame (or None if it drew in place)
+        payloads: Frame number -> what draw needs for the frame; frames without one are written undrawn
+        frames: Frame numbers to write, in order (None writes every frame of the segment)
+        fourcc: Codec of the output
+        capture_kwargs: Arguments of ffmpeg_capture.open_capture besides the path,
+            so that frames are decoded like those the payloads were computed on
+    """
+    video_path: str
+    output_path: str
+    start_frame: int
+    end_frame: int
+    fps: float
+    frame_size: Tuple[int, int]
+    draw: Callable[[np.ndarray, Any], Any]
+    payloads: Dict[int, Any]
+    frames: Optional[List[int]] = None
+    fourcc: str = "mp4v"
+    capture_kwargs: Optional[Dict[str, Any]] = None
+
+
+def resolve_workers(workers: int) -> int:
+    """
+    Get the number of render processes
+
+    Args:
+        workers: Configured number (0 = one per core)
+
+    Returns:
+        Number of processes, at least 1
+    """
+    return max(1, workers if workers > 0 else (os.cpu_count() or 1))
+
+
+def plan_render_segments(start_frame: int, end_frame: int, num_segments: int,
+                         boundaries: Optional[Iterable[int]] = None,
+                         min_segment_frames: int = 1) -> List[Tuple[int, int]]:
+    """
+    Split a frame range into segments that start at keyframes
+
+    The range is split into equal parts and each inner split point is moved to
+    the nearest candidate boundary. Without candidates, the equal split is
+    used and each worker's seek decodes forward from the preceding keyframe.
+
+    Args:
+        start_frame: First frame of the range
+        end_frame: Frame after the last frame of the range
+        num_segments: Maximum number of segments
+        boundaries: Frame numbers at which segments may start (keyframes or fragment starts)
+        min_segment_frames: Minimum frames per segment; short ranges get fewer segments
+
+    Returns:
+        List of (start_frame, end_frame) ranges, end exclusive
+    """
+    total = end_frame - start_frame
+    count = max(1, min(num_segments, total // max(1, min_segment_frames)))
+    if total <= 0 or count == 1:
+        return [(start_frame, max(start_frame, end_frame))]
+    targets = np.linspace(start_frame, end_frame, count + 1).astype(int)[1:-1]
+    candidates = np.array(sorted(b for b in boundaries if start_frame < b < end_frame)) if boundaries is not None else None
+    if candidates is not None and len(candidates):
+        nearest = np.abs(candidates[None, :] - targets[:, None]).argmin(axis=1)
+        targets = candidates[nearest]
+    splits = sorted(set(int(split) for split in targets))
+    bounds = [start_frame] + splits + [end_frame]
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+
+def render_segment(task: RenderTask) -> Tuple[str, int]:
+    """
+    Decode, draw and encode one segment
+
+    Args:
+        task: Segment to render
+
+    Returns:
+        Path of the encoded segment and number of frames written
+    """
+    from ML.ffmpeg_capture import open_capture
+    from ML.video_processor import seek_to_frame
+
+    cap = open_capture(task.video_path, num_buffers=2, **(task.capture_kwargs or {}))
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video file: {task.video_path}")
+    video_fps = cap.get(cv2.CAP_PROP_FPS) or task.fps
+    out = cv2.VideoWriter(task.output_path, cv2.VideoWriter_fourcc(*task.fourcc), task.fps, task.frame_size)
+    frames = iter(task.frames) if task.frames is not None else iter(range(task.start_frame, task.end_frame))
+    written = 0
+    try:
+        position = seek_to_frame(cap, task.start_frame, video_fps) if task.start_frame > 0 else 0
+        for frame_number in frames:
+            # Frames that are not written (e.g. skipped by sampling) are not decoded to images
+            while position < frame_number and cap.grab():
+                position += 1
+            ret, frame = cap.read()
+            if not ret:
+                break
+            position += 1
+            payload = task.payloads.get(frame_number)
+            if payload is not None:
+                drawn = task.draw(frame, payload)
+                if drawn is not None:
+                    frame = drawn
+            out.write(frame)
+            written += 1
+    finally:
+        cap.release()
+        out.release()
+    return task.output_path, written
+
+
+def render_parallel(tasks: Iterable[RenderTask], output_path: str, workers: int,
+                    concat: Optional[Callable[[List[str], str], bool]] = None) -> int:
+    """
+    Render segments in parallel processes and join them
+
+    Tasks are taken from the iterable only when a process is free, so their
+    payloads can be built lazily and only the segments in flight are held in
+    memory. With one worker, the segments are rendered in this process.
+
+    Args:
+        tasks: Segments in playback order
+        output_path: Path of the joined video
+        workers: Number of processes
+        concat: Function joining the segment files (default: sharding.concat_videos)
+
+    Returns:
+        Number of frames written
+
+    Raises:
+        RuntimeError: If the segments could not be joined
+    """
+    if concat is None:
+        from ML.sharding import concat_videos
+        concat = concat_videos
+
+    paths: List[str] = []
+    written = 0
+    try:
+        if workers <= 1:
+            for task in tasks:
+                paths.append(task.output_path)
+                written += render_segment(task)[1]
+        else:
+            # Spawn rather than fork, like the shard workers
+            with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as executor:
+                in_flight: Deque[Future] = deque()
+                for task in tasks:
+                    if len(in_flight) >= workers:
+                        written += in_flight.popleft().result()[1]
+                    paths.append(task.output_path)
+                    in_flight.append(executor.submit(render_segment, task))
+                for future in in_flight:
+                    written += future.result()[1]
+
+        if len(paths) == 1:
+            os.replace(paths[0], output_path)
+            paths = []
+        elif not concat(paths, output_path):
+            raise RuntimeError(f"Could not join {len(paths)} rendered segments into {output_path}")
+        logger.info(f"Rendered {written} frames in {max(len(paths), 1)} segments with {workers} processes")
+        return written
+    finally:
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def segment_path(output_path: str, index: int) -> str:
+    """
+    Get the path of a rendered segment of an output video
+
+    Args:
+        output_path: Path of the joined video
+        index: Index of the segment
+
+    Returns:
+        Path next to the output, named '<base>.renderNNN<ext>'
+    """
+    base, ext = os.path.splitext(output_path)
+    return f"{base}.render{index:03d}{ext}"
+
+
+def split_payloads(payloads: Dict[int, Any], segments: Sequence[Tuple[int, int]]) -> List[Dict[int, Any]]:
+    """
+    Split per-frame payloads by segment
+
+    Args:
+        payloads: Frame number -> payload
+        segments: (start_frame, end_frame) ranges
+
+    Returns:
+        One dictionary per segment with the payloads of its frames
+    """
+    parts: List[Dict[int, Any]] = [{} for _ in segments]
+    starts = np.array([start for start, _ in segments])
+    for frame_number, payload in payloads.items():
+        index = int(np.searchsorted(starts, frame_number, side="right")) - 1
+        if 0 <= index < len(segments) and frame_number < segments[index][1]:
+            parts[index][frame_number] = payload
+    return parts
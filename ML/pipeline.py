@@ -0,0 +1,119 @@
+"""
+Threaded staged pipeline with bounded queues
+"""
+import queue
+import threading
+from typing import Any, Callable, Iterable, List, Optional
+
+from ML.utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Marker passed down the queues once the source is exhausted
+_END = object()
+
+
+class StagedPipeline:
+    """
+    Run a source iterator and a chain of stages, each on its own thread
+
+    Items flow from the source through every stage in order. Each stage is a
+    single thread, so items are processed strictly in source order, and the
+    queues between stages are bounded so that a slow stage applies
+    backpressure to the stages before it instead of letting memory grow.
+    """
+
+    def __init__(self, source: Iterable[Any], stages: List[Callable[[Any], Any]],
+                 queue_size: int = 4, name: str = "pipeline") -> None:
+        """
+        Initialize the pipeline
+
+        Args:
+            source: Iterable producing the input items (run on its own thread)
+            stages: Functions applied in order; each receives the previous
+                stage's return value. The last stage's return value is discarded.
+            queue_size: Maximum number of items waiting between two stages
+            name: Prefix for the thread names
+        """
+        self.source = source
+        self.stages = stages
+        self.name = name
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._error_lock = threading.Lock()
+
+    def _fail(self, error: BaseException) -> None:
+        """Record the first error and tell every stage to stop"""
+        with self._error_lock:
+            if self._error is None:
+                self._error = error
+        self._stop.set()
+
+    def _put(self, q: queue.Queue, item: Any) -> bool:
+        """Put an item on a queue, giving up if the pipeline is stopping"""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue) -> Any:
+        """Get an item from a queue, returning _END if the pipeline is stopping"""
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _run_source(self) -> None:
+        try:
+            for item in self.source:
+                if not self._put(self.queues[0], item):
+                    return
+            self._put(self.queues[0], _END)
+        except BaseException as e:
+            self._fail(e)
+
+    def _run_stage(self, index: int) -> None:
+        stage = self.stages[index]
+        in_q = self.queues[index]
+        out_q = self.queues[index + 1] if index + 1 < len(self.queues) else None
+        try:
+            while True:
+                item = self._get(in_q)
+                if item is _END:
+                    if out_q is not None:
+                        self._put(out_q, _END)
+                    return
+                result = stage(item)
+                if out_q is not None and not self._put(out_q, result):
+                    return
+        except BaseException as e:
+            self._fail(e)
+
+    def run(self) -> None:
+        """
+        Run the pipeline until the source is exhausted and every item is processed
+
+        Raises:
+            The first exception raised by the source or any stage
+        """
+        threads = [threading.Thread(target=self._run_source, name=f"{self.name}-source", daemon=True)]
+        for index, stage in enumerate(self.stages):
+            stage_name = getattr(stage, "__name__", str(index))
+            threads.append(threading.Thread(
+                target=self._run_stage, args=(index,), name=f"{self.name}-{stage_name}", daemon=True
+            ))
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self._error is not None:
+            logger.error(f"Pipeline {self.name} failed: {self._error}")
+            raise self._error
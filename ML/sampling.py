@@ -0,0 +1,197 @@
+"""
+Frame sampling strategies for running the detector on a subset of frames
+"""
+import os
+import subprocess
+from typing import List, Optional, Set
+
+from ML.utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+SAMPLING_MODES = ["all", "stride", "keyframe"]
+
+
+def probe_keyframes(video_path: str) -> Optional[Set[int]]:
+    """
+    Find the frame numbers of the keyframes of a video without decoding it
+
+    Uses ffprobe's packet listing, which only parses the container. Packets are
+    sorted by presentation timestamp so that the returned indices match the
+    frame numbers produced by cv2.VideoCapture. Packets without a timestamp
+    are kept in stream (decode) order, which is the presentation order only
+    if the stream has no reordered frames; otherwise None is returned rather
+    than keyframe numbers shifted against the decoded frames.
+
+    Args:
+        video_path: Path to the video file
+
+    Returns:
+        Set of keyframe frame numbers, or None if ffprobe failed or the
+        keyframes cannot be placed
+    """
+    cmd = [
+        "ffprobe",
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "compact=p=0",
+        video_path
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+    except FileNotFoundError:
+        logger.warning("ffprobe not found; cannot locate keyframes")
+        return None
+    if result.returncode != 0:
+        logger.warning(f"FFprobe error: {result.stderr}")
+        return None
+
+    # Lines are "pts_time=0.033367|flags=K__" in stream order
+    packets = []
+    for line in result.stdout.splitlines():
+        fields = dict(field.split("=", 1) for field in line.strip().split("|") if "=" in field)
+        if "flags" not in fields:
+            continue
+        pts = fields.get("pts_time", "N/A")
+        packets.append((None if pts in ("", "N/A") else float(pts), "K" in fields["flags"]))
+
+    known = [pts for pts, _ in packets if pts is not None]
+    if len(known) < len(packets):
+        if any(later < earlier for earlier, later in zip(known, known[1:])):
+            logger.warning(f"{len(packets) - len(known)} packets without timestamps in a stream with "
+                           f"reordered frames; cannot number the keyframes of {video_path}")
+            return None
+    else:
+        packets.sort(key=lambda packet: packet[0])
+    return {index for index, (_, is_key) in enumerate(packets) if is_key}
+
+
+class FrameSampler:
+    """
+    Decide which frames the detector runs on
+
+    Modes:
+        all: every frame
+        stride: every Nth frame
+        keyframe: decoder keyframes only, optionally also any frame that is
+            max_gap frames after the last sampled one. Encoders place
+            keyframes on scene cuts, so this also samples scene changes.
+    """
+
+    def __init__(self, mode: str = "all", stride: int = 1,
+                 keyframes: Optional[Set[int]] = None, max_gap: int = 0) -> None:
+        """
+        Initialize the sampler
+
+        Args:
+            mode: Sampling mode ('all', 'stride' or 'keyframe')
+            stride: Run the detector every Nth frame in 'stride' mode
+            keyframes: Frame numbers of the keyframes for 'keyframe' mode
+            max_gap: Maximum number of frames between samples in 'keyframe' mode (0 = unlimited)
+
+        Raises:
+            ValueError: If mode is not recognized
+        """
+        if mode not in SAMPLING_MODES:
+            raise ValueError(f"Unknown sampling mode: {mode}. Available modes: {SAMPLING_MODES}")
+        self.mode = mode
+        self.stride = max(1, stride)
+        self.keyframes = keyframes or set()
+        self.max_gap = max_gap
+        self._last_sampled = None
+
+    @classmethod
+    def for_video(cls, video_path: str, mode: str = "all", stride: int = 1,
+                  max_gap: int = 0) -> "FrameSampler":
+        """
+        Build a sampler for a video, probing keyframes if needed
+
+        Falls back to stride sampling if keyframes cannot be determined, which
+        includes videos read from a pipe.
+
+        Args:
+            video_path: Path to the video file
+            mode: Sampling mode ('all', 'stride' or 'keyframe')
+            stride: Run the detector every Nth frame in 'stride' mode
+            max_gap: Maximum number of frames between samples in 'keyframe' mode
+
+        Returns:
+            Frame sampler
+        """
+        if mode == "keyframe":
+            # Probing a pipe would consume the stream the decoder reads
+            keyframes = probe_keyframes(video_path) if os.path.isfile(video_path) else None
+            if not keyframes:
+                logger.warning(f"No keyframes found for {video_path}; falling back to stride sampling")
+                return cls("stride", stride=max(stride, max_gap, 1))
+            logger.info(f"Found {len(keyframes)} keyframes in {video_path}")
+            return cls(mode, stride=stride, keyframes=keyframes, max_gap=max_gap)
+        return cls(mode, stride=stride)
+
+    @property
+    def enabled(self) -> bool:
+        """Whether any frames are skipped"""
+        return self.mode != "all" and not (self.mode == "stride" and self.stride == 1)
+
+    def should_process(self, frame_number: int) -> bool:
+        """
+        Decide whether to run the detector on a frame
+
+        Must be called once per frame, in frame order.
+
+        Args:
+            frame_number: Index of the frame in the video
+
+        Returns:
+            True if the frame should be decoded and run through the detector
+        """
+        if self.mode == "all":
+            sample = True
+        elif self.mode == "stride":
+            sample = frame_number % self.stride == 0
+        else:
+            sample = (frame_number in self.keyframes or self._last_sampled is None or
+                      (self.max_gap > 0 and frame_number - self._last_sampled >= self.max_gap))
+        if sample:
+            self._last_sampled = frame_number
+        return sample
+
+    def max_interval(self, total_frames: int) -> int:
+        """
+        Get the largest number of frames between two sampled frames
+
+        Args:
+            total_frames: Number of frames in the video
+
+        Returns:
+            Maximum sampling interval in frames
+        """
+        if self.mode == "all":
+            return 1
+        if self.mode == "stride":
+            return self.stride
+        sampled: List[int] = sorted(self.keyframes | {0})
+        gaps = [b - a for a, b in zip(sampled, sampled[1:])]
+        gaps.append(max(total_frames - sampled[-1], 1))
+        largest = max(gaps)
+        return min(largest, self.max_gap) if self.max_gap > 0 else largest
+
+    def sampled_fraction(self, total_frames: int) -> float:
+        """
+        Get the fraction of frames the detector runs on
+
+        Args:
+            total_frames: Number of frames in the video
+
+        Returns:
+            Fraction between 0 and 1
+        """
+        if self.mode == "all" or total_frames <= 0:
+            return 1.0
+        if self.mode == "stride":
+            return 1.0 / self.stride
+        sampled = len([f for f in self.keyframes | {0} if f < total_frames])
+        if self.max_gap > 0:
+            sampled = max(sampled, total_frames // self.max_gap)
+        return min(1.0, sampled / total_frames)
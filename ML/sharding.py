@@ -0,0 +1,223 @@
+"""
+Time sharding of long videos for parallel processing
+"""
+import os
+import subprocess
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from ML.utils.logging_config import get_logger
+from sort_tracker import associate_detections_to_trackers
+
+logger = get_logger(__name__)
+
+# Processor owned by a shard worker process
+_shard_processor = None
+
+
+class ShardResult(NamedTuple):
+    """
+    Output of processing one time shard
+
+    Documents are in the format written by the detection sinks, with instance
+    IDs local to the shard until they are stitched. Metrics are the shard's
+    stage timings, added to those of the video.
+    """
+    index: int
+    start_frame: int
+    end_frame: int
+    documents: List[Dict[str, Any]]
+    frames: int
+    last_timestamp_ms: float
+    timeout_ms: float
+    annotated_path: str
+    metrics: Optional[Any] = None
+
+
+def plan_shards(total_frames: int, fps: float, num_shards: int,
+                min_shard_seconds: float) -> List[Tuple[int, int]]:
+    """
+    Split a video into contiguous frame ranges of equal length
+
+    Args:
+        total_frames: Number of frames in the video
+        fps: Frame rate of the video
+        num_shards: Maximum number of shards
+        min_shard_seconds: Minimum duration of a shard; shorter videos get fewer shards
+
+    Returns:
+        List of (start_frame, end_frame) ranges, end exclusive
+    """
+    if total_frames <= 0:
+        return [(0, max(total_frames, 0))]
+    min_frames = max(1, int(min_shard_seconds * fps))
+    count = max(1, min(num_shards, total_frames // min_frames))
+    bounds = np.linspace(0, total_frames, count + 1).astype(int)
+    return [(int(start), int(end)) for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def is_open_at_end(doc: Dict[str, Any], last_timestamp_ms: float, timeout_ms: float) -> bool:
+    """
+    Check whether an instance was still being tracked at the end of its shard
+
+    Args:
+        doc: Instance document
+        last_timestamp_ms: Timestamp of the shard's last frame in milliseconds
+        timeout_ms: Tracking timeout in milliseconds
+
+    Returns:
+        True if the instance could continue in the next shard
+    """
+    return last_timestamp_ms - doc["end_time"] * 1000 <= timeout_ms
+
+
+def match_boundary_tracks(open_docs: List[Dict[str, Any]], next_docs: List[Dict[str, Any]],
+                          timeout_ms: float, iou_threshold: float) -> Dict[int, int]:
+    """
+    Match instances open at the end of a shard to instances starting in the next one
+
+    Per label, the last box of each open instance is compared with the first box
+    of each instance of the next shard that starts within the timeout, and the
+    pairs are chosen with the same optimal IoU assignment the trackers use.
+
+    Args:
+        open_docs: Instances still tracked at the end of the previous shard
+        next_docs: Instances of the next shard
+        timeout_ms: Maximum gap between the two instances in milliseconds
+        iou_threshold: Minimum IoU between the last and first box
+
+    Returns:
+        Mapping from index in next_docs to index in open_docs
+    """
+    matches: Dict[int, int] = {}
+    for label in {doc["object_name"] for doc in open_docs}:
+        left = [i for i, doc in enumerate(open_docs) if doc["object_name"] == label]
+        right = [
+            j for j, doc in enumerate(next_docs)
+            if doc["object_name"] == label and any(
+                0 <= (doc["start_time"] - open_docs[i]["end_time"]) * 1000 <= timeout_ms for i in left
+            )
+        ]
+        if not right:
+            continue
+        left_boxes = np.array([open_docs[i]["frames"][-1]["box"] for i in left], dtype=np.float64)
+        right_boxes = np.array([next_docs[j]["frames"][0]["box"] for j in right], dtype=np.float64)
+        paired, _, _ = associate_detections_to_trackers(right_boxes, left_boxes, iou_threshold)
+        for trk, det in paired.items():
+            gap_ms = (next_docs[right[det]]["start_time"] - open_docs[left[trk]]["end_time"]) * 1000
+            if 0 <= gap_ms <= timeout_ms:
+                matches[right[det]] = left[trk]
+    return matches
+
+
+def concat_videos(paths: List[str], output_path: str) -> bool:
+    """
+    Concatenate video segments with the same codec and size
+
+    Uses FFmpeg's concat demuxer without re-encoding, falling back to OpenCV.
+
+    Args:
+        paths: Segment files in order
+        output_path: Path of the concatenated video
+
+    Returns:
+        True on success
+    """
+    concat_file_path = f"{output_path}.concat.txt"
+    with open(concat_file_path, "w") as f:
+        for path in paths:
+            f.write(f"file '{os.path.abspath(path)}'\n")
+    cmd = ["ffmpeg", "-f", "concat", "-safe", "0", "-i", concat_file_path, "-c", "copy", "-y", output_path]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode == 0:
+            return True
+        logger.warning(f"FFmpeg error: {result.stderr}")
+    except FileNotFoundError:
+        logger.warning("ffmpeg not found; concatenating segments with OpenCV")
+    finally:
+        os.remove(concat_file_path)
+
+    out = None
+    for path in paths:
+        cap = cv2.VideoCapture(path)
+        if out is None:
+            fps = cap.get(cv2.CAP_PROP_FPS) or 30
+            size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+            out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            out.write(frame)
+        cap.release()
+    if out is None:
+        return False
+    out.release()
+    return True
+
+
+def _init_shard_worker(processor_kwargs: Dict[str, Any]) -> None:
+    """Load the model once per shard worker process"""
+    global _shard_processor
+    from ML.utils.config import config
+    from ML.utils.logging_config import setup_logging
+    from ML.video_processor import VideoProcessor
+    setup_logging(log_file=os.path.join(config.LOG_DIR, "video_processing.log"))
+    _shard_processor = VideoProcessor(num_shards=1, **processor_kwargs)
+
+
+def _process_shard(video_path: str, index: int, start_frame: int, end_frame: int,
+                   annotated_path: str) -> ShardResult:
+    """Process one shard in a worker process, keeping its detections in memory"""
+    from ML.detection_sink import MemoryDetectionSink
+    from ML.metrics import StageMetrics
+
+    cap = _shard_processor.open_capture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video file: {video_path}")
+    sink = MemoryDetectionSink()
+    metrics = StageMetrics(_shard_processor.metrics_enabled)
+    try:
+        frames, last_timestamp_ms, timeout_ms = _shard_processor.process_frames(
+            cap, video_path, sink, annotated_path, start_frame, end_frame, progress_position=index,
+            metrics=metrics
+        )
+    finally:
+        cap.release()
+    documents = sorted(sink.documents.values(), key=lambda doc: doc["start_time"])
+    return ShardResult(index, start_frame, end_frame, documents, frames,
+                       last_timestamp_ms, timeout_ms, annotated_path, metrics)
+
+
+def run_shards(processor_kwargs: Dict[str, Any], video_path: str, shards: List[Tuple[int, int]],
+               annotated_paths: List[str], num_threads: Optional[int] = None) -> Iterator[ShardResult]:
+    """
+    Process shards in parallel worker processes
+
+    Args:
+        processor_kwargs: Arguments for building a VideoProcessor in each worker
+        video_path: Path to the video file
+        shards: (start_frame, end_frame) ranges from plan_shards
+        annotated_paths: Annotated video segment path for each shard
+        num_threads: CPU threads for inference per worker (default: the cores divided among the shards)
+
+    Yields:
+        Shard results in shard order, each as soon as it and all earlier shards are done
+    """
+    worker_kwargs = dict(processor_kwargs)
+    worker_kwargs.setdefault("num_threads", num_threads or max(1, (os.cpu_count() or 1) // len(shards)))
+
+    # Spawn rather than fork: model state and MongoClient are not fork-safe
+    with ProcessPoolExecutor(max_workers=len(shards), mp_context=mp.get_context("spawn"),
+                             initializer=_init_shard_worker, initargs=(worker_kwargs,)) as executor:
+        futures = [
+            executor.submit(_process_shard, video_path, index, start, end, annotated_path)
+            for index, ((start, end), annotated_path) in enumerate(zip(shards, annotated_paths))
+        ]
+        for future in futures:
+            yield future.result()
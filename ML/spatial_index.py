@@ -0,0 +1,237 @@
+"""
+Per-video spatial grid index written when a video finishes processing
+
+The frame is divided into a grid_size x grid_size grid and the video into
+time buckets of bucket_seconds. For each class, the index stores one bit per
+(bucket, cell), set if the centre of any detection of that class falls in
+the cell during the bucket. Queries such as "person in the top half between
+10s and 20s" are answered from the bits of one document in the
+spatial_index collection instead of a scan of the video's trajectories.
+
+Per class, the bits are stored as packed bytes in bucket-major, then
+row-major cell order (cell index = row * grid_size + column).
+"""
+import math
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from bson import Binary
+
+from ML.columnar import timestamp_to_ms
+from ML.detection_sink import DetectionSink
+from ML.video_summary import merge_intervals
+
+SPATIAL_INDEX_COLLECTION = "spatial_index"
+
+
+class SpatialIndexSink(DetectionSink):
+    """
+    Sink wrapper that records the grid cells occupied by each class over time
+
+    All calls are forwarded to the wrapped sink, so the index is independent
+    of the storage format.
+    """
+
+    def __init__(self, sink: DetectionSink, grid_size: int = 8, bucket_seconds: float = 1.0) -> None:
+        """
+        Initialize the wrapper
+
+        Args:
+            sink: Sink that persists the detections
+            grid_size: Number of rows and columns of the grid
+            bucket_seconds: Duration of a time bucket in seconds
+        """
+        self.sink = sink
+        self.grid_size = grid_size
+        self.bucket_seconds = bucket_seconds
+        # object_name of every instance, and per class: bucket -> bit mask of occupied cells
+        self.labels: Dict[str, str] = {}
+        self.cells: Dict[str, Dict[int, int]] = {}
+
+    def _add_frame(self, object_name: str, frame_data: Dict[str, Any]) -> None:
+        """Set the bit of the cell containing a frame's centre"""
+        x, y = frame_data["relative_position"]
+        column = min(max(int(x * self.grid_size), 0), self.grid_size - 1)
+        row = min(max(int(y * self.grid_size), 0), self.grid_size - 1)
+        bucket = int(timestamp_to_ms(frame_data["timestamp"]) / 1000 / self.bucket_seconds)
+        buckets = self.cells.setdefault(object_name, {})
+        buckets[bucket] = buckets.get(bucket, 0) | (1 << (row * self.grid_size + column))
+
+    def set_frame_size(self, frame_width: int, frame_height: int) -> None:
+        self.sink.set_frame_size(frame_width, frame_height)
+
+    def set_metrics(self, metrics: Optional[Any]) -> None:
+        self.sink.set_metrics(metrics)
+
+    def create_instance(self, doc: Dict[str, Any]) -> None:
+        self.labels[doc["_id"]] = doc["object_name"]
+        for frame_data in doc.get("frames", []):
+            self._add_frame(doc["object_name"], frame_data)
+        self.sink.create_instance(doc)
+
+    def append_frame(self, instance_id: str, frame_data: Dict[str, Any], end_time: float) -> None:
+        self._add_frame(self.labels[instance_id], frame_data)
+        self.sink.append_frame(instance_id, frame_data, end_time)
+
+    def close_instance(self, instance_id: str) -> None:
+        self.sink.close_instance(instance_id)
+
+    def flush(self) -> None:
+        self.sink.flush()
+
+    def close(self) -> None:
+        self.sink.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return self.sink.get_stats()
+
+
+def build_spatial_index(video_id: str, cells: Dict[str, Dict[int, int]], duration: float,
+                        grid_size: int, bucket_seconds: float) -> Dict[str, Any]:
+    """
+    Build the spatial index document of a video
+
+    Args:
+        video_id: ID of the video
+        cells: Per class, bucket -> bit mask of occupied cells (from SpatialIndexSink)
+        duration: Duration of the video in seconds
+        grid_size: Number of rows and columns of the grid
+        bucket_seconds: Duration of a time bucket in seconds
+
+    Returns:
+        Spatial index document
+    """
+    num_cells = grid_size * grid_size
+    last_bucket = max([bucket for buckets in cells.values() for bucket in buckets], default=0)
+    num_buckets = max(last_bucket + 1, math.ceil(duration / bucket_seconds), 1)
+
+    classes = []
+    for object_name in sorted(cells):
+        occupancy = np.zeros((num_buckets, num_cells), dtype=bool)
+        for bucket, mask in cells[object_name].items():
+            occupancy[bucket] = [(mask >> cell) & 1 for cell in range(num_cells)]
+        classes.append({
+            "name": object_name,
+            "buckets": len(cells[object_name]),
+            "occupancy": Binary(np.packbits(occupancy).tobytes()),
+        })
+
+    return {
+        "_id": video_id,
+        "video_id": video_id,
+        "grid_size": grid_size,
+        "bucket_seconds": bucket_seconds,
+        "num_buckets": num_buckets,
+        "classes": classes,
+        "created_at": datetime.now(),
+    }
+
+
+def ensure_spatial_indexes(spatial_index_collection: Any) -> None:
+    """
+    Create the indexes used to find the videos with a class
+
+    Args:
+        spatial_index_collection: MongoDB spatial_index collection
+    """
+    spatial_index_collection.create_index([("classes.name", 1)])
+
+
+def write_spatial_index(spatial_index_collection: Any, index: Dict[str, Any]) -> None:
+    """
+    Store a spatial index, replacing the index of an earlier run
+
+    Args:
+        spatial_index_collection: MongoDB spatial_index collection
+        index: Index document from build_spatial_index
+    """
+    spatial_index_collection.replace_one({"_id": index["_id"]}, index, upsert=True)
+
+
+def get_grid_occupancy(index: Dict[str, Any], object_name: str) -> Optional[np.ndarray]:
+    """
+    Decode the grid occupancy of a class
+
+    Args:
+        index: Spatial index document
+        object_name: Class name
+
+    Returns:
+        Boolean array of shape (num_buckets, grid_size, grid_size), or None if
+        the class does not appear
+    """
+    grid_size = index["grid_size"]
+    for entry in index["classes"]:
+        if entry["name"] == object_name:
+            bits = np.unpackbits(np.frombuffer(entry["occupancy"], dtype=np.uint8))
+            size = index["num_buckets"] * grid_size * grid_size
+            return bits[:size].astype(bool).reshape(index["num_buckets"], grid_size, grid_size)
+    return None
+
+
+def area_to_cells(area: Sequence[float], grid_size: int) -> np.ndarray:
+    """
+    Get the grid cells that overlap an area
+
+    Args:
+        area: Relative area [x1, y1, x2, y2], as used by the query API
+        grid_size: Number of rows and columns of the grid
+
+    Returns:
+        Boolean array of shape (grid_size, grid_size), indexed by row and column
+    """
+    x1, y1, x2, y2 = area
+    cells = np.zeros((grid_size, grid_size), dtype=bool)
+    # A cell overlaps the area if any part of it lies inside; edges that only touch do not count
+    first_column, last_column = int(x1 * grid_size), math.ceil(x2 * grid_size)
+    first_row, last_row = int(y1 * grid_size), math.ceil(y2 * grid_size)
+    cells[max(first_row, 0):min(last_row, grid_size), max(first_column, 0):min(last_column, grid_size)] = True
+    return cells
+
+
+def find_in_area(index: Dict[str, Any], object_name: str, area: Sequence[float],
+                 start_time: Optional[float] = None, end_time: Optional[float] = None) -> List[List[float]]:
+    """
+    Find when a class is in an area of the frame
+
+    The result is at grid and bucket resolution: a cell that only partly
+    overlaps the area counts as inside it. Check the trajectories of the
+    returned time ranges if exact positions are needed.
+
+    Args:
+        index: Spatial index document
+        object_name: Class name
+        area: Relative area [x1, y1, x2, y2]
+        start_time: Start of the time range in seconds (default: start of the video)
+        end_time: End of the time range in seconds (default: end of the video)
+
+    Returns:
+        Merged [start, end] time ranges in seconds of the buckets in which the
+        class is in the area
+    """
+    occupancy = get_grid_occupancy(index, object_name)
+    if occupancy is None:
+        return []
+    bucket_seconds = index["bucket_seconds"]
+    first = 0 if start_time is None else max(0, int(start_time / bucket_seconds))
+    last = index["num_buckets"] - 1 if end_time is None else int(end_time / bucket_seconds)
+    cells = area_to_cells(area, index["grid_size"])
+    hits = occupancy[first:last + 1][:, cells].any(axis=1)
+    intervals = [((first + i) * bucket_seconds, (first + i + 1) * bucket_seconds)
+                 for i in np.flatnonzero(hits).tolist()]
+    return merge_intervals(intervals)
+
+
+def load_spatial_index(spatial_index_collection: Any, video_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Load the spatial index of a video
+
+    Args:
+        spatial_index_collection: MongoDB spatial_index collection
+        video_id: ID of the video
+
+    Returns:
+        Spatial index document, or None if the video has no index
+    """
+    return spatial_index_collection.find_one({"_id": video_id})
@@ -1,24 +1,25 @@
 # python3 -m venv .venv
 # source .venv/bin/activate
 # python3 -m pip install -r requirements.txt
-from pymongo.mongo_client import MongoClient
 import os
-from dotenv import load_dotenv
+import sys
 
-# Load environment variables
-load_dotenv()
+# Add the project root to Python path when running directly
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# Database configuration
-db_name = "vidmetastream"
+# The shared client factory loads the environment and applies the pool settings
+from ML.utils.config import config
+from ML.utils.connections import get_mongo_client
 
-# Get MongoDB URI from environment or build it from components
-mongodb_uri = os.getenv("MONGODB_URI")
+# Database configuration
+db_name = config.DB_NAME
 
 # Try to connect to the database
 try:
     # Create a MongoDB client
-    print(f"Attempting to connect to MongoDB using URI: {mongodb_uri}")
-    client = MongoClient(mongodb_uri)
+    print(f"Attempting to connect to MongoDB using URI: {config.MONGODB_URI}")
+    client = get_mongo_client()
     
     # Access a test database
     db = client[db_name]
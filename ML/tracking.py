@@ -0,0 +1,258 @@
+"""
+In-loop trackers matching detections to active object instances
+"""
+import uuid
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from sort_tracker import Sort, associate_detections_to_trackers
+
+
+class TrackUpdate(NamedTuple):
+    """
+    Assignment of one detection to an object instance
+
+    For a detection that continued an existing instance, the ``previous_*``
+    fields describe the instance's state before this frame, which is what
+    interpolation over skipped frames needs. For a new instance they are None.
+    """
+    detection_index: int
+    instance_id: str
+    is_new: bool
+    previous_frame: Optional[int] = None
+    previous_timestamp_ms: Optional[float] = None
+    previous_box: Optional[np.ndarray] = None
+    previous_confidence: Optional[float] = None
+
+
+class _LabelTracks:
+    """Array-backed state of the active instances of one label"""
+
+    def __init__(self) -> None:
+        self.ids = np.empty(0, dtype=object)
+        self.boxes = np.empty((0, 4), dtype=np.float64)
+        self.last_frame = np.empty(0, dtype=np.int64)
+        self.last_timestamp_ms = np.empty(0, dtype=np.float64)
+        self.last_confidence = np.empty(0, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def append(self, ids: List[str], boxes: np.ndarray, frame_number: int,
+               timestamp_ms: float, confidences: np.ndarray) -> None:
+        count = len(ids)
+        self.ids = np.concatenate([self.ids, np.array(ids, dtype=object)])
+        self.boxes = np.concatenate([self.boxes, boxes])
+        self.last_frame = np.concatenate([self.last_frame, np.full(count, frame_number, dtype=np.int64)])
+        self.last_timestamp_ms = np.concatenate([self.last_timestamp_ms, np.full(count, timestamp_ms)])
+        self.last_confidence = np.concatenate([self.last_confidence, confidences])
+
+    def keep(self, mask: np.ndarray) -> None:
+        self.ids = self.ids[mask]
+        self.boxes = self.boxes[mask]
+        self.last_frame = self.last_frame[mask]
+        self.last_timestamp_ms = self.last_timestamp_ms[mask]
+        self.last_confidence = self.last_confidence[mask]
+
+
+class IoUTracker:
+    """
+    Tracker that matches detections to active instances of the same label by IoU
+
+    For every label, the IoU matrix between the frame's detections and the
+    label's active instances is computed in one vectorized step, and
+    detections are assigned to instances with an optimal (Hungarian)
+    assignment. Each instance can therefore claim at most one detection per
+    frame. Instances that are not matched for longer than the timeout are
+    expired.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3) -> None:
+        """
+        Initialize the tracker
+
+        Args:
+            iou_threshold: Minimum IoU for a detection to continue an instance
+        """
+        self.iou_threshold = iou_threshold
+        self.tracks: Dict[str, _LabelTracks] = {}
+
+    def update(self, frame_number: int, timestamp_ms: float, boxes: np.ndarray,
+               confidences: np.ndarray, labels: List[str]) -> List[TrackUpdate]:
+        """
+        Assign the detections of one frame to instances
+
+        Args:
+            frame_number: Index of the frame in the video
+            timestamp_ms: Timestamp of the frame in milliseconds
+            boxes: Detection boxes as an (N, 4) array of [x1, y1, x2, y2]
+            confidences: Detection confidences as an (N,) array
+            labels: Detection labels, one per box
+
+        Returns:
+            One update per detection, in detection order
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        confidences = np.asarray(confidences, dtype=np.float64).reshape(-1)
+        labels_array = np.asarray(labels, dtype=object)
+        updates: List[TrackUpdate] = []
+
+        for label in dict.fromkeys(labels):
+            det_indices = np.flatnonzero(labels_array == label)
+            tracks = self.tracks.setdefault(label, _LabelTracks())
+            matches, unmatched_dets, _ = associate_detections_to_trackers(
+                boxes[det_indices], tracks.boxes, self.iou_threshold
+            )
+
+            # Continue matched instances
+            for trk, det in matches.items():
+                updates.append(TrackUpdate(
+                    int(det_indices[det]), tracks.ids[trk], False,
+                    int(tracks.last_frame[trk]), float(tracks.last_timestamp_ms[trk]),
+                    tracks.boxes[trk].copy(), float(tracks.last_confidence[trk])
+                ))
+            if matches:
+                trk_idx = np.fromiter(matches.keys(), dtype=np.int64)
+                det_idx = det_indices[np.fromiter(matches.values(), dtype=np.int64)]
+                tracks.boxes[trk_idx] = boxes[det_idx]
+                tracks.last_frame[trk_idx] = frame_number
+                tracks.last_timestamp_ms[trk_idx] = timestamp_ms
+                tracks.last_confidence[trk_idx] = confidences[det_idx]
+
+            # Start new instances for unmatched detections
+            if unmatched_dets:
+                new_idx = det_indices[np.sort(np.asarray(unmatched_dets, dtype=np.int64))]
+                new_ids = [str(uuid.uuid4()) for _ in new_idx]
+                tracks.append(new_ids, boxes[new_idx], frame_number, timestamp_ms, confidences[new_idx])
+                updates.extend(TrackUpdate(int(i), instance_id, True) for i, instance_id in zip(new_idx, new_ids))
+
+        updates.sort(key=lambda update: update.detection_index)
+        return updates
+
+    def expire(self, timestamp_ms: float, timeout_ms: float) -> List[str]:
+        """
+        Remove instances that have not been matched within the timeout
+
+        Args:
+            timestamp_ms: Timestamp of the current frame in milliseconds
+            timeout_ms: Time after which an unmatched instance expires
+
+        Returns:
+            IDs of the expired instances
+        """
+        expired: List[str] = []
+        for label, tracks in list(self.tracks.items()):
+            alive = (timestamp_ms - tracks.last_timestamp_ms) <= timeout_ms
+            if not alive.all():
+                expired.extend(tracks.ids[~alive])
+                tracks.keep(alive)
+            if len(tracks) == 0:
+                del self.tracks[label]
+        return expired
+
+    def active_count(self) -> int:
+        """Get the number of active instances"""
+        return sum(len(tracks) for tracks in self.tracks.values())
+
+
+class SortTracker:
+    """
+    Tracker backed by sort_tracker.Sort with a constant-velocity Kalman filter
+
+    Detections are matched against each track's predicted box, per class, so a
+    track that is briefly occluded continues the same instance when it
+    reappears instead of starting a new one. Tracks expire once they have not
+    been matched within the timeout.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3) -> None:
+        """
+        Initialize the tracker
+
+        Args:
+            iou_threshold: Minimum IoU between a detection and a predicted box
+        """
+        self.iou_threshold = iou_threshold
+        # Expiry is handled by timestamp in expire(), so Sort never drops tracks itself
+        self.sort = Sort(max_age=np.iinfo(np.int64).max, iou_threshold=iou_threshold, per_class=True)
+        # Sort tracker ID -> [instance_id, last_frame, last_timestamp_ms, last_box, last_confidence]
+        self.instances: Dict[int, list] = {}
+
+    def update(self, frame_number: int, timestamp_ms: float, boxes: np.ndarray,
+               confidences: np.ndarray, labels: List[str]) -> List[TrackUpdate]:
+        """
+        Assign the detections of one frame to instances
+
+        Args:
+            frame_number: Index of the frame in the video
+            timestamp_ms: Timestamp of the frame in milliseconds
+            boxes: Detection boxes as an (N, 4) array of [x1, y1, x2, y2]
+            confidences: Detection confidences as an (N,) array
+            labels: Detection labels, one per box
+
+        Returns:
+            One update per detection, in detection order
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        updates: List[TrackUpdate] = []
+        for i, trk in enumerate(self.sort.assign(boxes, labels)):
+            state = self.instances.get(trk.id)
+            if state is None:
+                instance_id = str(uuid.uuid4())
+                updates.append(TrackUpdate(i, instance_id, True))
+                self.instances[trk.id] = [instance_id, frame_number, timestamp_ms, boxes[i].copy(), float(confidences[i])]
+            else:
+                updates.append(TrackUpdate(i, state[0], False, state[1], state[2], state[3], state[4]))
+                state[1:] = [frame_number, timestamp_ms, boxes[i].copy(), float(confidences[i])]
+        return updates
+
+    def expire(self, timestamp_ms: float, timeout_ms: float) -> List[str]:
+        """
+        Remove tracks that have not been matched within the timeout
+
+        Args:
+            timestamp_ms: Timestamp of the current frame in milliseconds
+            timeout_ms: Time after which an unmatched track expires
+
+        Returns:
+            IDs of the expired instances
+        """
+        expired_trackers = {
+            trk_id for trk_id, state in self.instances.items()
+            if timestamp_ms - state[2] > timeout_ms
+        }
+        if not expired_trackers:
+            return []
+        self.sort.trackers = [trk for trk in self.sort.trackers if trk.id not in expired_trackers]
+        return [self.instances.pop(trk_id)[0] for trk_id in expired_trackers]
+
+    def active_count(self) -> int:
+        """Get the number of active instances"""
+        return len(self.instances)
+
+
+# Dictionary of available tracker backends
+AVAILABLE_TRACKERS = {
+    "iou": IoUTracker,
+    "sort": SortTracker,
+}
+
+
+def get_tracker(tracker_name: str, **kwargs: Any) -> Any:
+    """
+    Factory function to get a tracker by name
+
+    Args:
+        tracker_name: Name of the tracker backend ('iou' or 'sort')
+        **kwargs: Additional arguments to pass to the tracker constructor
+
+    Returns:
+        Tracker instance
+
+    Raises:
+        ValueError: If tracker_name is not recognized
+    """
+    if tracker_name not in AVAILABLE_TRACKERS:
+        raise ValueError(f"Unknown tracker: {tracker_name}. Available trackers: {list(AVAILABLE_TRACKERS.keys())}")
+    return AVAILABLE_TRACKERS[tracker_name](**kwargs)
@@ -14,6 +14,12 @@ class Config:
     # MongoDB configuration
     MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017/vidmetastream")
     DB_NAME = "vidmetastream"
+    MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))  # connections per process
+    MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))  # connections kept open when idle
+    MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "0"))  # close idle connections after this (0 = never)
+    MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "")  # wire compression in order of preference, e.g. 'zstd,snappy,zlib'
+    MONGO_RETRY_WRITES = os.getenv("MONGO_RETRY_WRITES", "true").lower() in ("1", "true", "yes")  # retry writes once on failover
+    MONGO_DETECTION_WRITE_CONCERN = os.getenv("MONGO_DETECTION_WRITE_CONCERN", "1")  # 'w' of detection writes: '0', '1' or 'majority'
     
     # MinIO/S3 configuration
     AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
@@ -22,11 +28,37 @@ class Config:
     AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY", "minioadmin")
     AWS_STORAGE_BUCKET_NAME = os.getenv("AWS_STORAGE_BUCKET_NAME", "vidmetastream")
     AWS_S3_ADDRESSING_STYLE = os.getenv("AWS_S3_ADDRESSING_STYLE", "path")
+    S3_STREAMING = os.getenv("S3_STREAMING", "false").lower() in ("1", "true", "yes")  # decode while downloading
+    S3_STREAM_PART_SIZE = int(os.getenv("S3_STREAM_PART_SIZE", str(8 * 1024 * 1024)))  # bytes per ranged GET
+    S3_STREAM_CONCURRENCY = int(os.getenv("S3_STREAM_CONCURRENCY", "4"))  # ranged GETs in flight
+    S3_TRANSFER_MAX_CONCURRENCY = int(os.getenv("S3_TRANSFER_MAX_CONCURRENCY", "10"))  # parts transferred in parallel
+    S3_TRANSFER_PART_SIZE = int(os.getenv("S3_TRANSFER_PART_SIZE", str(16 * 1024 * 1024)))  # bytes per multipart part
+    S3_TRANSFER_THRESHOLD = int(os.getenv("S3_TRANSFER_THRESHOLD", str(8 * 1024 * 1024)))  # multipart above this size
     
     # Video processing configuration
     CHUNK_DURATION = int(os.getenv("CHUNK_DURATION", "10"))  # seconds
+    CHUNK_FETCH_WORKERS = int(os.getenv("CHUNK_FETCH_WORKERS", "4"))  # GridFS chunks downloaded in parallel
+    ANNOTATE_STREAMING = os.getenv("ANNOTATE_STREAMING", "true").lower() in ("1", "true", "yes")  # sweep objects by start time
+    RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "1"))  # processes rendering annotated segments (0 = one per core)
     TEMP_DIR = os.getenv("TEMP_DIR", "/tmp/vidmetastream")
     MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(1024 * 1024 * 100)))  # 100MB
+    PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))  # batches buffered between pipeline stages
+    SAMPLING_MODE = os.getenv("SAMPLING_MODE", "all")  # 'all', 'stride' or 'keyframe'
+    SAMPLE_STRIDE = int(os.getenv("SAMPLE_STRIDE", "1"))  # run the detector every Nth frame in 'stride' mode
+    KEYFRAME_MAX_GAP = int(os.getenv("KEYFRAME_MAX_GAP", "0"))  # max frames between samples in 'keyframe' mode (0 = unlimited)
+    TRACKER_BACKEND = os.getenv("TRACKER_BACKEND", "iou")  # 'iou' or 'sort' (Kalman filter)
+    ANNOTATED_OUTPUT = os.getenv("ANNOTATED_OUTPUT", "full")  # 'full', 'parallel' (rendered in segments afterwards), 'segments' (uploaded while encoding) or 'none'
+    ANNOTATED_SEGMENT_SECONDS = float(os.getenv("ANNOTATED_SEGMENT_SECONDS", "10"))  # duration of an annotated segment
+    VIDEO_SHARDS = int(os.getenv("VIDEO_SHARDS", "1"))  # time shards processed in parallel per video
+    MIN_SHARD_SECONDS = float(os.getenv("MIN_SHARD_SECONDS", "60"))  # minimum duration of a shard
+    DECODE_BACKEND = os.getenv("DECODE_BACKEND", "opencv")  # 'opencv' or 'ffmpeg' (subprocess pipe)
+    DECODE_WIDTH = int(os.getenv("DECODE_WIDTH", "640"))  # width ffmpeg scales frames to (0 = source width)
+    DECODE_FPS = float(os.getenv("DECODE_FPS", "0"))  # frame rate ffmpeg reduces to (0 = source frame rate)
+    DECODE_THREADS = int(os.getenv("DECODE_THREADS", "0"))  # ffmpeg decoder threads (0 = automatic)
+    VIDEO_SUMMARY = os.getenv("VIDEO_SUMMARY", "true").lower() in ("1", "true", "yes")  # write a video_summaries document per video
+    SPATIAL_INDEX = os.getenv("SPATIAL_INDEX", "true").lower() in ("1", "true", "yes")  # write a spatial_index document per video
+    SPATIAL_GRID_SIZE = int(os.getenv("SPATIAL_GRID_SIZE", "8"))  # rows and columns of the spatial index grid
+    SPATIAL_BUCKET_SECONDS = float(os.getenv("SPATIAL_BUCKET_SECONDS", "1"))  # time bucket of the spatial index
     
     # Logging configuration
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()  # Ensure uppercase
@@ -36,6 +68,30 @@ class Config:
     DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "yolo")
     DEFAULT_MODEL_PATH = os.getenv("DEFAULT_MODEL_PATH", "yolo11n.pt")
     DEFAULT_DEVICE = os.getenv("DEFAULT_DEVICE", "cpu")
+    INFERENCE_BATCH_SIZE = int(os.getenv("INFERENCE_BATCH_SIZE", "1"))  # frames per inference call
+    MODEL_CACHE = os.getenv("MODEL_CACHE", "true").lower() in ("1", "true", "yes")  # share loaded models across processors
+    MODEL_WARMUP = os.getenv("MODEL_WARMUP", "true").lower() in ("1", "true", "yes")  # blank-frame inference after loading
+    
+    # Detection sink configuration
+    DETECTION_SINK = os.getenv("DETECTION_SINK", "bulk")  # 'bulk', 'direct' or 'columnar'
+    DETECTION_SINK_BATCH_SIZE = int(os.getenv("DETECTION_SINK_BATCH_SIZE", "500"))  # frames
+    DETECTION_SINK_FLUSH_INTERVAL = float(os.getenv("DETECTION_SINK_FLUSH_INTERVAL", "1.0"))  # seconds
+    COLUMNAR_BUCKET_SECONDS = float(os.getenv("COLUMNAR_BUCKET_SECONDS", "60"))  # time span of a columnar segment
+    TIMESTAMP_FORMAT = os.getenv("TIMESTAMP_FORMAT", "string")  # stored frame timestamps: 'string' (HH:MM:SS.mmm) or 'ms'
+    
+    # Worker pool configuration
+    WORKER_LEASE_SECONDS = float(os.getenv("WORKER_LEASE_SECONDS", "60"))  # claimed videos are requeued after this without a heartbeat
+    WORKER_HEARTBEAT_SECONDS = float(os.getenv("WORKER_HEARTBEAT_SECONDS", "15"))  # lease renewal interval
+    WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "2"))  # seconds between polls of an empty queue
+    WORKER_THREADS = int(os.getenv("WORKER_THREADS", "0"))  # inference threads per worker (0 = cores / workers)
+    WORKER_STATS_INTERVAL = float(os.getenv("WORKER_STATS_INTERVAL", "60"))  # seconds between throughput logs
+    PREFETCH_NEXT_VIDEO = os.getenv("PREFETCH_NEXT_VIDEO", "false").lower() in ("1", "true", "yes")  # claim and download the next video early
+    
+    # Metrics and profiling configuration
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")  # per-stage timers, stored on the video document
+    METRICS_TEXTFILE_DIR = os.getenv("METRICS_TEXTFILE_DIR", "")  # directory of Prometheus .prom files of the workers ('' = off)
+    PROFILER = os.getenv("PROFILER", "").lower()  # profile each video: '' (off), 'cprofile' or 'pyinstrument'
+    PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")  # directory of the profiles
     
     @classmethod
     def get_mongodb_config(cls) -> Dict[str, Any]:
@@ -45,6 +101,20 @@ class Config:
             "db_name": cls.DB_NAME
         }
     
+    @classmethod
+    def get_mongo_config(cls) -> Dict[str, Any]:
+        """Get MongoDB client configuration (MongoClient options and the detection write concern)"""
+        options = {
+            "maxPoolSize": cls.MONGO_MAX_POOL_SIZE,
+            "minPoolSize": cls.MONGO_MIN_POOL_SIZE,
+            "compressors": cls.MONGO_COMPRESSORS,
+            "retryWrites": cls.MONGO_RETRY_WRITES,
+            "detection_write_concern": cls.MONGO_DETECTION_WRITE_CONCERN,
+        }
+        if cls.MONGO_MAX_IDLE_TIME_MS > 0:
+            options["maxIdleTimeMS"] = cls.MONGO_MAX_IDLE_TIME_MS
+        return options
+    
     @classmethod
     def get_s3_config(cls) -> Dict[str, Any]:
         """Get S3/MinIO configuration"""
@@ -69,13 +139,59 @@ class Config:
         
         return config
     
+    @classmethod
+    def get_transfer_config(cls) -> Dict[str, Any]:
+        """Get S3 multipart transfer configuration (boto3 TransferConfig arguments)"""
+        return {
+            "multipart_threshold": cls.S3_TRANSFER_THRESHOLD,
+            "multipart_chunksize": cls.S3_TRANSFER_PART_SIZE,
+            "max_concurrency": cls.S3_TRANSFER_MAX_CONCURRENCY,
+            "use_threads": True
+        }
+    
     @classmethod
     def get_model_config(cls) -> Dict[str, Any]:
         """Get model configuration"""
         return {
             "model_name": cls.DEFAULT_MODEL,
             "model_path": cls.DEFAULT_MODEL_PATH,
-            "device": cls.DEFAULT_DEVICE
+            "device": cls.DEFAULT_DEVICE,
+            "batch_size": cls.INFERENCE_BATCH_SIZE,
+            "model_cache": cls.MODEL_CACHE,
+            "model_warmup": cls.MODEL_WARMUP
+        }
+    
+    @classmethod
+    def get_sink_config(cls) -> Dict[str, Any]:
+        """Get detection sink configuration"""
+        return {
+            "sink_name": cls.DETECTION_SINK,
+            "batch_size": cls.DETECTION_SINK_BATCH_SIZE,
+            "flush_interval": cls.DETECTION_SINK_FLUSH_INTERVAL,
+            "bucket_seconds": cls.COLUMNAR_BUCKET_SECONDS,
+            "timestamp_format": cls.TIMESTAMP_FORMAT
+        }
+    
+    @classmethod
+    def get_worker_config(cls) -> Dict[str, Any]:
+        """Get worker pool configuration"""
+        return {
+            "lease_seconds": cls.WORKER_LEASE_SECONDS,
+            "heartbeat_seconds": cls.WORKER_HEARTBEAT_SECONDS,
+            "poll_interval": cls.WORKER_POLL_INTERVAL,
+            "threads": cls.WORKER_THREADS,
+            "stats_interval": cls.WORKER_STATS_INTERVAL,
+            "prefetch_next_video": cls.PREFETCH_NEXT_VIDEO
+        }
+    
+    @classmethod
+    def get_metrics_config(cls) -> Dict[str, Any]:
+        """Get metrics and profiling configuration"""
+        return {
+            "enabled": cls.METRICS_ENABLED,
+            "textfile_dir": cls.METRICS_TEXTFILE_DIR,
+            "profiler": cls.PROFILER,
+            "profile_dir": cls.PROFILE_DIR
         }
     
     @classmethod
@@ -91,8 +207,28 @@ class Config:
         """Get video processing configuration"""
         return {
             "chunk_duration": cls.CHUNK_DURATION,
+            "chunk_fetch_workers": cls.CHUNK_FETCH_WORKERS,
+            "annotate_streaming": cls.ANNOTATE_STREAMING,
+            "render_workers": cls.RENDER_WORKERS,
             "temp_dir": cls.TEMP_DIR,
-            "max_upload_size": cls.MAX_UPLOAD_SIZE
+            "max_upload_size": cls.MAX_UPLOAD_SIZE,
+            "pipeline_queue_size": cls.PIPELINE_QUEUE_SIZE,
+            "sampling_mode": cls.SAMPLING_MODE,
+            "sample_stride": cls.SAMPLE_STRIDE,
+            "keyframe_max_gap": cls.KEYFRAME_MAX_GAP,
+            "tracker_backend": cls.TRACKER_BACKEND,
+            "video_shards": cls.VIDEO_SHARDS,
+            "min_shard_seconds": cls.MIN_SHARD_SECONDS,
+            "decode_backend": cls.DECODE_BACKEND,
+            "decode_width": cls.DECODE_WIDTH,
+            "decode_fps": cls.DECODE_FPS,
+            "decode_threads": cls.DECODE_THREADS,
+            "annotated_output": cls.ANNOTATED_OUTPUT,
+            "annotated_segment_seconds": cls.ANNOTATED_SEGMENT_SECONDS,
+            "video_summary": cls.VIDEO_SUMMARY,
+            "spatial_index": cls.SPATIAL_INDEX,
+            "spatial_grid_size": cls.SPATIAL_GRID_SIZE,
+            "spatial_bucket_seconds": cls.SPATIAL_BUCKET_SECONDS
         }
 
 # Create a singleton instance
@@ -2,71 +2,174 @@
 Shared connections module for MongoDB and S3/MinIO
 """
 import os
+import threading
 from typing import Optional, Dict, Any, Union
-import boto3
-from botocore.config import Config as BotoCoreConfig
-from pymongo import MongoClient
 from ML.utils.config import config
 from ML.utils.logging_config import get_logger
 
 # Set up logging
 logger = get_logger(__name__)
 
-# MongoDB connection
-print("config.MONGODB_URI: ", config.MONGODB_URI)
-print("config.DB_NAME: ", config.DB_NAME)
-mongo_client = MongoClient(config.MONGODB_URI)
-db = mongo_client[config.DB_NAME]
-
-# S3/MinIO client
-s3_config = config.get_s3_config()
-
-# Create proper boto3 Config object if config is provided
-boto_config = None
-if s3_config.get("config"):
-    s3_conf = s3_config.get("config")
-    boto_config = BotoCoreConfig(
-        signature_version=s3_conf.get("signature_version", "s3v4"),
-        s3=s3_conf.get("s3", {})
-    )
-
-s3_client = boto3.client(
-    "s3",
-    endpoint_url=s3_config.get("endpoint_url"),
-    aws_access_key_id=s3_config["aws_access_key_id"],
-    aws_secret_access_key=s3_config["aws_secret_access_key"],
-    region_name=s3_config["region_name"],
-    config=boto_config
-)
-
-# Export collections for easy access
-videos_collection = db["videos"]
-objects_collection = db["objects"]
+# Clients are created on first use, so that importing this module does not
+# import pymongo and boto3 or open connections
+_mongo_client = None
+_s3_client = None
+_client_lock = threading.Lock()
+
+# Collections that can still be imported by name, e.g. "from ML.utils.connections import videos_collection"
+_COLLECTION_ATTRIBUTES = {
+    "videos_collection": "videos",
+    "objects_collection": "objects",
+    "video_summaries_collection": "video_summaries",
+    "spatial_index_collection": "spatial_index",
+}
+
+# Python package each wire compressor needs; zlib is part of the standard library
+_COMPRESSOR_PACKAGES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+def available_compressors(compressors: str) -> str:
+    """
+    Keep the configured wire compressors whose Python package is installed
+    
+    Args:
+        compressors: Comma-separated compressors in order of preference
+        
+    Returns:
+        Comma-separated compressors that can be used, in the same order
+    """
+    import importlib.util
+    usable = []
+    for name in [c.strip() for c in compressors.split(",") if c.strip()]:
+        package = _COMPRESSOR_PACKAGES.get(name)
+        if package is None:
+            logger.warning(f"Unknown MongoDB compressor '{name}' ignored")
+        elif importlib.util.find_spec(package) is None:
+            logger.warning(f"MongoDB compressor '{name}' needs the '{package}' package; not using it")
+        else:
+            usable.append(name)
+    return ",".join(usable)
+
+def create_mongo_client(uri: Optional[str] = None, **overrides: Any) -> Any:
+    """
+    Create a MongoDB client with the pool, compression and retry settings of the configuration
+    
+    Prefer get_mongo_client(), which shares one client (and one connection
+    pool) per process; create a separate client only for a different server.
+    
+    Args:
+        uri: Connection string (default: config.MONGODB_URI)
+        **overrides: MongoClient options that replace the configured ones
+        
+    Returns:
+        MongoClient
+    """
+    from pymongo import MongoClient
+    options = config.get_mongo_config()
+    compressors = available_compressors(options.pop("compressors"))
+    if compressors:
+        options["compressors"] = compressors
+    options.pop("detection_write_concern")
+    options.update(overrides)
+    return MongoClient(uri or config.MONGODB_URI, **options)
+
+def get_mongo_client() -> Any:
+    """
+    Get the shared MongoDB client, creating it on first use
+    
+    Returns:
+        MongoClient for config.MONGODB_URI
+    """
+    global _mongo_client
+    if _mongo_client is None:
+        with _client_lock:
+            if _mongo_client is None:
+                logger.info(f"Connecting to MongoDB database {config.DB_NAME}")
+                _mongo_client = create_mongo_client()
+    return _mongo_client
 
 def get_database():
     """Get the MongoDB database instance"""
-    return db
+    return get_mongo_client()[config.DB_NAME]
 
-def get_collection(collection_name: str) -> Any:
+def get_collection(collection_name: str, write_concern: Any = None) -> Any:
     """
     Get a specific MongoDB collection
     
     Args:
         collection_name: Name of the collection
+        write_concern: pymongo WriteConcern for writes through this handle
+            (default: the client's, i.e. acknowledged)
         
     Returns:
         MongoDB collection
     """
-    return db[collection_name]
+    return get_database().get_collection(collection_name, write_concern=write_concern)
+
+def get_detection_write_concern() -> Any:
+    """
+    Get the write concern for detection writes (instances, frames and segments)
+    
+    Returns:
+        pymongo WriteConcern built from config.MONGO_DETECTION_WRITE_CONCERN
+    """
+    from pymongo import WriteConcern
+    w = config.MONGO_DETECTION_WRITE_CONCERN
+    return WriteConcern(w=int(w) if w.isdigit() else w)
+
+def get_detection_collection() -> Any:
+    """
+    Get the objects collection with the detection write concern, for detection sinks
+    
+    Returns:
+        MongoDB objects collection
+    """
+    return get_collection("objects", write_concern=get_detection_write_concern())
 
 def get_s3_client() -> Any:
     """
-    Get the S3/MinIO client
+    Get the S3/MinIO client, creating it on first use
     
     Returns:
         S3/MinIO client
     """
-    return s3_client
+    global _s3_client
+    if _s3_client is None:
+        with _client_lock:
+            if _s3_client is None:
+                import boto3
+                from botocore.config import Config as BotoCoreConfig
+                s3_config = config.get_s3_config()
+                
+                # Create proper boto3 Config object if config is provided
+                boto_config = None
+                if s3_config.get("config"):
+                    s3_conf = s3_config.get("config")
+                    boto_config = BotoCoreConfig(
+                        signature_version=s3_conf.get("signature_version", "s3v4"),
+                        s3=s3_conf.get("s3", {})
+                    )
+                
+                _s3_client = boto3.client(
+                    "s3",
+                    endpoint_url=s3_config.get("endpoint_url"),
+                    aws_access_key_id=s3_config["aws_access_key_id"],
+                    aws_secret_access_key=s3_config["aws_secret_access_key"],
+                    region_name=s3_config["region_name"],
+                    config=boto_config
+                )
+    return _s3_client
+
+def __getattr__(name: str) -> Any:
+    """Create the module-level clients and collections on first access"""
+    if name in _COLLECTION_ATTRIBUTES:
+        return get_collection(_COLLECTION_ATTRIBUTES[name])
+    if name == "mongo_client":
+        return get_mongo_client()
+    if name == "db":
+        return get_database()
+    if name == "s3_client":
+        return get_s3_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def get_bucket_name() -> str:
     """
@@ -75,7 +178,17 @@ def get_bucket_name() -> str:
     Returns:
         Bucket name
     """
-    return s3_config["bucket_name"]
+    return config.get_s3_config()["bucket_name"]
+
+def get_transfer_config() -> Any:
+    """
+    Get the transfer configuration for multipart uploads and downloads
+    
+    Returns:
+        boto3 TransferConfig built from the S3 transfer configuration
+    """
+    from boto3.s3.transfer import TransferConfig
+    return TransferConfig(**config.get_transfer_config())
 
 def download_from_s3(s3_key: str, local_path: str) -> Optional[str]:
     """
@@ -93,10 +206,29 @@ def download_from_s3(s3_key: str, local_path: str) -> Optional[str]:
         os.makedirs(os.path.dirname(local_path), exist_ok=True)
         
         # Download the file
-        s3_client.download_file(get_bucket_name(), s3_key, local_path)
+        get_s3_client().download_file(get_bucket_name(), s3_key, local_path, Config=get_transfer_config())
         absolute_path = os.path.abspath(local_path)
         logger.info(f"Downloaded {s3_key} to {absolute_path}")
         return absolute_path
     except Exception as e:
         logger.error(f"Error downloading {s3_key}: {e}", exc_info=True)
-        return None 
\ No newline at end of file
+        return None
+
+def upload_to_s3(local_path: str, s3_key: str) -> Optional[str]:
+    """
+    Upload a file to S3/MinIO, in parallel parts for large files
+    
+    Args:
+        local_path: The local path of the file
+        s3_key: The object key in S3/MinIO
+        
+    Returns:
+        The object key or None if upload failed
+    """
+    try:
+        get_s3_client().upload_file(local_path, get_bucket_name(), s3_key, Config=get_transfer_config())
+        logger.info(f"Uploaded {local_path} to {s3_key}")
+        return s3_key
+    except Exception as e:
+        logger.error(f"Error uploading {local_path}: {e}", exc_info=True)
+        return None
@@ -0,0 +1,328 @@
+"""
+Streaming and prefetching downloads of uploaded videos from S3/MinIO
+"""
+import os
+import struct
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from ML.utils.config import config
+from ML.utils.connections import download_from_s3, get_bucket_name, get_s3_client
+from ML.utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Top-level MP4 boxes inspected before giving up on finding 'moov' or 'mdat'
+MAX_PROBED_BOXES = 16
+
+
+def get_range(s3_client: Any, bucket: str, key: str, start: int, end: int) -> bytes:
+    """
+    Download a byte range of an object
+
+    Args:
+        s3_client: boto3 S3 client
+        bucket: Bucket name
+        key: Object key
+        start: First byte
+        end: Byte after the last one
+
+    Returns:
+        The requested bytes
+    """
+    response = s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end - 1}")
+    return response["Body"].read()
+
+
+def is_streamable(s3_client: Any, bucket: str, key: str) -> bool:
+    """
+    Check whether a video can be decoded while it is still being downloaded
+
+    MP4/MOV files are only streamable if their index ('moov' box) precedes the
+    media data ('mdat' box), i.e. they were written with faststart. Only the
+    top-level box headers are fetched. Other containers (MPEG-TS, Matroska,
+    WebM) can be decoded from the start.
+
+    Args:
+        s3_client: boto3 S3 client
+        bucket: Bucket name
+        key: Object key
+
+    Returns:
+        True if the object can be decoded as a stream
+    """
+    size = s3_client.head_object(Bucket=bucket, Key=key)["ContentLength"]
+    offset = 0
+    for _ in range(MAX_PROBED_BOXES):
+        if offset + 8 > size:
+            return False
+        header = get_range(s3_client, bucket, key, offset, min(offset + 16, size))
+        box_size, box_type = struct.unpack(">I4s", header[:8])
+        if offset == 0 and box_type != b"ftyp":
+            return True
+        if box_type == b"moov":
+            return True
+        if box_type == b"mdat":
+            return False
+        if box_size == 1 and len(header) >= 16:
+            box_size = struct.unpack(">Q", header[8:16])[0]
+        if box_size < 8:
+            # Box extends to the end of the file or the header is corrupt
+            return False
+        offset += box_size
+    return False
+
+
+def _write_all(fd: int, data: bytes) -> None:
+    """Write a buffer to a file descriptor, handling partial writes"""
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+class StreamingDownload:
+    """
+    Download an object with parallel ranged GETs into a named pipe and a local file
+
+    Parts are fetched concurrently but written in order, so a reader of the
+    pipe (cv2.VideoCapture) can decode frames while later parts are still
+    arriving. At most ``concurrency`` parts are held in memory. The local file
+    receives the same bytes and is complete once wait() returns. If the reader
+    closes the pipe early, the download continues into the local file only.
+    """
+
+    def __init__(self, s3_client: Any, bucket: str, key: str, local_path: str,
+                 part_size: int = 8 * 1024 * 1024, concurrency: int = 4) -> None:
+        """
+        Initialize the download
+
+        Args:
+            s3_client: boto3 S3 client
+            bucket: Bucket name
+            key: Object key
+            local_path: Path of the local copy of the object
+            part_size: Bytes per ranged GET
+            concurrency: Number of ranged GETs in flight
+        """
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.local_path = local_path
+        self.part_size = part_size
+        self.concurrency = max(1, concurrency)
+        # The pipe keeps the object's name so that video_id stays the S3 key
+        self.pipe_path = os.path.join(os.path.dirname(local_path) or ".", "stream", os.path.basename(local_path))
+        self.size = 0
+        self.bytes_downloaded = 0
+        self._error: Optional[BaseException] = None
+        self._aborted = threading.Event()
+        self._pipe_opened = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"stream-{key}", daemon=True)
+
+    def start(self) -> str:
+        """
+        Start downloading
+
+        Returns:
+            Path of the named pipe to decode the video from
+        """
+        os.makedirs(os.path.dirname(self.pipe_path), exist_ok=True)
+        if os.path.exists(self.pipe_path):
+            os.remove(self.pipe_path)
+        os.mkfifo(self.pipe_path)
+        self.size = self.s3_client.head_object(Bucket=self.bucket, Key=self.key)["ContentLength"]
+        self._thread.start()
+        return self.pipe_path
+
+    def _run(self) -> None:
+        # Blocks until the reader opens the pipe
+        pipe_fd = os.open(self.pipe_path, os.O_WRONLY)
+        self._pipe_opened.set()
+        try:
+            ranges = iter([
+                (start, min(start + self.part_size, self.size))
+                for start in range(0, self.size, self.part_size)
+            ])
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f"range-{self.key}") as pool, \
+                    open(self.local_path, "wb") as local_file:
+                pending = deque()
+
+                def submit_next() -> None:
+                    byte_range = next(ranges, None)
+                    if byte_range is not None:
+                        pending.append(pool.submit(get_range, self.s3_client, self.bucket, self.key, *byte_range))
+
+                for _ in range(self.concurrency):
+                    submit_next()
+
+                while pending and not self._aborted.is_set():
+                    data = pending.popleft().result()
+                    submit_next()
+                    local_file.write(data)
+                    self.bytes_downloaded += len(data)
+                    if pipe_fd is not None:
+                        try:
+                            _write_all(pipe_fd, data)
+                        except BrokenPipeError:
+                            logger.debug(f"Reader of {self.pipe_path} closed the pipe")
+                            os.close(pipe_fd)
+                            pipe_fd = None
+                for future in pending:
+                    future.cancel()
+        except BaseException as e:
+            logger.error(f"Streaming download of {self.key} failed: {e}")
+            self._error = e
+        finally:
+            if pipe_fd is not None:
+                os.close(pipe_fd)
+
+    def _release_writer(self) -> None:
+        """Unblock the writer if no reader ever opened the pipe"""
+        while self._thread.is_alive() and not self._pipe_opened.is_set():
+            fd = os.open(self.pipe_path, os.O_RDONLY | os.O_NONBLOCK)
+            os.close(fd)
+            time.sleep(0.05)
+
+    def abort(self) -> None:
+        """Stop downloading and remove the pipe"""
+        self._aborted.set()
+        self._release_writer()
+        self._thread.join()
+        self._remove_pipe()
+
+    def wait(self) -> str:
+        """
+        Wait for the download to finish and remove the pipe
+
+        Returns:
+            Absolute path of the complete local copy
+
+        Raises:
+            IOError: If the download failed
+        """
+        self._release_writer()
+        self._thread.join()
+        self._remove_pipe()
+        if self._error is not None:
+            raise IOError(f"Streaming download of {self.key} failed: {self._error}") from self._error
+        return os.path.abspath(self.local_path)
+
+    def _remove_pipe(self) -> None:
+        if os.path.exists(self.pipe_path):
+            os.remove(self.pipe_path)
+
+
+class Prefetcher:
+    """
+    Download videos in a background thread ahead of their processing
+    """
+
+    def __init__(self) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self._downloads: Dict[str, Future] = {}
+
+    def prefetch(self, s3_key: str, local_path: str) -> None:
+        """
+        Start downloading a video in the background
+
+        Args:
+            s3_key: The object key in S3/MinIO
+            local_path: The local path to save the file
+        """
+        logger.info(f"Prefetching {s3_key}")
+        self._downloads[s3_key] = self._executor.submit(download_from_s3, s3_key, local_path)
+
+    def take(self, s3_key: str) -> Optional[Future]:
+        """
+        Take the prefetch of a video
+
+        Args:
+            s3_key: The object key in S3/MinIO
+
+        Returns:
+            Future resolving to the downloaded path (None on failure), or None if not prefetched
+        """
+        return self._downloads.pop(s3_key, None)
+
+    def shutdown(self) -> None:
+        """Wait for running prefetches and stop the background thread"""
+        self._executor.shutdown(wait=True)
+
+
+def _record_download(metrics: Optional[Any], start: float, size: int) -> None:
+    """Record the wait for a video to become decodable, and its size"""
+    if metrics is not None:
+        metrics.observe("s3_download", time.perf_counter() - start)
+        metrics.count("s3_download_bytes", size)
+
+
+@contextmanager
+def open_video_source(s3_key: str, local_path: str, stream: Optional[bool] = None,
+                      prefetched: Optional[Future] = None, metrics: Optional[Any] = None) -> Iterator[str]:
+    """
+    Get a path from which an uploaded video can be decoded as early as possible
+
+    A prefetched video is used once its download has finished. Otherwise, if
+    streaming is enabled and the object is streamable, a named pipe is
+    returned that is fed while the object downloads; the object is also saved
+    to local_path. In all other cases the object is downloaded to local_path
+    first.
+
+    Args:
+        s3_key: The object key in S3/MinIO
+        local_path: The local path to save the file
+        stream: Decode while downloading (default: config.S3_STREAMING)
+        prefetched: Download started by a Prefetcher
+        metrics: metrics.StageMetrics recording the time until the video can be
+            decoded as the 's3_download' stage (for a prefetched video, only the
+            remaining wait; for a streamed one, until the stream starts)
+
+    Yields:
+        Path to open with cv2.VideoCapture
+
+    Raises:
+        IOError: If the download failed
+    """
+    if stream is None:
+        stream = config.S3_STREAMING
+    os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+    start = time.perf_counter()
+
+    if prefetched is not None:
+        video_path = prefetched.result()
+        if not video_path:
+            raise IOError(f"Prefetch of {s3_key} failed")
+        _record_download(metrics, start, os.path.getsize(video_path))
+        yield video_path
+        return
+
+    s3_client, bucket = get_s3_client(), get_bucket_name()
+    if stream and is_streamable(s3_client, bucket, s3_key):
+        download = StreamingDownload(
+            s3_client, bucket, s3_key, local_path,
+            part_size=config.S3_STREAM_PART_SIZE, concurrency=config.S3_STREAM_CONCURRENCY
+        )
+        logger.info(f"Streaming {s3_key} while decoding")
+        pipe_path = download.start()
+        _record_download(metrics, start, download.size)
+        try:
+            yield pipe_path
+        except BaseException:
+            download.abort()
+            raise
+        # A failed download truncates the stream, so the results are incomplete
+        download.wait()
+        return
+
+    if stream:
+        logger.info(f"{s3_key} is not streamable (index at the end of the file); downloading it first")
+    video_path = download_from_s3(s3_key, local_path)
+    if not video_path:
+        raise IOError(f"Download of {s3_key} failed")
+    _record_download(metrics, start, os.path.getsize(video_path))
+    yield video_path
@@ -3,40 +3,87 @@ Video processor for object detection and tracking
 """
 import os
 import sys
-import uuid
+import threading
 import time
-from typing import Dict, List, Tuple, Any, Optional, Union
+from typing import Dict, List, Tuple, Any, Iterator, Optional, Union
 import cv2
+import numpy as np
 import logging
-from datetime import datetime
+from functools import lru_cache
 from tqdm import tqdm
-import boto3
-from botocore.config import Config as BotoCoreConfig
-from dotenv import load_dotenv
-
-# Optional imports for YOLO-World (requires inference package)
-try:
-    import supervision as sv
-    from inference.models.yolo_world.yolo_world import YOLOWorld
-    YOLO_WORLD_AVAILABLE = True
-except ImportError:
-    YOLO_WORLD_AVAILABLE = False
-    print("Warning: YOLO-World not available. Using regular YOLO from Ultralytics instead.")
 
 # Add the project root to Python path when running directly
 if __name__ == "__main__":
     project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     sys.path.insert(0, project_root)
 
-from ML.utils.connections import objects_collection, get_database, get_s3_client
+from ML.utils.connections import get_collection, get_database, get_detection_collection, get_s3_client, get_transfer_config
+from ML.utils.config import config
+from ML.utils.downloads import open_video_source
 from ML.utils.logging_config import setup_logging, get_logger
+from ML.annotated_output import (create_annotated_writer, draw_frame_detections, draw_supervision_detections,
+                                 segment_prefix)
+from ML.ffmpeg_capture import open_capture
+from ML.columnar import ms_to_timestamp, timestamp_to_ms
+from ML.detection_sink import DetectionSink, MemoryDetectionSink, get_sink
+from ML.metrics import StageMetrics, profile
+from ML.models.detections import Detections
+from ML.parallel_render import (RenderTask, plan_render_segments, render_parallel, resolve_workers, segment_path,
+                                split_payloads)
+from ML.pipeline import StagedPipeline
+from ML.sampling import FrameSampler, probe_keyframes
+from ML.tracking import TrackUpdate, get_tracker
+from ML.sharding import concat_videos, is_open_at_end, match_boundary_tracks, plan_shards, run_shards
+from ML.video_summary import SUMMARIES_COLLECTION, SummarizingSink, build_video_summary, ensure_indexes, write_video_summary
+from ML.spatial_index import SPATIAL_INDEX_COLLECTION, SpatialIndexSink, build_spatial_index, ensure_spatial_indexes, write_spatial_index
 
-# Set up logging
-setup_logging(log_file='logs/video_processing.log')
 logger = get_logger(__name__)
 
+
+@lru_cache(maxsize=None)
+def yolo_world_available() -> bool:
+    """
+    Check once whether YOLO-World can be used (requires the inference and supervision packages)
+    
+    Returns:
+        True if both packages can be imported
+    """
+    try:
+        import supervision  # noqa: F401
+        from inference.models.yolo_world.yolo_world import YOLOWorld  # noqa: F401
+        return True
+    except ImportError:
+        logger.warning("YOLO-World not available. Using regular YOLO from Ultralytics instead.")
+        return False
+
+
+class ProcessingCancelled(RuntimeError):
+    """Raised when the caller of process_video asked it to stop, e.g. because its lease on the video was lost"""
+
+
+def raise_if_cancelled(cancelled: Optional[threading.Event], where: str) -> None:
+    """
+    Stop processing a video if its caller asked for it
+
+    Args:
+        cancelled: Event set by the caller to stop processing (None = never)
+        where: Point of processing, for the error message
+
+    Raises:
+        ProcessingCancelled: If cancelled is set
+    """
+    if cancelled is not None and cancelled.is_set():
+        raise ProcessingCancelled(f"Processing cancelled {where}")
+
+
 # Load environment variables if running directly
 if __name__ == "__main__":
+    import boto3
+    from botocore.config import Config as BotoCoreConfig
+    from dotenv import load_dotenv
+    
+    # Set up logging
+    setup_logging(log_file='logs/video_processing.log')
     load_dotenv()
     # AWS configuration
     AWS_ACCESS_KEY = os.getenv("AWS_ACCESS_KEY")
@@ -67,6 +114,39 @@ if __name__ == "__main__":
             s3_client = None
             logger.warning(f"Failed to get S3 client: {str(e)}. S3 functionality disabled.")
 
+class VideoContext:
+    """
+    Tracking state for the video currently being processed
+    """
+    
+    def __init__(self, video_name: str, frame_width: int, frame_height: int,
+                 sink: DetectionSink, tracker: Any, timeout_ms: float,
+                 interpolate: bool = False, metrics: Optional[StageMetrics] = None) -> None:
+        """
+        Initialize the video context
+        
+        Args:
+            video_name: Name of the video, stored as video_id on instances
+            frame_width: Width of the frames
+            frame_height: Height of the frames
+            sink: Detection sink that persists instances and their frames
+            tracker: Tracker matching detections to active instances
+            timeout_ms: Time after which an unmatched instance expires
+            interpolate: Whether to fill frames skipped by sampling with interpolated boxes
+            metrics: Metrics receiving the tracking times (default: not recorded)
+        """
+        self.video_name = video_name
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+        self.sink = sink
+        self.timeout_ms = timeout_ms
+        self.interpolate = interpolate
+        self.metrics = metrics if metrics is not None else StageMetrics(enabled=False)
+        
+        # In-memory tracker for active objects
+        self.tracker = tracker
+
+
 class VideoProcessor:
     """
     Video processor for object detection and tracking
@@ -75,6 +155,17 @@ class VideoProcessor:
     def __init__(self, model_name: str = "yolo", model_path: Optional[str] = None, 
                  device: str = "cpu", confidence_threshold: float = 0.25, 
                  timeout_threshold: int = 2000, iou_threshold: float = 0.3,
+                 sink: Optional[DetectionSink] = None,
+                 batch_size: Optional[int] = None,
+                 use_pipeline: bool = False,
+                 sampling_mode: Optional[str] = None,
+                 sample_stride: Optional[int] = None,
+                 tracker: Optional[str] = None,
+                 num_shards: Optional[int] = None,
+                 annotated_output: Optional[str] = None,
+                 write_summary: Optional[bool] = None,
+                 write_spatial_index: Optional[bool] = None,
+                 decode_backend: Optional[str] = None,
                  **kwargs: Any) -> None:
         """
         Initialize the video processor
@@ -86,75 +177,208 @@ class VideoProcessor:
             confidence_threshold: Minimum confidence threshold for detections
             timeout_threshold: Timeout threshold for tracking in milliseconds
             iou_threshold: IoU threshold for tracking
+            sink: Detection sink used to persist detections (default: a new
+                sink per video built from the detection sink configuration)
+            batch_size: Number of frames per inference call (default: config.INFERENCE_BATCH_SIZE)
+            use_pipeline: Run decode, inference, tracking and encoding as a threaded pipeline
+            sampling_mode: Frames to run the detector on: 'all', 'stride' or 'keyframe'
+                (default: config.SAMPLING_MODE)
+            sample_stride: Run the detector every Nth frame in 'stride' mode
+                (default: config.SAMPLE_STRIDE)
+            tracker: Tracker backend: 'iou' or 'sort' (default: config.TRACKER_BACKEND)
+            num_shards: Number of time shards processed in parallel for long videos
+                (default: config.VIDEO_SHARDS)
+            annotated_output: Annotated video to produce: 'full', 'parallel' (one file
+                rendered in parallel segments after tracking), 'segments' (uploaded
+                to S3 while encoding) or 'none' (default: config.ANNOTATED_OUTPUT)
+            write_summary: Write a per-video summary document when a video finishes
+                (default: config.VIDEO_SUMMARY)
+            write_spatial_index: Write a per-video spatial grid index when a video finishes
+                (default: config.SPATIAL_INDEX)
+            decode_backend: Frame decoder: 'opencv' or 'ffmpeg' (scaled, threaded
+                decoding in a subprocess; default: config.DECODE_BACKEND)
             **kwargs: Additional model-specific parameters
         """
-        from ML.models.yolo_detector import YOLODetector
+        from ML.models.registry import inference_lock, load_model
         
         self.model_name = model_name
-        self.use_yolo_world = model_name == "yolo_world" and YOLO_WORLD_AVAILABLE
+        self.use_yolo_world = model_name == "yolo_world" and yolo_world_available()
         
+        # Models come from the process-wide cache, so only the first processor pays for loading
         if self.use_yolo_world:
-            # Initialize YOLO-World model
-            logger.info("Initializing YOLO-World model")
-            self.model = YOLOWorld(model_id="yolo_world/l")
-            
             # Load custom classes
             classes_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "classes.csv")
+            self.class_list = None
             try:
                 with open(classes_path, "r") as f:
                     self.class_list = [line.strip() for line in f if line.strip()]
-                
-                # Set custom classes
-                self.model.set_classes(self.class_list)
-                logger.info(f"Loaded {len(self.class_list)} custom classes for YOLO-World model")
             except Exception as e:
                 logger.error(f"Failed to load custom classes: {str(e)}")
+            
+            # Initialize YOLO-World model
+            logger.info("Initializing YOLO-World model")
+            self.model = load_model(
+                "yolo_world", device=device, classes=self.class_list,
+                warmup=config.MODEL_WARMUP, cache=config.MODEL_CACHE
+            )
                 
-            # Initialize annotators
-            self.box_annotator = sv.BoxAnnotator(thickness=2)
-            self.label_annotator = sv.LabelAnnotator()
         else:
             # Initialize regular YOLO model (Ultralytics)
             if model_path is None:
                 model_path = "yolo11n.pt"  # Default to YOLO11 nano model
             logger.info(f"Initializing Ultralytics YOLO model from {model_path}")
-            self.model = YOLODetector(
-                model_path=model_path,
-                device=device,
-                confidence_threshold=confidence_threshold,
-                **kwargs
+            self.model = load_model(
+                "yolo", model_path=model_path, device=device,
+                warmup=config.MODEL_WARMUP, cache=config.MODEL_CACHE,
+                confidence_threshold=confidence_threshold, **kwargs
             )
+        # Processors in different threads may share the model
+        self.model_lock = inference_lock(self.model)
         
         self.device = device
         self.confidence_threshold = confidence_threshold
         
+        # Statistics and stage metrics of the most recently processed video
+        self.last_video_stats: Dict[str, Any] = {}
+        self.last_video_metrics: Optional[StageMetrics] = None
+        self.metrics_enabled = config.METRICS_ENABLED
+        
+        # Optional per-video profiling
+        self.profiler = config.PROFILER
+        self.profile_dir = config.PROFILE_DIR
+        
         # Tracking parameters
         self.timeout_threshold = timeout_threshold
         self.iou_threshold = iou_threshold
+        self.tracker_name = tracker or config.TRACKER_BACKEND
+        
+        # Persistence
+        self.sink = sink
+        
+        # Inference batching
+        self.batch_size = max(1, batch_size or config.INFERENCE_BATCH_SIZE)
+        
+        # Threaded pipeline
+        self.use_pipeline = use_pipeline
+        self.pipeline_queue_size = config.PIPELINE_QUEUE_SIZE
+        
+        # Frame sampling
+        self.sampling_mode = sampling_mode or config.SAMPLING_MODE
+        self.sample_stride = sample_stride or config.SAMPLE_STRIDE
+        self.keyframe_max_gap = config.KEYFRAME_MAX_GAP
+        
+        # Annotated output
+        self.annotated_output = annotated_output or config.ANNOTATED_OUTPUT
+        self.annotated_segment_seconds = config.ANNOTATED_SEGMENT_SECONDS
+        self.render_workers = config.RENDER_WORKERS
+        
+        # Per-video summary; the query indexes are created before the first summary
+        self.write_summary = config.VIDEO_SUMMARY if write_summary is None else write_summary
+        self.indexes_ensured = False
+        
+        # Per-video spatial grid index
+        self.write_spatial_index = config.SPATIAL_INDEX if write_spatial_index is None else write_spatial_index
+        self.spatial_grid_size = config.SPATIAL_GRID_SIZE
+        self.spatial_bucket_seconds = config.SPATIAL_BUCKET_SECONDS
+        self.spatial_indexes_ensured = False
+        
+        # Decoding
+        self.decode_backend = decode_backend or config.DECODE_BACKEND
+        self.decode_width = config.DECODE_WIDTH
+        self.decode_fps = config.DECODE_FPS
+        self.decode_threads = config.DECODE_THREADS
+        
+        # Time sharding
+        self.num_shards = num_shards or config.VIDEO_SHARDS
+        self.min_shard_seconds = config.MIN_SHARD_SECONDS
+        # Arguments for building the same processor in shard worker processes
+        self.processor_kwargs = dict(
+            model_name=model_name, model_path=model_path, device=device,
+            confidence_threshold=confidence_threshold, timeout_threshold=timeout_threshold,
+            iou_threshold=iou_threshold, batch_size=self.batch_size, use_pipeline=use_pipeline,
+            sampling_mode=self.sampling_mode, sample_stride=self.sample_stride,
+            tracker=self.tracker_name, annotated_output=self.annotated_output,
+            decode_backend=self.decode_backend, **kwargs
+        )
     
-    def process_video(self, video_path: str) -> str:
+    def open_capture(self, video_path: str) -> Any:
+        """
+        Open a video with the configured decode backend
+        
+        Args:
+            video_path: Path to the video file
+            
+        Returns:
+            A cv2.VideoCapture or an ffmpeg_capture.FFmpegCapture
+        """
+        # The ffmpeg backend reuses frame buffers, so it needs one per frame in flight
+        if self.use_pipeline:
+            num_buffers = self.batch_size * (3 * self.pipeline_queue_size + 5)
+        else:
+            num_buffers = self.batch_size + 1
+        return open_capture(
+            video_path, self.decode_backend, width=self.decode_width, fps=self.decode_fps,
+            threads=self.decode_threads, num_buffers=num_buffers
+        )
+    
+    def _create_sink(self) -> DetectionSink:
+        """
+        Get the detection sink to use for one video
+        
+        Returns:
+            The configured sink, or a new sink built from the configuration
+        """
+        if self.sink is not None:
+            return self.sink
+        sink_config = config.get_sink_config()
+        sink_name = sink_config.pop("sink_name")
+        return get_sink(sink_name, get_detection_collection(), **sink_config)
+    
+    def process_video(self, video_path: str, metrics: Optional[StageMetrics] = None,
+                      cancelled: Optional[threading.Event] = None) -> Optional[str]:
         """
         Process a video file for object detection and tracking
         
+        Long videos are split into time shards that are processed in parallel
+        when num_shards > 1 (see sharding.py). The time spent in each stage is
+        recorded in metrics (see metrics.py), and the video is profiled if
+        PROFILER is set.
+        
+        Processing stops before the next batch of frames, shard result or
+        final write once cancelled is set; detections still buffered in the
+        sink are then dropped.
+        
         Args:
             video_path: Path to the video file
+            metrics: Metrics receiving the stage timings and counters of the
+                video (default: new metrics); kept in last_video_metrics
+            cancelled: Event set by the caller to stop processing
             
         Returns:
-            Path to the annotated video
+            Path to the annotated video, the S3 key prefix of its segments in
+            'segments' mode, or None in 'none' mode
+            
+        Raises:
+            ProcessingCancelled: If cancelled was set before processing finished
         """
-        cap = cv2.VideoCapture(video_path)
+        if metrics is None:
+            metrics = StageMetrics(self.metrics_enabled)
+        self.last_video_metrics = metrics
+        with profile(os.path.basename(video_path), self.profiler, self.profile_dir):
+            return self._process_video(video_path, metrics, cancelled)
+    
+    def _process_video(self, video_path: str, metrics: StageMetrics,
+                       cancelled: Optional[threading.Event] = None) -> Optional[str]:
+        """Process a video file, recording stage timings in metrics (see process_video)"""
+        start_time = time.perf_counter()
+        cap = self.open_capture(video_path)
         if not cap.isOpened():
             error_msg = f"Could not open video file: {video_path}"
             logger.error(error_msg)
             raise ValueError(error_msg)
         
-        frame_number = 0
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
         
-        # Get frame dimensions
-        frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-
         # Get Frames Per Second (FPS)
         fps = cap.get(cv2.CAP_PROP_FPS)
         if fps == 0:
@@ -168,241 +392,592 @@ class VideoProcessor:
             annotated_video_name += '.mp4'
         annotated_video_path = os.path.join(os.path.dirname(video_path), annotated_video_name)
 
-        # Use MP4V codec for compatibility
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # Codec for MP4
-        out = cv2.VideoWriter(annotated_video_path, fourcc, fps, (frame_width, frame_height))
-        logger.info(f"Initialized VideoWriter for annotated video at {annotated_video_path}")
-
-        # Temporary in-memory tracker for active objects
-        # Format: {object_name: [{"instance_id": str, "last_frame": int, "last_timestamp_ms": float, "last_box": list}, ...]}
-        active_objects: Dict[str, List[Dict[str, Any]]] = {}
-
-        with tqdm(total=total_frames, desc=f"Processing {video_name}", unit="frame") as pbar:
-            while cap.isOpened():
-                ret, frame = cap.read()
-                if not ret:
-                    break
-
-                # Run object detection
-                if self.use_yolo_world:
-                    # YOLO-World path
-                    results = self.model.infer(frame)
-                    detections = sv.Detections.from_inference(results)
-                else:
-                    # Ultralytics YOLO path
-                    results = self.model.predict(frame, verbose=False)
-                    # Extract detections manually
-                    detections = self._extract_detections_from_yolo(results, frame)
-                    # Clean up YOLO results to free memory
-                    del results
-                
-                # Convert frame to RGB for annotation (if needed)
-                # This helps manage memory by not keeping multiple copies
-                
-                # Extract frame timestamp
-                timestamp_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
-                timestamp = convert_ms_to_timestamp(timestamp_ms)
-
-                # Process detections
-                if len(detections) > 0:
-                    for i in range(len(detections)):
-                        # Extract object data
-                        confidence = float(detections.confidence[i])
-                        
-                        # Skip low confidence detections
-                        if confidence < self.confidence_threshold:
-                            continue
-                            
-                        # Safely convert box coordinates to list
-                        box_coords = detections.xyxy[i]
-                        if hasattr(box_coords, 'tolist'):
-                            box_coordinates = box_coords.tolist()
-                        elif hasattr(box_coords, 'cpu'):
-                            box_coordinates = box_coords.cpu().numpy().tolist()
-                        else:
-                            box_coordinates = list(box_coords)
-                        
-                        label = detections.data.get('class_name', [])[i] if 'class_name' in detections.data else "unknown"
-                        
-                        relative_position = calculate_relative_position(box_coordinates, frame_width, frame_height)
-
-                        logger.debug(
-                            f"Frame {frame_number}: Detected {label} with confidence {confidence:.2f}, "
-                            f"Box: {box_coordinates}, Relative Position: {relative_position}"
-                        )
-
-                        # Initialize the list for this label if not present
-                        if label not in active_objects:
-                            active_objects[label] = []
-
-                        matched_instance = None
-                        max_iou = 0
-
-                        # Iterate over existing active instances of this label to find a match
-                        for obj in active_objects[label]:
-                            iou = compute_iou(box_coordinates, obj["last_box"])
-                            if iou > self.iou_threshold and iou > max_iou:
-                                max_iou = iou
-                                matched_instance = obj
-
-                        if matched_instance:
-                            # Update existing instance
-                            matched_instance["last_frame"] = frame_number
-                            matched_instance["last_timestamp_ms"] = timestamp_ms
-                            matched_instance["last_box"] = box_coordinates
-                            matched_instance["end_time"] = timestamp_to_seconds(timestamp)  # Update end_time
-
-                            # Add frame data to MongoDB
-                            objects_collection.update_one(
-                                {"_id": matched_instance["instance_id"]},
-                                {"$push": {"frames": {
-                                    "frame": frame_number,
-                                    "timestamp": timestamp,
-                                    "box": box_coordinates,
-                                    "relative_position": relative_position,
-                                    "confidence": confidence
-                                }},
-                                "$set": {"end_time": timestamp_to_seconds(timestamp)}  # Update end_time
-                                }
-                            )
-                        else:
-                            # Create a new instance
-                            instance_id = str(uuid.uuid4())  # Unique identifier for the new instance
-                            new_instance = {
-                                "instance_id": instance_id,
-                                "last_frame": frame_number,
-                                "start_time": timestamp_to_seconds(timestamp),  # Set start_time
-                                "end_time": timestamp_to_seconds(timestamp),    # Initialize end_time
-                                "last_timestamp_ms": timestamp_ms,
-                                "last_box": box_coordinates
-                            }
-                            active_objects[label].append(new_instance)
-
-                            # Create a new document in MongoDB for this instance
-                            new_doc = {
-                                "_id": instance_id,
-                                "video_id": video_name,
-                                "object_name": label,
-                                "start_time": timestamp_to_seconds(timestamp), 
-                                "end_time": timestamp_to_seconds(timestamp),    # Initialize end_time
-                                "frames": [{
-                                    "frame": frame_number,
-                                    "timestamp": timestamp,
-                                    "box": box_coordinates,
-                                    "relative_position": relative_position,
-                                    "confidence": confidence
-                                }]
-                            }
-                            objects_collection.insert_one(new_doc)
-
-                            logger.info(f"Created new instance ID {instance_id} for label '{label}'")
-
-                # Annotate the frame with bounding boxes and labels
-                annotated_frame = self.annotate_frame(frame, detections)
-
-                # Write the annotated frame to the output video
-                out.write(annotated_frame)
-                
-                # Clean up frame and annotated frame to free memory
-                del annotated_frame
-
-                # Remove expired objects (based on timeout threshold)
-                for label, instances in list(active_objects.items()):
-                    active_objects[label] = [
-                        obj for obj in instances 
-                        if (timestamp_ms - obj["last_timestamp_ms"]) <= self.timeout_threshold
-                    ]
-                    if not active_objects[label]:
-                        del active_objects[label]
-
-                # Increment frame number
-                frame_number += 1
-
-                # Update the progress bar
-                pbar.update(1)
-                
-                # Periodic memory cleanup to prevent OOM
-                if frame_number % 100 == 0:
-                    import gc
-                    gc.collect()  # Force garbage collection every 100 frames
-                    logger.debug(f"Performed garbage collection at frame {frame_number}")
-
-        # Release resources
-        cap.release()
-        out.release()
-        logger.info(f"Annotated video saved at {annotated_video_path}")
+        frame_size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        sink = self._create_sink()
+        # Wrappers that collect the summary and spatial index while detections are written
+        summary_sink = spatial_sink = None
+        if self.write_spatial_index:
+            sink = spatial_sink = SpatialIndexSink(sink, self.spatial_grid_size, self.spatial_bucket_seconds)
+        if self.write_summary:
+            sink = summary_sink = SummarizingSink(sink)
+        sink.set_frame_size(*frame_size)
+        sink.set_metrics(metrics)
+        # Streamed videos (named pipes) cannot be seeked, so they are never sharded
+        shards = plan_shards(total_frames, fps, self.num_shards, self.min_shard_seconds)
+        if len(shards) > 1 and os.path.isfile(video_path):
+            # Process time ranges in parallel processes and stitch their tracks
+            cap.release()
+            frames_processed = self._process_video_sharded(
+                video_path, shards, sink, annotated_video_path, frame_size, metrics, cancelled
+            )
+        else:
+            frames_processed, _, _ = self.process_frames(
+                cap, video_path, sink, annotated_video_path, 0, total_frames if total_frames > 0 else None,
+                metrics=metrics, cancelled=cancelled
+            )
+            cap.release()
+
+        # Write any buffered detections
+        raise_if_cancelled(cancelled, f"before the final write of {video_name}")
+        sink.close()
+        sink.set_metrics(None)
+        logger.info(f"Detection sink stats for {video_name}: {sink.get_stats()}")
+        duration = total_frames / fps if total_frames > 0 else 0.0
+        if summary_sink is not None:
+            self._write_summary(video_name, summary_sink, duration, fps)
+        if spatial_sink is not None:
+            self._write_spatial_index(video_name, spatial_sink, duration)
+        
+        elapsed = time.perf_counter() - start_time
+        self.last_video_stats = {
+            "frames": frames_processed,
+            "seconds": elapsed,
+            "fps": frames_processed / elapsed if elapsed > 0 else 0.0,
+        }
+        if metrics.enabled:
+            stages = metrics.summary()["stages"]
+            logger.info(f"Stage times for {video_name}: " + ", ".join(
+                f"{stage} {stats['total_seconds']:.2f}s (p50 {stats['p50_ms']:.2f} ms, p99 {stats['p99_ms']:.2f} ms)"
+                for stage, stats in stages.items()
+            ))
         
+        if self.annotated_output == "none":
+            return None
+        if self.annotated_output == "segments":
+            logger.info(f"Annotated segments uploaded under {segment_prefix(video_name)}")
+            return segment_prefix(video_name)
+        logger.info(f"Annotated video saved at {annotated_video_path}")
         return annotated_video_path
     
-    def annotate_frame(self, frame, detections):
+    def _write_summary(self, video_name: str, sink: SummarizingSink, duration: float, fps: float) -> None:
         """
-        Draw bounding boxes and labels on the frame based on detection results.
-        Supports both YOLO-World (with supervision) and Ultralytics YOLO.
+        Write the summary document of a processed video
+        
+        Args:
+            video_name: Name of the video, stored as video_id on instances
+            sink: Summarizing sink that received the video's instances
+            duration: Duration of the video in seconds
+            fps: Frame rate of the video
         """
-        if self.use_yolo_world:
-            # YOLO-World annotation using supervision
-            labels = [
-                f"{detections.data['class_name'][i]} {detections.confidence[i]:.2f}"
-                for i in range(len(detections)) if detections.confidence[i] >= self.confidence_threshold
-            ]
+        if not self.indexes_ensured:
+            ensure_indexes(get_collection("objects"), get_collection(SUMMARIES_COLLECTION))
+            self.indexes_ensured = True
+        summary = build_video_summary(video_name, list(sink.instances.values()), duration, fps)
+        write_video_summary(get_collection(SUMMARIES_COLLECTION), summary)
+        logger.info(f"Video summary for {video_name}: {len(summary['classes'])} classes, "
+                    f"{summary['instances']} instances")
+    
+    def _write_spatial_index(self, video_name: str, sink: SpatialIndexSink, duration: float) -> None:
+        """
+        Write the spatial grid index of a processed video
+        
+        Args:
+            video_name: Name of the video, stored as video_id on instances
+            sink: Spatial index sink that received the video's instances
+            duration: Duration of the video in seconds
+        """
+        if not self.spatial_indexes_ensured:
+            ensure_spatial_indexes(get_collection(SPATIAL_INDEX_COLLECTION))
+            self.spatial_indexes_ensured = True
+        index = build_spatial_index(video_name, sink.cells, duration, sink.grid_size, sink.bucket_seconds)
+        write_spatial_index(get_collection(SPATIAL_INDEX_COLLECTION), index)
+        logger.info(f"Spatial index for {video_name}: {index['num_buckets']} buckets of "
+                    f"{index['grid_size']}x{index['grid_size']} cells")
+    
+    def process_frames(self, cap: Any, video_path: str, sink: DetectionSink,
+                       annotated_video_path: str, start_frame: int, end_frame: Optional[int],
+                       progress_position: int = 0,
+                       metrics: Optional[StageMetrics] = None,
+                       cancelled: Optional[threading.Event] = None) -> Tuple[int, float, float]:
+        """
+        Detect, track and annotate a range of frames of an opened video
+        
+        Args:
+            cap: Opened cv2.VideoCapture or FFmpegCapture (see open_capture)
+            video_path: Path to the video file
+            sink: Detection sink that persists instances and their frames
+            annotated_video_path: Path of the annotated video to write
+            start_frame: First frame to process; the capture is seeked to it
+            end_frame: Frame at which to stop (exclusive; None reads to the end)
+            progress_position: Line of the progress bar (for parallel shards)
+            metrics: Metrics receiving the stage timings (default: not recorded)
+            cancelled: Event set by the caller to stop before the next batch of frames
+            
+        Returns:
+            Number of frames covered, timestamp of the last frame read in
+            milliseconds, and the tracking timeout in milliseconds
+            
+        Raises:
+            ProcessingCancelled: If cancelled was set
+        """
+        if metrics is None:
+            metrics = StageMetrics(enabled=False)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        
+        # Get frame dimensions
+        frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+        # Get Frames Per Second (FPS)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        if fps == 0:
+            fps = 30  # Default to 30 if FPS is not available
+
+        # Frames decoded at a smaller size: boxes are scaled back to source coordinates
+        decoded_size = getattr(cap, "output_size", (frame_width, frame_height))
+        box_scale = None
+        if decoded_size != (frame_width, frame_height):
+            box_scale = np.array([frame_width / decoded_size[0], frame_height / decoded_size[1]] * 2, dtype=np.float32)
+            logger.info(f"Decoding at {decoded_size[0]}x{decoded_size[1]} (source {frame_width}x{frame_height})")
+
+        # Decide which frames to run the detector on
+        sampling_mode = self.sampling_mode
+        if sampling_mode == "keyframe" and getattr(cap, "frame_rate_reduced", False):
+            # Keyframe numbers refer to the source frame rate
+            logger.warning("Keyframe sampling is not available with DECODE_FPS; falling back to stride sampling")
+            sampling_mode = "stride"
+        sampler = FrameSampler.for_video(
+            video_path, sampling_mode, stride=self.sample_stride, max_gap=self.keyframe_max_gap
+        )
+        timeout_ms = self.timeout_threshold
+        output_fps = fps
+        if sampler.enabled:
+            # Instances must survive the gap until the next sampled frame, and the
+            # annotated video only contains the sampled frames
+            timeout_ms += sampler.max_interval(total_frames) / fps * 1000
+            output_fps = max(fps * sampler.sampled_fraction(total_frames), 1)
+            logger.info(
+                f"Sampling frames in '{sampler.mode}' mode "
+                f"({sampler.sampled_fraction(total_frames):.1%} of frames)"
+            )
+
+        # Per-video tracking state and the sink that persists instances and their frames
+        video_name = os.path.basename(video_path)
+        context = VideoContext(
+            video_name, frame_width, frame_height, sink,
+            get_tracker(self.tracker_name, iou_threshold=self.iou_threshold), timeout_ms=timeout_ms, interpolate=sampler.enabled,
+            metrics=metrics
+        )
+        
+        if self.batch_size > 1:
+            logger.info(f"Running batched inference with batch size {self.batch_size}")
+
+        # Writer for the annotated video (None skips annotation and encoding entirely)
+        out = create_annotated_writer(
+            self.annotated_output, annotated_video_path, output_fps, decoded_size,
+            video_name, segment_seconds=self.annotated_segment_seconds, metrics=metrics
+        )
+        if out is not None:
+            logger.info(f"Initialized '{self.annotated_output}' writer for annotated video at {annotated_video_path}")
+        # In 'parallel' mode the filtered detections of each written frame are kept and rendered after tracking
+        rendered_detections: Optional[Dict[int, Detections]] = {} if self.annotated_output == "parallel" else None
+
+        if start_frame > 0:
+            start_frame = seek_to_frame(cap, start_frame, fps)
+        last_timestamp_ms = 0.0
+
+        with tqdm(total=end_frame - start_frame if end_frame is not None else None, desc=f"Processing {video_name}", unit="frame",
+                  position=progress_position) as pbar:
+            def infer(batch):
+                # Run object detection on the whole batch
+                batch_detections = self.detect_batch([frame for _, _, frame in batch], metrics)
+                if box_scale is not None:
+                    batch_detections = [detections.scaled(box_scale) for detections in batch_detections]
+                return batch, batch_detections
+
+            def track(item):
+                # Track and persist in frame order
+                nonlocal last_timestamp_ms
+                batch, batch_detections = item
+                for (frame_number, timestamp_ms, _), detections in zip(batch, batch_detections):
+                    self._track_detections(context, frame_number, timestamp_ms, detections)
+
+                    # Remove expired objects (based on timeout threshold)
+                    self._expire_instances(context, timestamp_ms)
+                    last_timestamp_ms = timestamp_ms
+                    
+                    # Periodic memory cleanup to prevent OOM
+                    if (frame_number + 1) % 100 == 0:
+                        import gc
+                        gc.collect()  # Force garbage collection every 100 frames
+                        logger.debug(f"Performed garbage collection at frame {frame_number + 1}")
+                return item
+
+            def encode(item):
+                batch, batch_detections = item
+                for (frame_number, _, frame), detections in zip(batch, batch_detections):
+                    if rendered_detections is not None:
+                        if box_scale is not None:
+                            detections = detections.scaled(1 / box_scale)
+                        rendered_detections[frame_number] = detections.filter(self.confidence_threshold)
+                        continue
+                    if out is None:
+                        break
+                    if box_scale is not None:
+                        detections = detections.scaled(1 / box_scale)
+                    # Encoding is the last use of the decoded frame, so draw on it directly
+                    with metrics.timer("annotate"):
+                        frame = self.annotate_frame(frame, detections, in_place=True)
+                    with metrics.timer("encode"):
+                        out.write(frame)
+
+                # Update the progress bar, including frames skipped by sampling
+                pbar.update(batch[-1][0] + 1 - start_frame - pbar.n)
+
+            frame_batches = iter_frame_batches(cap, self.batch_size, sampler, start_frame, end_frame, metrics, cancelled)
+            if self.use_pipeline:
+                # Decode, inference, tracking and encoding each run on their own thread
+                logger.info(f"Running threaded pipeline with queue size {self.pipeline_queue_size}")
+                StagedPipeline(
+                    frame_batches, [infer, track, encode],
+                    queue_size=self.pipeline_queue_size, name=video_name
+                ).run()
+            else:
+                for batch in frame_batches:
+                    encode(track(infer(batch)))
+
+            frames_processed = pbar.n
+
+        if out is not None:
+            out.release()
+        if rendered_detections is not None:
+            with metrics.timer("render"):
+                self._render_parallel(video_path, annotated_video_path, rendered_detections, output_fps, decoded_size,
+                                      frame_rate_reduced=getattr(cap, "frame_rate_reduced", False))
+        return frames_processed, last_timestamp_ms, timeout_ms
+    
+    def _render_parallel(self, video_path: str, annotated_video_path: str, detections: Dict[int, Detections],
+                         output_fps: float, frame_size: Tuple[int, int], frame_rate_reduced: bool = False) -> None:
+        """
+        Render the annotated video in parallel segments from recorded detections
+        
+        The video is decoded again with the same backend and settings, so that
+        every frame is drawn exactly as the 'full' writer would have drawn it.
+        Segments start at keyframes when ffprobe can list them.
+        
+        Args:
+            video_path: Path to the video file
+            annotated_video_path: Path of the annotated video to write
+            detections: Frame number -> filtered detections in decoded coordinates, for every written frame
+            output_fps: Frame rate of the annotated video
+            frame_size: Width and height of the decoded frames
+            frame_rate_reduced: Frames are numbered at DECODE_FPS, so keyframe numbers do not apply
+        """
+        if not detections:
+            logger.warning(f"No frames to render for {video_path}")
+            return
+        frames = sorted(detections)
+        workers = resolve_workers(self.render_workers)
+        keyframes = None if frame_rate_reduced or workers == 1 else probe_keyframes(video_path)
+        # Segments of at least two seconds, so that process start-up and seeking stay small
+        segments = plan_render_segments(frames[0], frames[-1] + 1, workers, keyframes,
+                                        min_segment_frames=int(output_fps * 2))
+        capture_kwargs = dict(backend=self.decode_backend, width=self.decode_width, fps=self.decode_fps,
+                              threads=self.decode_threads)
+        draw = draw_supervision_detections if self.use_yolo_world else draw_frame_detections
+        tasks = [
+            RenderTask(video_path, segment_path(annotated_video_path, index), start, end, output_fps, frame_size,
+                       draw, payloads, frames=[frame for frame in frames if start <= frame < end],
+                       capture_kwargs=capture_kwargs)
+            for index, ((start, end), payloads) in enumerate(zip(segments, split_payloads(detections, segments)))
+        ]
+        started = time.perf_counter()
+        written = render_parallel(tasks, annotated_video_path, min(workers, len(tasks)))
+        logger.info(f"Rendered {written} annotated frames in {len(tasks)} segments in "
+                    f"{time.perf_counter() - started:.1f}s")
+    
+    def _process_video_sharded(self, video_path: str, shards: List[Tuple[int, int]],
+                               sink: DetectionSink, annotated_video_path: str,
+                               frame_size: Tuple[int, int], metrics: Optional[StageMetrics] = None,
+                               cancelled: Optional[threading.Event] = None) -> int:
+        """
+        Process time shards of a video in parallel processes and stitch their tracks
+        
+        Shard results are consumed in order. An instance is written to the sink
+        as soon as it is final: once its shard is done and it either ended
+        before the shard boundary or was not continued by the next shard.
+        
+        Args:
+            video_path: Path to the video file
+            shards: (start_frame, end_frame) ranges from plan_shards
+            sink: Detection sink that persists the stitched instances
+            annotated_video_path: Path of the annotated video to write
+            frame_size: Width and height of the frames
+            metrics: Metrics receiving the stage timings of all shards
+            cancelled: Event set by the caller to stop before writing the next shard's instances
+            
+        Returns:
+            Number of frames covered
+            
+        Raises:
+            ProcessingCancelled: If cancelled was set
+        """
+        video_name = os.path.basename(video_path)
+        base, ext = os.path.splitext(annotated_video_path)
+        part_paths = [f"{base}.part{index:03d}{ext}" for index in range(len(shards))]
+        interpolate = FrameSampler(self.sampling_mode, stride=self.sample_stride).enabled
+        logger.info(f"Processing {video_name} in {len(shards)} time shards")
+        
+        # Instances still tracked at the end of the previous shard
+        open_docs: List[Dict[str, Any]] = []
+        frames_processed = 0
+        # Shards already render in parallel, so each one writes its part directly
+        shard_kwargs = dict(self.processor_kwargs)
+        if shard_kwargs.get("annotated_output") == "parallel":
+            shard_kwargs["annotated_output"] = "full"
+        for result in run_shards(shard_kwargs, video_path, shards, part_paths):
+            raise_if_cancelled(cancelled, f"before writing shard {result.index + 1} of {video_name}")
+            documents = result.documents
+            if metrics is not None:
+                metrics.merge(result.metrics)
+            if open_docs:
+                matches = match_boundary_tracks(open_docs, documents, result.timeout_ms, self.iou_threshold)
+                for j, i in matches.items():
+                    documents[j] = self._stitch_instances(open_docs[i], documents[j], frame_size, interpolate)
+                continued = set(matches.values())
+                for i, doc in enumerate(open_docs):
+                    if i not in continued:
+                        sink.create_instance(doc)
+                logger.info(f"Stitched {len(matches)} instances across the shard boundary at frame {result.start_frame}")
             
-            # Filter detections based on confidence threshold
-            mask = detections.confidence >= self.confidence_threshold
-            filtered_detections = detections[mask]
-            filtered_labels = [labels[i] for i, include in enumerate(mask) if include]
+            is_last = result.index == len(shards) - 1
+            open_docs = []
+            for doc in documents:
+                if not is_last and is_open_at_end(doc, result.last_timestamp_ms, result.timeout_ms):
+                    open_docs.append(doc)
+                else:
+                    sink.create_instance(doc)
+            # Make this shard's final instances visible before the next shard is done
+            sink.flush()
+            frames_processed += result.frames
+            logger.info(f"Shard {result.index + 1}/{len(shards)} of {video_name} done ({result.frames} frames)")
+        
+        if self.annotated_output in ("full", "parallel"):
+            concat_videos(part_paths, annotated_video_path)
+            for path in part_paths:
+                os.remove(path)
+        return frames_processed
+    
+    def _stitch_instances(self, left: Dict[str, Any], right: Dict[str, Any],
+                          frame_size: Tuple[int, int], interpolate: bool) -> Dict[str, Any]:
+        """
+        Continue an instance from the previous shard with its match in the next shard
+        
+        Args:
+            left: Instance open at the end of the previous shard
+            right: Matching instance starting in the next shard
+            frame_size: Width and height of the frames
+            interpolate: Whether to fill frames skipped by sampling across the boundary
             
-            # Annotate frame with bounding boxes
-            annotated_frame = self.box_annotator.annotate(scene=frame.copy(), detections=filtered_detections)
+        Returns:
+            The left instance, extended with the right instance's frames
+        """
+        last = left["frames"][-1]
+        first = right["frames"][0]
+        if interpolate and first["frame"] - last["frame"] > 1:
+            sink = MemoryDetectionSink()
+            sink.documents[left["_id"]] = left
+            context = VideoContext(left["video_id"], frame_size[0], frame_size[1], sink, None, 0, interpolate=True)
+            update = TrackUpdate(
+                0, left["_id"], False, last["frame"], timestamp_to_ms(last["timestamp"]),
+                np.asarray(last["box"], dtype=np.float64), last["confidence"]
+            )
+            self._append_interpolated_frames(
+                context, update, first["frame"], timestamp_to_ms(first["timestamp"]),
+                first["box"], first["confidence"]
+            )
+        left["frames"].extend(right["frames"])
+        left["end_time"] = right["end_time"]
+        return left
+    
+    def detect_batch(self, frames: List[Any], metrics: Optional[StageMetrics] = None) -> List[Any]:
+        """
+        Run object detection on a batch of frames
+        
+        Args:
+            frames: Decoded frames in frame order
+            metrics: Metrics receiving the time of the model call ('inference')
+                and of building the detections ('extraction'), per batch
             
-            # Annotate frame with labels
-            if len(filtered_detections) > 0:
-                annotated_frame = self.label_annotator.annotate(
-                    scene=annotated_frame, 
-                    detections=filtered_detections, 
-                    labels=filtered_labels
+        Returns:
+            Detections for each frame, in the same order
+        """
+        if metrics is None:
+            metrics = StageMetrics(enabled=False)
+        if self.use_yolo_world:
+            # YOLO-World path
+            import supervision as sv
+            with self.model_lock, metrics.timer("inference"):
+                inference_results = [self.model.infer(frame) for frame in frames]
+            with metrics.timer("extraction"):
+                batch_detections = [
+                    Detections.from_supervision(sv.Detections.from_inference(results), self.confidence_threshold)
+                    for results in inference_results
+                ]
+        else:
+            # Ultralytics YOLO path
+            with self.model_lock, metrics.timer("inference"):
+                batch_results = self.model.predict_batch(frames, verbose=False)
+            with metrics.timer("extraction"):
+                batch_detections = [self.model.to_detections(results, self.confidence_threshold)
+                                    for results in batch_results]
+            # Clean up YOLO results to free memory
+            del batch_results
+        metrics.count("detections", sum(len(detections) for detections in batch_detections))
+        return batch_detections
+    
+    def _track_detections(self, context: "VideoContext", frame_number: int,
+                          timestamp_ms: float, detections: Detections) -> None:
+        """
+        Match the detections of one frame to active instances and persist them
+        
+        Args:
+            context: Tracking state of the video being processed
+            frame_number: Index of the frame in the video
+            timestamp_ms: Presentation timestamp of the frame in milliseconds
+            detections: Detections for the frame
+        """
+        # Frame timestamps stay numeric (whole milliseconds); sinks format them when writing
+        timestamp = int(timestamp_ms)
+        seconds = timestamp / 1000
+
+        # Skip low confidence detections
+        detections = detections.filter(self.confidence_threshold)
+        boxes = detections.xyxy.astype(np.float64)
+        confidences = detections.confidence.astype(np.float64)
+        labels = detections.labels.tolist()
+
+        # Assign every detection to an existing or new instance (frames without
+        # detections still advance motion-based trackers)
+        with context.metrics.timer("tracking"):
+            updates = context.tracker.update(frame_number, timestamp_ms, boxes, confidences, labels)
+
+        for update in updates:
+            i = update.detection_index
+            box_coordinates = boxes[i].tolist()
+            confidence = float(confidences[i])
+            label = labels[i]
+            relative_position = calculate_relative_position(box_coordinates, context.frame_width, context.frame_height)
+
+            logger.debug(
+                f"Frame {frame_number}: Detected {label} with confidence {confidence:.2f}, "
+                f"Box: {box_coordinates}, Relative Position: {relative_position}"
+            )
+
+            if not update.is_new:
+                if context.interpolate and frame_number - update.previous_frame > 1:
+                    # Fill in the frames skipped by sampling
+                    self._append_interpolated_frames(context, update, frame_number, timestamp_ms,
+                                                     box_coordinates, confidence)
+
+                # Add frame data to the instance document
+                context.sink.append_frame(
+                    update.instance_id,
+                    {
+                        "frame": frame_number,
+                        "timestamp": timestamp,
+                        "box": box_coordinates,
+                        "relative_position": relative_position,
+                        "confidence": confidence
+                    },
+                    seconds  # Update end_time
                 )
+            else:
+                # Create a new document in MongoDB for this instance
+                new_doc = {
+                    "_id": update.instance_id,
+                    "video_id": context.video_name,
+                    "object_name": label,
+                    "start_time": seconds,
+                    "end_time": seconds,    # Initialize end_time
+                    "frames": [{
+                        "frame": frame_number,
+                        "timestamp": timestamp,
+                        "box": box_coordinates,
+                        "relative_position": relative_position,
+                        "confidence": confidence
+                    }]
+                }
+                context.sink.create_instance(new_doc)
+                context.metrics.count("instances")
+
+                logger.info(f"Created new instance ID {update.instance_id} for label '{label}'")
+    
+    def _append_interpolated_frames(self, context: "VideoContext", update: TrackUpdate,
+                                    frame_number: int, timestamp_ms: float,
+                                    box: List[float], confidence: float) -> None:
+        """
+        Append linearly interpolated frames between an instance's last frame and the current one
+        
+        Args:
+            context: Tracking state of the video being processed
+            update: Tracker update that continued an instance on the current frame
+            frame_number: Index of the current frame
+            timestamp_ms: Timestamp of the current frame in milliseconds
+            box: Detected box on the current frame
+            confidence: Detection confidence on the current frame
+        """
+        last_frame = update.previous_frame
+        last_ms = update.previous_timestamp_ms
+        last_box = update.previous_box.tolist()
+        last_confidence = update.previous_confidence
+        span = frame_number - last_frame
+        
+        for skipped_frame in range(last_frame + 1, frame_number):
+            alpha = (skipped_frame - last_frame) / span
+            interpolated_box = [a + (b - a) * alpha for a, b in zip(last_box, box)]
+            interpolated_ms = last_ms + (timestamp_ms - last_ms) * alpha
+            interpolated_timestamp = int(interpolated_ms)
+            context.sink.append_frame(
+                update.instance_id,
+                {
+                    "frame": skipped_frame,
+                    "timestamp": interpolated_timestamp,
+                    "box": interpolated_box,
+                    "relative_position": calculate_relative_position(
+                        interpolated_box, context.frame_width, context.frame_height
+                    ),
+                    "confidence": last_confidence + (confidence - last_confidence) * alpha,
+                    "interpolated": True
+                },
+                interpolated_timestamp / 1000
+            )
+    
+    def _expire_instances(self, context: "VideoContext", timestamp_ms: float) -> None:
+        """
+        Drop active instances that have not been seen within the timeout threshold
+        
+        Args:
+            context: Tracking state of the video being processed
+            timestamp_ms: Timestamp of the current frame in milliseconds
+        """
+        for instance_id in context.tracker.expire(timestamp_ms, context.timeout_ms):
+            context.sink.close_instance(instance_id)
+    
+    def annotate_frame(self, frame, detections, in_place=False):
+        """
+        Draw bounding boxes and labels on the frame based on detection results.
+        Supports both YOLO-World (with supervision) and Ultralytics YOLO.
+        
+        Args:
+            frame: Decoded frame
+            detections: Detections of the frame
+            in_place: Draw on the frame itself instead of a copy, when the raw
+                frame is no longer needed
+            
+        Returns:
+            The annotated frame
+        """
+        # Filter detections based on confidence threshold
+        detections = detections.filter(self.confidence_threshold)
+        annotated_frame = frame if in_place else frame.copy()
+        
+        if self.use_yolo_world:
+            # YOLO-World annotation using supervision, which draws on the scene it is given
+            annotated_frame = draw_supervision_detections(annotated_frame, detections)
         else:
             # Ultralytics YOLO annotation
-            import cv2
-            annotated_frame = frame.copy()
-            
-            for i in range(len(detections)):
-                if detections.confidence[i] < self.confidence_threshold:
-                    continue
-                    
-                # Extract box coordinates
-                x1, y1, x2, y2 = map(int, detections.xyxy[i])
-                label = detections.data['class_name'][i]
-                confidence = detections.confidence[i]
-                
-                # Draw rectangle
-                cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                
-                # Prepare label text
-                label_text = f"{label} {confidence:.2f}"
-                
-                # Draw label background
-                (text_width, text_height), baseline = cv2.getTextSize(
-                    label_text, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1
-                )
-                cv2.rectangle(
-                    annotated_frame,
-                    (x1, y1 - text_height - baseline),
-                    (x1 + text_width, y1),
-                    (0, 255, 0),
-                    -1
-                )
-                
-                # Draw label text
-                cv2.putText(
-                    annotated_frame,
-                    label_text,
-                    (x1, y1 - baseline),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    0.5,
-                    (0, 0, 0),
-                    1
-                )
+            draw_frame_detections(annotated_frame, detections)
         
         return annotated_frame
     
@@ -418,20 +993,16 @@ class VideoProcessor:
         Returns:
             List of detections with their details
         """
-        # Convert results to supervision Detections
-        detections = sv.Detections.from_inference(results)
+        import supervision as sv
+        
+        # Convert results to supervision Detections, skipping low confidence detections
+        detections = Detections.from_supervision(sv.Detections.from_inference(results), self.confidence_threshold)
         
         extracted_detections = []
         
-        for i in range(len(detections)):
-            confidence = float(detections.confidence[i])
-            
-            # Skip low confidence detections
-            if confidence < self.confidence_threshold:
-                continue
-                
-            box_coordinates = detections.xyxy[i].tolist()
-            label = detections.data.get('class_name', [])[i] if 'class_name' in detections.data else "unknown"
+        for box, label, confidence in zip(detections.xyxy.tolist(), detections.labels,
+                                          detections.confidence.tolist()):
+            box_coordinates = box
             relative_position = calculate_relative_position(box_coordinates, frame_width, frame_height)
             
             extracted_detections.append({
@@ -443,46 +1014,6 @@ class VideoProcessor:
             
         return extracted_detections
     
-    def _extract_detections_from_yolo(self, results, frame):
-        """
-        Extract detections from Ultralytics YOLO results
-        
-        Args:
-            results: YOLO prediction results
-            frame: Input frame
-            
-        Returns:
-            Detection object compatible with the processing pipeline
-        """
-        import numpy as np
-        
-        class SimpleDetections:
-            """Simple detection container for compatibility"""
-            def __init__(self):
-                self.xyxy = []
-                self.confidence = []
-                self.class_id = []
-                self.data = {'class_name': []}
-            
-            def __len__(self):
-                return len(self.xyxy)
-        
-        detections = SimpleDetections()
-        
-        for result in results:
-            if result.boxes is None or len(result.boxes) == 0:
-                continue
-                
-            for box in result.boxes:
-                # Convert tensors to numpy arrays and then to lists to avoid memory issues
-                xyxy = box.xyxy[0].cpu().numpy() if hasattr(box.xyxy[0], 'cpu') else np.array(box.xyxy[0])
-                detections.xyxy.append(xyxy)
-                detections.confidence.append(float(box.conf[0].cpu() if hasattr(box.conf[0], 'cpu') else box.conf[0]))
-                detections.class_id.append(int(box.cls[0].cpu() if hasattr(box.cls[0], 'cpu') else box.cls[0]))
-                detections.data['class_name'].append(self.model.get_label(int(box.cls[0])))
-        
-        return detections
-    
     def predict(self, frame):
         """
         Run object detection on a single frame
@@ -493,23 +1024,26 @@ class VideoProcessor:
         Returns:
             Detection results
         """
-        if self.use_yolo_world:
-            return self.model.infer(frame)
-        else:
-            return self.model.predict(frame, verbose=False)
+        with self.model_lock:
+            if self.use_yolo_world:
+                return self.model.infer(frame)
+            else:
+                return self.model.predict(frame, verbose=False)
 
 
 # Helper functions
-def timestamp_to_seconds(timestamp: str) -> float:
+def timestamp_to_seconds(timestamp: Union[str, float]) -> float:
     """
-    Convert a timestamp string to seconds
+    Convert a frame timestamp to seconds
     
     Args:
-        timestamp: Timestamp in format HH:MM:SS.mmm
+        timestamp: Timestamp in format HH:MM:SS.mmm, or numeric milliseconds
         
     Returns:
         Timestamp in seconds
     """
+    if not isinstance(timestamp, str):
+        return timestamp / 1000
     hours, minutes, seconds = map(float, timestamp.split(':'))
     total_seconds = hours * 3600 + minutes * 60 + seconds
     return total_seconds
@@ -525,15 +1059,89 @@ def convert_ms_to_timestamp(ms: float) -> str:
     Returns:
         Timestamp in format HH:MM:SS.mmm
     """
-    seconds = ms / 1000
-    # Use timezone-aware version to avoid deprecation warning
-    try:
-        # For Python 3.11+
-        from datetime import UTC
-        return datetime.fromtimestamp(seconds, UTC).strftime('%H:%M:%S.%f')[:-3]
-    except ImportError:
-        # Fallback for older Python versions
-        return datetime.utcfromtimestamp(seconds).strftime('%H:%M:%S.%f')[:-3]
+    return ms_to_timestamp(ms)
+
+
+def seek_to_frame(cap: Any, frame_number: int, fps: float) -> int:
+    """
+    Position a video capture at a frame by seeking to its time
+    
+    The seek lands on the preceding keyframe's decode position; the remaining
+    frames are grabbed without being decoded. If the backend overshoots, the
+    capture is rewound and advanced from the first frame.
+    
+    Args:
+        cap: Opened cv2.VideoCapture or FFmpegCapture (see open_capture)
+        frame_number: Frame to position the capture at
+        fps: Frame rate of the video
+        
+    Returns:
+        Frame number the next read returns (less than frame_number only if the
+        video is shorter)
+    """
+    cap.set(cv2.CAP_PROP_POS_MSEC, frame_number / fps * 1000)
+    position = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+    if position < 0 or position > frame_number:
+        logger.warning(f"Inexact seek to frame {frame_number} (landed on {position}); rewinding")
+        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        position = 0
+    while position < frame_number and cap.grab():
+        position += 1
+    return position
+
+
+def iter_frame_batches(cap: Any, batch_size: int,
+                       sampler: Optional[FrameSampler] = None,
+                       start_frame: int = 0,
+                       end_frame: Optional[int] = None,
+                       metrics: Optional[StageMetrics] = None,
+                       cancelled: Optional[threading.Event] = None) -> Iterator[List[Tuple[int, float, Any]]]:
+    """
+    Read frames from a video capture in batches
+    
+    Frames the sampler skips are only grabbed, not decoded, and are not yielded.
+    
+    Args:
+        cap: Opened cv2.VideoCapture or FFmpegCapture (see open_capture)
+        batch_size: Maximum number of frames per batch
+        sampler: Frame sampler deciding which frames to decode (default: all frames)
+        start_frame: Frame number of the capture's current position
+        end_frame: Frame at which to stop reading (exclusive; default: end of video)
+        metrics: Metrics receiving the time of each read ('decode') and of each
+            skipped frame ('grab')
+        cancelled: Event set by the caller to stop reading
+        
+    Yields:
+        Lists of (frame_number, timestamp_ms, frame) tuples in frame order
+        
+    Raises:
+        ProcessingCancelled: If cancelled is set when a batch is complete
+    """
+    if metrics is None:
+        metrics = StageMetrics(enabled=False)
+    frame_number = start_frame
+    batch = []
+    while cap.isOpened() and (end_frame is None or frame_number < end_frame):
+        start = time.perf_counter()
+        if sampler is not None and not sampler.should_process(frame_number):
+            if not cap.grab():
+                break
+            metrics.observe("grab", time.perf_counter() - start)
+            frame_number += 1
+            continue
+        ret, frame = cap.read()
+        if not ret:
+            break
+        metrics.observe("decode", time.perf_counter() - start)
+        batch.append((frame_number, cap.get(cv2.CAP_PROP_POS_MSEC), frame))
+        frame_number += 1
+        if len(batch) >= batch_size:
+            raise_if_cancelled(cancelled, f"at frame {frame_number}")
+            yield batch
+            batch = []
+    if batch:
+        raise_if_cancelled(cancelled, f"at frame {frame_number}")
+        yield batch
 
 
 def compute_iou(box1: List[float], box2: List[float]) -> float:
@@ -582,31 +1190,6 @@ def calculate_relative_position(box: List[float], frame_width: int, frame_height
     return [x_center, y_center]
 
 
-def download_from_s3(bucket_name, video_id, download_path):
-    """
-    Download a video from S3
-    
-    Args:
-        bucket_name: S3 bucket name
-        video_id: Video ID in S3
-        download_path: Local path to save the video
-        
-    Returns:
-        Path to the downloaded video
-    """
-    # Create temp directory if it doesn't exist
-    os.makedirs(os.path.dirname(download_path), exist_ok=True)
-    
-    try:
-        logger.info(f"Downloading video {video_id} from S3 bucket {bucket_name}")
-        s3_client.download_file(bucket_name, video_id, download_path)
-        logger.info(f"Successfully downloaded video to {download_path}")
-        return download_path
-    except Exception as e:
-        logger.error(f"Error downloading video from S3: {str(e)}")
-        raise
-
-
 def upload_to_s3(file_path, bucket_name, object_name=None):
     """
     Upload a file to S3
@@ -624,7 +1207,7 @@ def upload_to_s3(file_path, bucket_name, object_name=None):
     
     try:
         logger.info(f"Uploading {file_path} to S3 bucket {bucket_name}")
-        s3_client.upload_file(file_path, bucket_name, object_name)
+        s3_client.upload_file(file_path, bucket_name, object_name, Config=get_transfer_config())
         s3_url = f"https://{bucket_name}.s3.amazonaws.com/{object_name}"
         logger.info(f"Uploaded file to {s3_url}")
         return s3_url
@@ -666,71 +1249,73 @@ def process_videos_from_queue():
             video_id = str(video['_id'])
             logger.info(f"Found video to process: {video_id}")
             
-            # Make sure temp directories exist
-            if not os.path.exists("temp/downloads/"):
-                os.makedirs("temp/downloads/", exist_ok=True)
-                
-            # Download the video from S3
+            # Download the video from S3, or decode it while it downloads (S3_STREAMING)
             download_path = f"temp/downloads/{video_id}"
-            download_from_s3(BUCKET_NAME, video_id, download_path)
+            metrics = StageMetrics(processor.metrics_enabled)
+            with open_video_source(video_id, download_path, metrics=metrics) as video_path:
+                logger.info(f"Processing video: {video_id}")
+                annotated_video_path = processor.process_video(video_path, metrics=metrics)
             
-            # Process the video
-            logger.info(f"Processing video: {video_id}")
-            annotated_video_path = processor.process_video(download_path)
-            
-            # Verify the annotated video file exists
-            if not os.path.exists(annotated_video_path):
-                # Check if file exists with .mp4v extension instead
-                if annotated_video_path.endswith('.mp4'):
-                    mp4v_path = annotated_video_path[:-4] + '.mp4v'
-                    if os.path.exists(mp4v_path):
-                        logger.info(f"Found video with .mp4v extension instead of .mp4: {mp4v_path}")
-                        annotated_video_path = mp4v_path
+            s3_url = None
+            if processor.annotated_output in ("full", "parallel"):
+                # Verify the annotated video file exists
+                if not os.path.exists(annotated_video_path):
+                    # Check if file exists with .mp4v extension instead
+                    if annotated_video_path.endswith('.mp4'):
+                        mp4v_path = annotated_video_path[:-4] + '.mp4v'
+                        if os.path.exists(mp4v_path):
+                            logger.info(f"Found video with .mp4v extension instead of .mp4: {mp4v_path}")
+                            annotated_video_path = mp4v_path
+                        else:
+                            logger.error(f"Annotated video file not found at {annotated_video_path} or {mp4v_path}")
+                            raise FileNotFoundError(f"Annotated video file not found")
                     else:
-                        logger.error(f"Annotated video file not found at {annotated_video_path} or {mp4v_path}")
+                        logger.error(f"Annotated video file not found at {annotated_video_path}")
                         raise FileNotFoundError(f"Annotated video file not found")
-                else:
-                    logger.error(f"Annotated video file not found at {annotated_video_path}")
-                    raise FileNotFoundError(f"Annotated video file not found")
                 
-            logger.info(f"Verified annotated video exists at: {annotated_video_path}")
+                logger.info(f"Verified annotated video exists at: {annotated_video_path}")
                 
-            # Upload the annotated video to S3
-            annotated_video_name = f"annotated_{video_id}"
-            if not annotated_video_name.endswith('.mp4') and not annotated_video_name.endswith('.mp4v'):
-                # Use the same extension as the found file
-                if annotated_video_path.endswith('.mp4v'):
-                    annotated_video_name += '.mp4v'
-                else:
-                    annotated_video_name += '.mp4'
+                # Upload the annotated video to S3
+                annotated_video_name = f"annotated_{video_id}"
+                if not annotated_video_name.endswith('.mp4') and not annotated_video_name.endswith('.mp4v'):
+                    # Use the same extension as the found file
+                    if annotated_video_path.endswith('.mp4v'):
+                        annotated_video_name += '.mp4v'
+                    else:
+                        annotated_video_name += '.mp4'
             
-            # Make sure the S3 client exists before trying to upload        
-            if s3_client is None:
-                logger.error("Cannot upload to S3: S3 client is not available")
-                s3_url = None
-            else:
-                try:
-                    s3_url = upload_to_s3(annotated_video_path, BUCKET_NAME, annotated_video_name)
-                    logger.info(f"Uploaded annotated video to S3: {s3_url}")
-                except Exception as e:
-                    logger.error(f"Failed to upload to S3: {str(e)}")
+                # Make sure the S3 client exists before trying to upload        
+                if s3_client is None:
+                    logger.error("Cannot upload to S3: S3 client is not available")
                     s3_url = None
+                else:
+                    try:
+                        with metrics.timer("s3_upload"):
+                            s3_url = upload_to_s3(annotated_video_path, BUCKET_NAME, annotated_video_name)
+                        logger.info(f"Uploaded annotated video to S3: {s3_url}")
+                    except Exception as e:
+                        logger.error(f"Failed to upload to S3: {str(e)}")
+                        s3_url = None
+            elif processor.annotated_output == "segments":
+                # Segments were uploaded while the video was encoded
+                s3_url = annotated_video_path
             
             # Update the video status to 'analyzed' even if S3 upload failed
-            video_collection.update_one(
-                {"_id": video['_id']},
-                {"$set": {
-                    "status": "analyzed",
-                    "annotated_video_url": s3_url or annotated_video_path  # Use local path if S3 upload failed
-                }}
-            )
+            update = {
+                "status": "analyzed",
+                "annotated_video_url": s3_url or annotated_video_path  # Use local path if S3 upload failed
+            }
+            if metrics.enabled:
+                update["stage_metrics"] = metrics.summary()
+            video_collection.update_one({"_id": video['_id']}, {"$set": update})
             
             logger.info(f"Video {video_id} processed and marked as 'analyzed'")
             
             # Clean up temporary files
             try:
                 os.remove(download_path)
-                os.remove(annotated_video_path)
+                if processor.annotated_output in ("full", "parallel"):
+                    os.remove(annotated_video_path)
                 logger.info("Temporary files cleaned up")
             except Exception as e:
                 logger.warning(f"Error cleaning up temporary files: {str(e)}")
@@ -0,0 +1,231 @@
+"""
+Per-video summary documents written when a video finishes processing
+
+A summary answers "which classes appear in this video and when" from one
+small document in the video_summaries collection instead of a scan of the
+video's instance documents. Per class it holds:
+
+    instances:       number of instances
+    detections:      number of detected (not interpolated) frames
+    seconds:         total presence of all instances in seconds
+    intervals:       merged [start, end] presence intervals in seconds
+    max_concurrent:  largest number of simultaneous instances, and when
+    occupancy:       packed bits, bit i set if the class is present in second i
+"""
+import math
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from bson import Binary
+
+from ML.detection_sink import DetectionSink
+
+SUMMARIES_COLLECTION = "video_summaries"
+
+
+class SummarizingSink(DetectionSink):
+    """
+    Sink wrapper that records the extent of every instance for the video summary
+
+    All calls are forwarded to the wrapped sink, so the summary is independent
+    of the storage format.
+    """
+
+    def __init__(self, sink: DetectionSink) -> None:
+        """
+        Initialize the wrapper
+
+        Args:
+            sink: Sink that persists the detections
+        """
+        self.sink = sink
+        # Per instance: object_name, start_time, end_time and detected frame count
+        self.instances: Dict[str, List[Any]] = {}
+
+    def set_frame_size(self, frame_width: int, frame_height: int) -> None:
+        self.sink.set_frame_size(frame_width, frame_height)
+
+    def set_metrics(self, metrics: Optional[Any]) -> None:
+        self.sink.set_metrics(metrics)
+
+    def create_instance(self, doc: Dict[str, Any]) -> None:
+        detections = sum(1 for frame in doc.get("frames", []) if not frame.get("interpolated"))
+        self.instances[doc["_id"]] = [doc["object_name"], doc["start_time"], doc["end_time"], detections]
+        self.sink.create_instance(doc)
+
+    def append_frame(self, instance_id: str, frame_data: Dict[str, Any], end_time: float) -> None:
+        instance = self.instances[instance_id]
+        instance[2] = end_time
+        if not frame_data.get("interpolated"):
+            instance[3] += 1
+        self.sink.append_frame(instance_id, frame_data, end_time)
+
+    def close_instance(self, instance_id: str) -> None:
+        self.sink.close_instance(instance_id)
+
+    def flush(self) -> None:
+        self.sink.flush()
+
+    def close(self) -> None:
+        self.sink.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return self.sink.get_stats()
+
+
+def merge_intervals(intervals: List[Tuple[float, float]], max_gap: float = 0.0) -> List[List[float]]:
+    """
+    Merge overlapping intervals
+
+    Args:
+        intervals: (start, end) pairs
+        max_gap: Intervals separated by at most this gap are merged as well
+
+    Returns:
+        Sorted, disjoint [start, end] intervals
+    """
+    merged: List[List[float]] = []
+    for start, end in sorted(intervals):
+        if merged and start - merged[-1][1] <= max_gap:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def max_concurrency(intervals: List[Tuple[float, float]]) -> Tuple[int, float]:
+    """
+    Find the largest number of intervals that overlap
+
+    Intervals are closed, so an interval ending when another starts overlaps it.
+
+    Args:
+        intervals: (start, end) pairs
+
+    Returns:
+        The maximum count and the earliest time at which it is reached
+    """
+    # Starts sort before ends at the same time
+    events = sorted([(start, 0) for start, _ in intervals] + [(end, 1) for _, end in intervals])
+    count, best, best_time = 0, 0, 0.0
+    for time, is_end in events:
+        count += -1 if is_end else 1
+        if count > best:
+            best, best_time = count, time
+    return best, best_time
+
+
+def build_video_summary(video_id: str, instances: List[Tuple[str, float, float, int]],
+                        duration: float, fps: float) -> Dict[str, Any]:
+    """
+    Build the summary document of a video
+
+    Args:
+        video_id: ID of the video
+        instances: (object_name, start_time, end_time, detections) per instance
+        duration: Duration of the video in seconds
+        fps: Frame rate of the video; instances less than a frame apart are merged
+
+    Returns:
+        Summary document
+    """
+    duration = max([duration] + [end for _, _, end, _ in instances])
+    num_seconds = max(1, math.ceil(duration))
+    by_class: Dict[str, List[Tuple[float, float, int]]] = {}
+    for object_name, start, end, detections in instances:
+        by_class.setdefault(object_name, []).append((start, end, detections))
+
+    classes = []
+    for object_name in sorted(by_class):
+        entries = by_class[object_name]
+        intervals = [(start, end) for start, end, _ in entries]
+        occupancy = np.zeros(num_seconds, dtype=bool)
+        for start, end in intervals:
+            occupancy[int(start):min(int(end), num_seconds - 1) + 1] = True
+        count, count_time = max_concurrency(intervals)
+        classes.append({
+            "name": object_name,
+            "instances": len(entries),
+            "detections": sum(detections for _, _, detections in entries),
+            "seconds": round(sum(end - start for start, end in intervals), 3),
+            "intervals": merge_intervals(intervals, max_gap=1.0 / fps if fps else 0.0),
+            "max_concurrent": count,
+            "max_concurrent_time": count_time,
+            "occupancy": Binary(np.packbits(occupancy).tobytes()),
+        })
+
+    return {
+        "_id": video_id,
+        "video_id": video_id,
+        "duration": duration,
+        "fps": fps,
+        "occupancy_seconds": num_seconds,
+        "instances": len(instances),
+        "classes": classes,
+        "created_at": datetime.now(),
+    }
+
+
+def ensure_indexes(objects_collection: Any, summaries_collection: Any) -> None:
+    """
+    Create the indexes used by object, temporal and summary queries
+
+    Args:
+        objects_collection: MongoDB objects collection
+        summaries_collection: MongoDB video_summaries collection
+    """
+    # Per-video class queries with a time window, and class queries across videos
+    objects_collection.create_index([("video_id", 1), ("object_name", 1), ("start_time", 1), ("end_time", 1)])
+    objects_collection.create_index([("object_name", 1), ("video_id", 1)])
+    # Per-video sweeps in start order (annotate_video.py)
+    objects_collection.create_index([("video_id", 1), ("start_time", 1)])
+    summaries_collection.create_index([("classes.name", 1)])
+
+
+def write_video_summary(summaries_collection: Any, summary: Dict[str, Any]) -> None:
+    """
+    Store a video summary, replacing the summary of an earlier run
+
+    Args:
+        summaries_collection: MongoDB video_summaries collection
+        summary: Summary document from build_video_summary
+    """
+    summaries_collection.replace_one({"_id": summary["_id"]}, summary, upsert=True)
+
+
+def get_occupancy(summary: Dict[str, Any], object_name: str) -> Optional[np.ndarray]:
+    """
+    Decode the per-second occupancy of a class
+
+    Args:
+        summary: Summary document
+        object_name: Class name
+
+    Returns:
+        Boolean array with one entry per second, or None if the class does not appear
+    """
+    for entry in summary["classes"]:
+        if entry["name"] == object_name:
+            bits = np.unpackbits(np.frombuffer(entry["occupancy"], dtype=np.uint8))
+            return bits[:summary["occupancy_seconds"]].astype(bool)
+    return None
+
+
+def classes_present(summary: Dict[str, Any], start_time: float, end_time: float) -> List[str]:
+    """
+    Find the classes present in a time window, at one-second resolution
+
+    Args:
+        summary: Summary document
+        start_time: Start of the window in seconds
+        end_time: End of the window in seconds
+
+    Returns:
+        Names of the classes present in any second overlapping the window
+    """
+    first, last = max(0, int(start_time)), int(end_time)
+    return [
+        entry["name"] for entry in summary["classes"]
+        if get_occupancy(summary, entry["name"])[first:last + 1].any()
+    ]
@@ -0,0 +1,463 @@
+"""
+Multi-process worker pool for the uploaded-video queue
+"""
+import os
+import signal
+import socket
+import threading
+import time
+import multiprocessing as mp
+from datetime import datetime, timedelta, timezone
+from queue import Empty
+from typing import Any, Dict, Optional, Set
+
+from pymongo import ReturnDocument, WriteConcern
+
+from ML.columnar import SEGMENTS_COLLECTION
+from ML.metrics import MetricsExporter, StageMetrics
+from ML.utils.config import config
+from ML.utils.downloads import Prefetcher, open_video_source
+from ML.utils.logging_config import setup_logging, get_logger
+
+logger = get_logger(__name__)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def claim_video(videos_collection: Any, worker_id: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+    """
+    Atomically claim one uploaded video and take a lease on it
+
+    Args:
+        videos_collection: MongoDB videos collection
+        worker_id: ID of the claiming worker
+        lease_seconds: Lease duration; the lease must be renewed by heartbeats
+
+    Returns:
+        The claimed video document, or None if there is nothing to process
+    """
+    now = _utcnow()
+    return videos_collection.find_one_and_update(
+        {"status": "uploaded"},
+        {"$set": {
+            "status": "analyzing",
+            "worker_id": worker_id,
+            "claimed_at": now,
+            "heartbeat_at": now,
+            "lease_expires_at": now + timedelta(seconds=lease_seconds)
+        }},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def renew_lease(videos_collection: Any, video_id: Any, worker_id: str, lease_seconds: float) -> bool:
+    """
+    Extend the lease on a claimed video
+
+    Args:
+        videos_collection: MongoDB videos collection
+        video_id: _id of the claimed video
+        worker_id: ID of the worker holding the lease
+        lease_seconds: New lease duration from now
+
+    Returns:
+        False if the worker no longer holds the lease
+    """
+    now = _utcnow()
+    result = videos_collection.update_one(
+        {"_id": video_id, "status": "analyzing", "worker_id": worker_id},
+        {"$set": {"heartbeat_at": now, "lease_expires_at": now + timedelta(seconds=lease_seconds)}}
+    )
+    return result.matched_count == 1
+
+
+def requeue_expired_leases(videos_collection: Any) -> int:
+    """
+    Put videos whose worker stopped sending heartbeats back in the queue
+
+    Args:
+        videos_collection: MongoDB videos collection
+
+    Returns:
+        Number of requeued videos
+    """
+    result = videos_collection.update_many(
+        {"status": "analyzing", "lease_expires_at": {"$lt": _utcnow()}},
+        {"$set": {"status": "uploaded"},
+         "$unset": {"worker_id": "", "lease_expires_at": ""},
+         "$inc": {"attempts": 1}}
+    )
+    if result.modified_count:
+        logger.warning(f"Requeued {result.modified_count} videos with expired leases")
+    return result.modified_count
+
+
+def clear_previous_attempt(objects_collection: Any, video_id: str) -> int:
+    """
+    Delete what an earlier, interrupted attempt at a video wrote
+
+    A requeued video is processed again from the start, so the instances and
+    trajectory segments of the earlier attempt would otherwise be duplicated.
+    Summary and spatial index documents are replaced when the video completes.
+
+    The deletes are always acknowledged, whatever the collection's write
+    concern: an unacknowledged delete (MONGO_DETECTION_WRITE_CONCERN=0) could
+    still be running when the new attempt writes, and remove its instances.
+
+    Args:
+        objects_collection: MongoDB objects collection
+        video_id: ID of the video, as stored on its instances
+
+    Returns:
+        Number of deleted instances
+    """
+    # The default WriteConcern() is the server's default, which is acknowledged
+    acknowledged = WriteConcern()
+    objects = objects_collection.with_options(write_concern=acknowledged)
+    segments = objects_collection.database.get_collection(SEGMENTS_COLLECTION, write_concern=acknowledged)
+    deleted = objects.delete_many({"video_id": video_id}).deleted_count
+    segments.delete_many({"video_id": video_id})
+    if deleted:
+        logger.info(f"Deleted {deleted} instances of an earlier attempt at video {video_id}")
+    return deleted
+
+
+def release_video(videos_collection: Any, video_id: Any, worker_id: str) -> None:
+    """
+    Put a claimed but unprocessed video back in the queue
+
+    Args:
+        videos_collection: MongoDB videos collection
+        video_id: _id of the claimed video
+        worker_id: ID of the worker holding the lease
+    """
+    videos_collection.update_one(
+        {"_id": video_id, "status": "analyzing", "worker_id": worker_id},
+        {"$set": {"status": "uploaded"}, "$unset": {"worker_id": "", "lease_expires_at": ""}}
+    )
+
+
+class Heartbeat:
+    """
+    Background thread that renews the leases of a worker's claimed videos
+
+    Each claimed video has a "lease lost" event, which is set when a renewal
+    finds that the video was requeued (or taken over by another worker), so
+    that processing can stop instead of writing alongside the new owner.
+    """
+
+    def __init__(self, videos_collection: Any, worker_id: str,
+                 lease_seconds: float, interval: float) -> None:
+        self.videos_collection = videos_collection
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.interval = interval
+        self.video_ids: Set[Any] = set()
+        self._lease_lost: Dict[Any, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"heartbeat-{worker_id}", daemon=True)
+
+    def add(self, video_id: Any) -> threading.Event:
+        """
+        Start renewing the lease of a claimed video
+
+        Args:
+            video_id: _id of the claimed video
+
+        Returns:
+            Event set once the lease is lost (the same event if the video was already added)
+        """
+        with self._lock:
+            lease_lost = self._lease_lost.setdefault(video_id, threading.Event())
+            if not lease_lost.is_set():
+                self.video_ids.add(video_id)
+            return lease_lost
+
+    def discard(self, video_id: Any) -> None:
+        """Stop renewing the lease of a video"""
+        with self._lock:
+            self.video_ids.discard(video_id)
+            self._lease_lost.pop(video_id, None)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                video_ids = list(self.video_ids)
+            for video_id in video_ids:
+                try:
+                    if not renew_lease(self.videos_collection, video_id, self.worker_id, self.lease_seconds):
+                        logger.warning(f"Worker {self.worker_id} lost its lease on video {video_id}")
+                        with self._lock:
+                            self.video_ids.discard(video_id)
+                            if video_id in self._lease_lost:
+                                self._lease_lost[video_id].set()
+                except Exception as e:
+                    logger.error(f"Heartbeat for video {video_id} failed: {e}")
+
+    def __enter__(self) -> "Heartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def process_claimed_video(processor: Any, videos_collection: Any, video: Dict[str, Any],
+                          worker_id: str, prefetcher: Optional[Prefetcher] = None,
+                          metrics: Optional[StageMetrics] = None,
+                          lease_lost: Optional[threading.Event] = None,
+                          objects_collection: Any = None) -> Dict[str, Any]:
+    """
+    Download, process and mark a claimed video
+
+    The video is streamed while it downloads if S3_STREAMING is enabled, or
+    taken from the prefetcher if it was downloaded ahead of time. The stage
+    metrics of the video are stored in its document as stage_metrics.
+
+    A requeued video (attempts > 0) first has the instances of the earlier
+    attempt deleted. Processing stops once lease_lost is set, and the final
+    status is only written while the video is still claimed by this worker.
+
+    Args:
+        processor: VideoProcessor owned by the worker
+        videos_collection: MongoDB videos collection
+        video: Claimed video document
+        worker_id: ID of the worker holding the lease
+        prefetcher: Prefetcher that may hold the video's download
+        metrics: Metrics receiving the stage timings of the video (default: new metrics)
+        lease_lost: Event set by the Heartbeat when the lease on the video is lost
+        objects_collection: MongoDB objects collection (default: the objects collection)
+
+    Returns:
+        Processing statistics of the video (empty if it failed or the lease was lost)
+    """
+    from ML.video_processor import ProcessingCancelled, raise_if_cancelled
+
+    if metrics is None:
+        metrics = StageMetrics(config.METRICS_ENABLED)
+    s3_key = str(video["_id"])
+    owned = {"_id": video["_id"], "status": "analyzing", "worker_id": worker_id}
+    local_path = os.path.join("downloads", worker_id, s3_key)
+    prefetched = prefetcher.take(s3_key) if prefetcher else None
+
+    try:
+        # Another worker may already be writing the video; deleting its instances would lose them
+        raise_if_cancelled(lease_lost, f"before {s3_key} was started")
+        if video.get("attempts", 0) > 0:
+            if objects_collection is None:
+                from ML.utils.connections import get_collection
+                objects_collection = get_collection("objects")
+            # Instances are stored under the name of the decoded file, which is the S3 key
+            clear_previous_attempt(objects_collection, s3_key)
+        with open_video_source(s3_key, local_path, prefetched=prefetched, metrics=metrics) as vid_path:
+            annotated_path = processor.process_video(vid_path, metrics=metrics, cancelled=lease_lost)
+    except ProcessingCancelled as e:
+        logger.warning(f"Worker {worker_id} stopped processing video {s3_key}: {e}")
+        return {}
+    except Exception as e:
+        logger.error(f"Error processing video {s3_key}: {e}", exc_info=True)
+        videos_collection.update_one(owned, {"$set": {"status": "error", "error_message": str(e)}})
+        return {}
+
+    stats = dict(processor.last_video_stats, worker_id=worker_id)
+    update = {"status": "analyzed", "annotated_path": annotated_path, "processing_stats": stats}
+    if metrics.enabled:
+        update["stage_metrics"] = metrics.summary()
+    result = videos_collection.update_one(owned, {"$set": update, "$unset": {"lease_expires_at": ""}})
+    if result.matched_count != 1:
+        logger.warning(f"Worker {worker_id} lost its lease on video {s3_key} before marking it analyzed")
+        return {}
+    logger.info(f"Worker {worker_id} processed video {s3_key} at {stats.get('fps', 0):.1f} frames/sec")
+    return stats
+
+
+def worker_main(worker_index: int, model_name: str, model_path: Optional[str], device: str,
+                use_pipeline: bool, num_threads: int, stop_event: Any, stats_queue: Any) -> None:
+    """
+    Entry point of a worker process: load the model once and process videos until stopped
+
+    Args:
+        worker_index: Index of the worker in the pool
+        model_name: Name of the model to use
+        model_path: Path to the model weights
+        device: Device to run inference on ('cpu' or 'cuda')
+        use_pipeline: Run each video through the threaded pipeline
+        num_threads: CPU threads for inference in this worker
+        stop_event: Set by the supervisor to request a graceful shutdown
+        stats_queue: Queue receiving per-video statistics
+    """
+    # The supervisor handles Ctrl-C; in-flight videos are allowed to finish
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    setup_logging(log_file=os.path.join(config.LOG_DIR, f"worker_{worker_index}.log"))
+
+    from ML.utils.connections import videos_collection
+    from ML.video_processor import VideoProcessor
+
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-{worker_index}"
+    logger.info(f"Worker {worker_id} starting with {num_threads} inference threads")
+    processor = VideoProcessor(
+        model_name=model_name,
+        model_path=model_path,
+        device=device,
+        use_pipeline=use_pipeline,
+        num_threads=num_threads
+    )
+
+    # Cumulative stage metrics, written to METRICS_TEXTFILE_DIR/worker_<index>.prom after each video
+    exporter = MetricsExporter(f"worker_{worker_index}", config.METRICS_TEXTFILE_DIR, config.METRICS_ENABLED)
+
+    # With prefetching, the next video is claimed and downloaded while the current one is processed
+    prefetcher = Prefetcher() if config.PREFETCH_NEXT_VIDEO else None
+    next_video = None
+    with Heartbeat(videos_collection, worker_id,
+                   config.WORKER_LEASE_SECONDS, config.WORKER_HEARTBEAT_SECONDS) as heartbeat:
+        while not stop_event.is_set():
+            try:
+                video = next_video or claim_video(videos_collection, worker_id, config.WORKER_LEASE_SECONDS)
+                next_video = None
+                if not video:
+                    stop_event.wait(config.WORKER_POLL_INTERVAL)
+                    continue
+                logger.info(f"Worker {worker_id} claimed video {video['_id']}")
+                lease_lost = heartbeat.add(video["_id"])
+                if prefetcher:
+                    next_video = claim_video(videos_collection, worker_id, config.WORKER_LEASE_SECONDS)
+                    if next_video:
+                        heartbeat.add(next_video["_id"])
+                        prefetcher.prefetch(str(next_video["_id"]),
+                                            os.path.join("downloads", worker_id, str(next_video["_id"])))
+                metrics = StageMetrics(config.METRICS_ENABLED)
+                stats = process_claimed_video(processor, videos_collection, video, worker_id, prefetcher, metrics,
+                                              lease_lost)
+                exporter.video_done(metrics, succeeded=bool(stats))
+                heartbeat.discard(video["_id"])
+                stats_queue.put((worker_index, str(video["_id"]), stats))
+            except Exception as e:
+                logger.error(f"Error in worker {worker_id}: {e}", exc_info=True)
+                stop_event.wait(config.WORKER_POLL_INTERVAL)
+
+        if next_video:
+            # Hand the prefetched video back instead of waiting for its lease to expire
+            release_video(videos_collection, next_video["_id"], worker_id)
+        if prefetcher:
+            prefetcher.shutdown()
+
+    logger.info(f"Worker {worker_id} stopped")
+
+
+class WorkerPool:
+    """
+    Pool of worker processes, each with its own model, consuming the video queue
+
+    The supervisor requeues videos whose lease expired (for example because a
+    worker crashed), collects per-worker throughput, and on SIGINT/SIGTERM
+    asks the workers to stop after their in-flight video.
+    """
+
+    def __init__(self, num_workers: int, model_name: str = "yolo", model_path: Optional[str] = None,
+                 device: str = "cpu", use_pipeline: bool = False,
+                 threads_per_worker: Optional[int] = None) -> None:
+        """
+        Initialize the pool
+
+        Args:
+            num_workers: Number of worker processes
+            model_name: Name of the model to use
+            model_path: Path to the model weights
+            device: Device to run inference on ('cpu' or 'cuda')
+            use_pipeline: Run each video through the threaded pipeline
+            threads_per_worker: CPU threads for inference per worker
+                (default: config.WORKER_THREADS, or the cores divided among the workers)
+        """
+        self.num_workers = num_workers
+        self.model_name = model_name
+        self.model_path = model_path
+        self.device = device
+        self.use_pipeline = use_pipeline
+        self.threads_per_worker = (threads_per_worker or config.WORKER_THREADS or
+                                   max(1, (os.cpu_count() or 1) // num_workers))
+
+        # Spawn rather than fork: MongoClient and model state are not fork-safe
+        self._ctx = mp.get_context("spawn")
+        self.stop_event = self._ctx.Event()
+        self.stats_queue = self._ctx.Queue()
+        self.workers = []
+        self.worker_stats: Dict[int, Dict[str, float]] = {
+            i: {"videos": 0, "frames": 0, "seconds": 0.0} for i in range(num_workers)
+        }
+
+    def _start_worker(self, worker_index: int) -> Any:
+        process = self._ctx.Process(
+            target=worker_main,
+            args=(worker_index, self.model_name, self.model_path, self.device, self.use_pipeline,
+                  self.threads_per_worker, self.stop_event, self.stats_queue),
+            name=f"vidmetastream-worker-{worker_index}"
+        )
+        process.start()
+        return process
+
+    def _request_stop(self, signum: int, frame: Any) -> None:
+        logger.info("Shutdown requested; waiting for in-flight videos to finish")
+        self.stop_event.set()
+
+    def _drain_stats(self) -> None:
+        while True:
+            try:
+                worker_index, video_id, stats = self.stats_queue.get_nowait()
+            except Empty:
+                return
+            if not stats:
+                continue
+            totals = self.worker_stats[worker_index]
+            totals["videos"] += 1
+            totals["frames"] += stats.get("frames", 0)
+            totals["seconds"] += stats.get("seconds", 0.0)
+
+    def log_stats(self) -> None:
+        """Log per-worker throughput"""
+        for worker_index, totals in self.worker_stats.items():
+            fps = totals["frames"] / totals["seconds"] if totals["seconds"] else 0.0
+            logger.info(
+                f"Worker {worker_index}: {totals['videos']} videos, {totals['frames']} frames, "
+                f"{fps:.1f} frames/sec"
+            )
+
+    def run(self) -> None:
+        """Start the workers and supervise them until shutdown"""
+        from ML.utils.connections import videos_collection
+
+        signal.signal(signal.SIGINT, self._request_stop)
+        signal.signal(signal.SIGTERM, self._request_stop)
+
+        logger.info(f"Starting {self.num_workers} workers with {self.threads_per_worker} threads each")
+        self.workers = [self._start_worker(i) for i in range(self.num_workers)]
+
+        last_stats_log = time.monotonic()
+        while not self.stop_event.is_set():
+            try:
+                requeue_expired_leases(videos_collection)
+            except Exception as e:
+                logger.error(f"Error requeueing expired leases: {e}")
+
+            # Restart workers that died unexpectedly; their video is requeued once its lease expires
+            for i, process in enumerate(self.workers):
+                if not process.is_alive() and not self.stop_event.is_set():
+                    logger.error(f"Worker {i} exited with code {process.exitcode}; restarting")
+                    self.workers[i] = self._start_worker(i)
+
+            self._drain_stats()
+            if time.monotonic() - last_stats_log >= config.WORKER_STATS_INTERVAL:
+                self.log_stats()
+                last_stats_log = time.monotonic()
+            self.stop_event.wait(config.WORKER_HEARTBEAT_SECONDS)
+
+        for process in self.workers:
+            process.join()
+        self._drain_stats()
+        self.log_stats()
+        logger.info("All workers stopped")
@@ -1,9 +1,12 @@
 import os
+import argparse
+import heapq
+import itertools
+from operator import itemgetter
 import cv2
 import numpy as np
 import tempfile
 import uuid
-from pymongo import MongoClient
 import gridfs
 from bson.objectid import ObjectId
 from tqdm import tqdm
@@ -11,7 +14,12 @@ from datetime import datetime
 import logging
 from dotenv import load_dotenv
 import subprocess
-import json
+from concurrent.futures import ThreadPoolExecutor
+
+from ML.columnar import read_object_frames
+from ML.parallel_render import RenderTask, plan_render_segments, render_parallel, resolve_workers, segment_path
+from ML.utils.config import config
+from ML.utils.connections import get_mongo_client
 
 # Load environment variables
 load_dotenv()
@@ -35,7 +43,7 @@ logging.basicConfig(
 )
 
 def timestamp_to_seconds(timestamp):
-    """Convert timestamp string to seconds."""
+    """Convert a frame timestamp, string or numeric milliseconds, to seconds."""
     try:
         # Handle format like "HH:MM:SS.mmm"
         if isinstance(timestamp, str):
@@ -44,9 +52,9 @@ def timestamp_to_seconds(timestamp):
                 hours, minutes, seconds = parts
                 seconds_float = float(seconds)
                 return int(hours) * 3600 + int(minutes) * 60 + seconds_float
-        # Handle if it's already a number
+        # Numeric timestamps (TIMESTAMP_FORMAT=ms) are milliseconds
         elif isinstance(timestamp, (int, float)):
-            return timestamp
+            return timestamp / 1000
         return 0
     except Exception as e:
         logging.error(f"Error converting timestamp: {e}")
@@ -74,15 +82,69 @@ def get_latest_video(db):
         logging.error(f"Error getting latest video: {e}")
         return None
 
-def download_and_merge_chunks(db, video_id, temp_dir):
-    """Download all chunks for the given video from GridFS and merge them using FFmpeg."""
+def fetch_chunk(fs, chunk_id, path):
+    """Stream one GridFS file to disk, one GridFS chunk (255 KiB by default) at a time."""
+    grid_out = fs.get(chunk_id)
+    with open(path, "wb") as f:
+        while True:
+            block = grid_out.readchunk()
+            if not block:
+                break
+            f.write(block)
+    return path
+
+def chunk_video_info(chunks, chunk_files):
+    """Get fps, size, start time and duration of the merged video from the chunk metadata.
+
+    Fields the uploader did not store are read from the header of the first
+    chunk file, which is already on disk, instead of probing the merged video.
+    start_time is the position of the first chunk in the uploaded video, which
+    is not 0 when only the chunks of a time range were merged.
+    """
+    first = chunks[0].get("metadata", {})
+    fps, width, height = first.get("fps"), first.get("width"), first.get("height")
+    if not (fps and width and height):
+        cap = cv2.VideoCapture(chunk_files[0])
+        fps = fps or cap.get(cv2.CAP_PROP_FPS) or 30
+        width = width or int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = height or int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        cap.release()
+    start_time = first.get("startTime") or 0
+    last = chunks[-1].get("metadata", {})
+    end_time = last.get("endTime")
+    if end_time is not None:
+        duration = end_time - start_time
+    else:
+        duration = sum(chunk.get("metadata", {}).get("duration", 0) for chunk in chunks)
+    return {"fps": fps, "width": width, "height": height, "start_time": start_time, "duration": duration}
+
+def chunk_query(video_id, start_time=None, end_time=None):
+    """Build the GridFS files query for the chunks of a video that overlap a time range in seconds."""
+    query = {"metadata.videoID": ObjectId(video_id)}
+    # Same overlap test as the upload server's time-window queries
+    if end_time is not None:
+        query["metadata.startTime"] = {"$lt": end_time}
+    if start_time is not None:
+        query["metadata.endTime"] = {"$gt": start_time}
+    return query
+
+def download_and_merge_chunks(db, video_id, temp_dir, start_time=None, end_time=None):
+    """Download the chunks for the given video from GridFS and merge them using FFmpeg.
+
+    With start_time and/or end_time (seconds), only the chunks that overlap
+    that range are downloaded; the returned start_time is then the position
+    of the merged video in the upload. Chunks are fetched concurrently (config.CHUNK_FETCH_WORKERS) and streamed
+    to disk, so no chunk is held in memory. Their paths are written to FFmpeg's
+    concat list on stdin in order, as soon as each chunk and all chunks before
+    it are on disk.
+    """
     try:
         # Initialize GridFS
         fs = gridfs.GridFS(db, 'filesBucket')  # Use 'filesBucket' as the bucket name
         
-        # Find all chunks belonging to this video, ordered by start time
-        query = {"metadata.videoID": ObjectId(video_id)}
-        chunks = list(db.filesBucket.files.find(query).sort("metadata.startTime", 1))
+        # Find the chunks belonging to this video (and range), ordered by start time
+        query = chunk_query(video_id, start_time, end_time)
+        chunks = list(db.filesBucket.files.find(query, {"metadata": 1}).sort("metadata.startTime", 1))
         
         if not chunks:
             logging.error(f"No chunks found for video_id: {video_id}")
@@ -90,48 +152,62 @@ def download_and_merge_chunks(db, video_id, temp_dir):
         
         logging.info(f"Found {len(chunks)} chunks for video_id: {video_id}")
         
-        # List to hold paths to temporary chunk files
-        chunk_files = []
-        
-        # Download each chunk to a temporary file
-        for i, chunk in enumerate(tqdm(chunks, desc="Downloading chunks")):
-            chunk_id = chunk["_id"]
-            temp_file_path = os.path.join(temp_dir, f"chunk_{i:03d}.mp4")
-            
-            with open(temp_file_path, "wb") as f:
-                f.write(fs.get(chunk_id).read())
-            
-            chunk_files.append(temp_file_path)
-        
-        if not chunk_files:
-            logging.error("Failed to download any chunk files")
-            return None
-            
-        # Create a file list for FFmpeg concat
-        concat_file_path = os.path.join(temp_dir, "concat_list.txt")
-        with open(concat_file_path, "w") as f:
-            for chunk_file in chunk_files:
-                f.write(f"file '{chunk_file}'\n")
-        
-        # Merge the chunks into a single video file using FFmpeg
+        # Paths of the temporary chunk files, in playback order
+        chunk_files = [os.path.join(temp_dir, f"chunk_{i:03d}.mp4") for i in range(len(chunks))]
         merged_video_path = os.path.join(temp_dir, "merged.mp4")
         
-        # Run FFmpeg to concatenate the files
+        # Run FFmpeg to concatenate the files, reading the concat list from stdin
         cmd = [
             "ffmpeg",
             "-f", "concat",
             "-safe", "0",
-            "-i", concat_file_path,
+            "-protocol_whitelist", "file,pipe",
+            "-i", "pipe:0",
             "-c", "copy",  # Copy streams without re-encoding
             "-y",  # Overwrite output file if it exists
             merged_video_path
         ]
-        
         logging.info(f"Running FFmpeg command: {' '.join(cmd)}")
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        try:
+            ffmpeg = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                      stderr=subprocess.PIPE, text=True)
+        except FileNotFoundError:
+            logging.error("FFmpeg not found")
+            ffmpeg = None
+        
+        # Download the chunks concurrently; list each one once all earlier ones are on disk
+        workers = max(1, min(config.CHUNK_FETCH_WORKERS, len(chunks)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chunk-fetch") as executor:
+            futures = [executor.submit(fetch_chunk, fs, chunk["_id"], path)
+                       for chunk, path in zip(chunks, chunk_files)]
+            try:
+                for future in tqdm(futures, desc="Downloading chunks"):
+                    chunk_file = future.result()
+                    if ffmpeg is not None:
+                        try:
+                            # Without the file: prefix, entries would be resolved relative to pipe:
+                            ffmpeg.stdin.write(f"file 'file:{os.path.abspath(chunk_file)}'\n")
+                        except BrokenPipeError:
+                            pass  # FFmpeg exited; its error is reported below
+            except Exception:
+                # Cancel the queued fetches before leaving the executor, which waits
+                # for every fetch that has not been cancelled
+                for future in futures:
+                    future.cancel()
+                if ffmpeg is not None:
+                    ffmpeg.kill()
+                    ffmpeg.wait()
+                raise
         
-        if result.returncode != 0:
-            logging.error(f"FFmpeg error: {result.stderr}")
+        if ffmpeg is not None:
+            # The concat demuxer starts reading the files once the list is complete
+            _, stderr = ffmpeg.communicate()
+            returncode = ffmpeg.returncode
+        else:
+            stderr, returncode = "", 1
+        
+        if returncode != 0:
+            logging.error(f"FFmpeg error: {stderr}")
             
             # Fallback to OpenCV method if FFmpeg fails
             logging.info("Falling back to OpenCV for video merging")
@@ -163,80 +239,253 @@ def download_and_merge_chunks(db, video_id, temp_dir):
         else:
             logging.info("FFmpeg successfully merged video chunks")
         
-        # Get video properties using FFmpeg
-        cmd = [
-            "ffprobe",
-            "-v", "error",
-            "-select_streams", "v:0",
-            "-show_entries", "stream=width,height,r_frame_rate",
-            "-of", "json",
-            merged_video_path
-        ]
-        
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        if result.returncode != 0:
-            logging.error(f"FFprobe error: {result.stderr}")
-            
-            # Fallback to OpenCV for getting video properties
-            cap = cv2.VideoCapture(merged_video_path)
-            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            fps = cap.get(cv2.CAP_PROP_FPS)
-            if fps == 0:
-                fps = 30
-            cap.release()
-        else:
-            # Parse the JSON output from FFprobe
-            try:
-                info = json.loads(result.stdout)
-                stream = info.get("streams", [{}])[0]
-                width = stream.get("width", 0)
-                height = stream.get("height", 0)
-                
-                # Parse the frame rate fraction
-                r_frame_rate = stream.get("r_frame_rate", "30/1")
-                if "/" in r_frame_rate:
-                    num, den = map(int, r_frame_rate.split("/"))
-                    fps = num / den if den != 0 else 30
-                else:
-                    fps = float(r_frame_rate)
-            except Exception as e:
-                logging.error(f"Error parsing FFprobe output: {e}")
-                # Fallback values
-                cap = cv2.VideoCapture(merged_video_path)
-                width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-                height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                fps = cap.get(cv2.CAP_PROP_FPS) or 30
-                cap.release()
+        # Video properties come from the chunk metadata rather than a probe of the merged video
+        info = chunk_video_info(chunks, chunk_files)
         
         logging.info(f"Merged video saved to {merged_video_path}")
         
         return {
             "path": merged_video_path,
-            "fps": fps,
-            "width": width,
-            "height": height
+            "fps": info["fps"],
+            "width": info["width"],
+            "height": info["height"],
+            "start_time": info["start_time"],
+            "duration": info["duration"],
+            # Fragments start with a keyframe, so the merged video can be split there for parallel rendering
+            "fragment_starts": [chunk.get("metadata", {}).get("startTime") for chunk in chunks
+                                if chunk.get("metadata", {}).get("startTime") is not None]
         }
     
     except Exception as e:
         logging.error(f"Error downloading and merging chunks: {e}")
         return None
 
-def get_objects_for_video(db, video_name):
-    """Get all object tracking data for the video."""
+# Fields of an object and its frames that the annotator draws
+OBJECT_PROJECTION = {"track_id": 1, "start_time": 1, "storage": 1,
+                     "frames.frame": 1, "frames.box": 1, "frames.interpolated": 1}
+
+# Seconds added around a time range when reading columnar segments, since frame
+# timestamps are capture times and may not equal frame / fps exactly
+COLUMNAR_TIME_MARGIN = 1.0
+
+def with_columnar_frames(db, obj, first_frame=None, last_frame=None, start_time=None, end_time=None):
+    """Fill in the frames of an object stored in columnar format (DETECTION_SINK=columnar or migrate_columnar.py).
+
+    Such objects have no inline frames; their trajectory is read from
+    object_segments with ML.columnar.read_object_frames, restricted to the
+    segments around the time range and then to first_frame <= frame < last_frame.
+    Objects with inline frames are returned unchanged.
+    """
+    if obj.get("storage") != "columnar":
+        return obj
+    columns = read_object_frames(
+        db.objects, obj["_id"],
+        start_time=start_time - COLUMNAR_TIME_MARGIN if start_time is not None else None,
+        end_time=end_time + COLUMNAR_TIME_MARGIN if end_time is not None else None
+    )
+    keep = np.ones(len(columns["frame"]), dtype=bool)
+    if first_frame is not None:
+        keep &= columns["frame"] >= first_frame
+    if last_frame is not None:
+        keep &= columns["frame"] < last_frame
+    obj["frames"] = [
+        {"frame": frame, "box": box, "interpolated": interpolated}
+        for frame, box, interpolated in zip(columns["frame"][keep].tolist(), columns["box"][keep].tolist(),
+                                            columns["interpolated"][keep].tolist())
+    ]
+    return obj
+
+def get_objects_for_video(db, video_name, first_frame=None, last_frame=None, start_time=None, end_time=None,
+                          streaming=False):
+    """Get the object tracking data for the video.
+
+    With a frame range, only the objects whose start_time/end_time (seconds)
+    overlap [start_time, end_time] are loaded, and their frames are filtered
+    on the server to first_frame <= frame < last_frame, so documents of long
+    tracks are not transferred whole.
+
+    With streaming, a cursor sorted by start_time and _id is returned instead
+    of a list, for StreamingFrameIndex; documents are then fetched batch by
+    batch as the annotation reaches them.
+
+    Objects stored in columnar format get their frames from object_segments
+    (see with_columnar_frames), as each one is reached when streaming.
+    """
     try:
         # Extract the base video ID without extension
         video_id = os.path.splitext(video_name)[0]
         
-        objects = list(db.objects.find({"video_id": video_id}))
+        if first_frame is None and last_frame is None:
+            objects = db.objects.find({"video_id": video_id}, OBJECT_PROJECTION)
+            if streaming:
+                objects = objects.sort([("start_time", 1), ("_id", 1)])
+        else:
+            match = {"video_id": video_id}
+            if end_time is not None:
+                match["start_time"] = {"$lte": end_time}
+            if start_time is not None:
+                match["end_time"] = {"$gte": start_time}
+            conditions = []
+            if first_frame is not None:
+                conditions.append({"$gte": ["$$frame.frame", first_frame]})
+            if last_frame is not None:
+                conditions.append({"$lt": ["$$frame.frame", last_frame]})
+            pipeline = [
+                {"$match": match},
+                # find() projections can only $slice by position, so filter the frames by number here
+                {"$project": {
+                    "track_id": 1,
+                    "start_time": 1,
+                    "storage": 1,
+                    "frames": {"$map": {
+                        "input": {"$filter": {"input": "$frames", "as": "frame", "cond": {"$and": conditions}}},
+                        "as": "frame",
+                        "in": {"frame": "$$frame.frame", "box": "$$frame.box", "interpolated": "$$frame.interpolated"}
+                    }}
+                }}
+            ]
+            if streaming:
+                pipeline.append({"$sort": {"start_time": 1, "_id": 1}})
+            objects = db.objects.aggregate(pipeline, allowDiskUse=True)
+        objects = (with_columnar_frames(db, obj, first_frame, last_frame, start_time, end_time) for obj in objects)
+        if streaming:
+            logging.info(f"Streaming tracked objects for video: {video_id}")
+            return objects
+        objects = list(objects)
         logging.info(f"Found {len(objects)} tracked objects for video: {video_id}")
         return objects
     except Exception as e:
         logging.error(f"Error getting objects for video: {e}")
         return []
 
-def annotate_video(video_info, objects, output_path):
-    """Annotate the video with bounding boxes from tracked objects."""
+class StreamingFrameIndex:
+    """Boxes of each frame, read from objects sorted by start_time as the video plays.
+
+    An object is taken from the cursor when the annotation reaches its
+    start_time, waits in a heap keyed on its first frame number, is active
+    until its last frame and is then dropped, so memory is proportional to the
+    objects visible around the current frame rather than to all detections.
+    boxes() must be called with increasing frame numbers.
+    """
+
+    # Seconds ahead of the current frame from which objects are taken from the cursor,
+    # since start_time is a capture timestamp and may not equal frame / fps exactly
+    LOOKAHEAD_SECONDS = 1.0
+
+    def __init__(self, objects):
+        self.objects = iter(objects)
+        self.next_object = next(self.objects, None)
+        self.sequence = itertools.count()
+        # (first frame, sequence, object) of objects taken from the cursor that have not started
+        self.upcoming = []
+        # [last frame, sequence, object, position of the next frame] of objects being drawn
+        self.active = []
+        self.peak_objects = 0
+
+    def boxes(self, frame_number, seconds):
+        """Get the boxes of a frame.
+
+        Args are the frame number and the time in seconds of the frame in the
+        uploaded video. Returns dictionaries with track_id, box and interpolated.
+        """
+        while self.next_object is not None and self.next_object.get("start_time", 0) <= seconds + self.LOOKAHEAD_SECONDS:
+            frames = self.next_object.get("frames") or []
+            if frames:
+                heapq.heappush(self.upcoming, (frames[0]["frame"], next(self.sequence), self.next_object))
+            self.next_object = next(self.objects, None)
+        while self.upcoming and self.upcoming[0][0] <= frame_number:
+            _, sequence, obj = heapq.heappop(self.upcoming)
+            heapq.heappush(self.active, [obj["frames"][-1]["frame"], sequence, obj, 0])
+        while self.active and self.active[0][0] < frame_number:
+            heapq.heappop(self.active)
+        self.peak_objects = max(self.peak_objects, len(self.upcoming) + len(self.active))
+
+        boxes = []
+        for entry in self.active:
+            frames = entry[2]["frames"]
+            position = entry[3]
+            while position < len(frames) and frames[position]["frame"] < frame_number:
+                position += 1
+            entry[3] = position
+            if position < len(frames) and frames[position]["frame"] == frame_number:
+                boxes.append((entry[1], {
+                    "track_id": entry[2].get("track_id"),
+                    "box": frames[position].get("box"),
+                    "interpolated": frames[position].get("interpolated", False)
+                }))
+        # Draw in start order, so that overlapping boxes do not depend on the heap layout
+        boxes.sort(key=itemgetter(0))
+        return [box for _, box in boxes]
+
+def frame_range(video_info, start_time=None, end_time=None):
+    """Get the numbers, in the uploaded video, of the first frame and the frame after the last frame of a time range.
+
+    Without start_time the range starts at the first frame of the merged
+    video; without end_time it ends at its last frame.
+    """
+    fps = video_info["fps"]
+    clip_start = video_info.get("start_time", 0)
+    clip_end = clip_start + video_info["duration"] if video_info.get("duration") else None
+    start = clip_start if start_time is None else max(start_time, clip_start)
+    end = clip_end if end_time is None else (min(end_time, clip_end) if clip_end is not None else end_time)
+    first_frame = int(round(start * fps))
+    if end is None:
+        return first_frame, None
+    return first_frame, max(first_frame, int(round(end * fps)))
+
+def build_frame_index(objects):
+    """Index the boxes of all objects by frame number, holding every detection in memory.
+
+    Boxes of a frame are in start_time and _id order, like StreamingFrameIndex
+    draws them.
+    """
+    frame_objects = {}
+    for obj in sorted(objects, key=lambda obj: (obj.get("start_time", 0), str(obj["_id"]))):
+        for frame_data in obj.get("frames", []):
+            frame_idx = frame_data.get("frame")
+            if frame_idx is not None:
+                if frame_idx not in frame_objects:
+                    frame_objects[frame_idx] = []
+                frame_objects[frame_idx].append({
+                    "track_id": obj.get("track_id"),
+                    "box": frame_data.get("box"),
+                    "interpolated": frame_data.get("interpolated", False)
+                })
+    return frame_objects
+
+def draw_tracked_objects(frame, frame_boxes):
+    """Draw the boxes and track IDs of one frame onto it in place."""
+    for obj_data in frame_boxes:
+        box = obj_data.get("box")
+        track_id = obj_data.get("track_id")
+        interpolated = obj_data.get("interpolated")
+        
+        if box and len(box) == 4:
+            # Convert box coordinates to integers
+            x1, y1, x2, y2 = map(int, box)
+            
+            # Draw rectangle with different color based on interpolation
+            color = (0, 0, 255) if interpolated else (0, 255, 0)
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+            
+            # Draw track ID label
+            if track_id is not None:
+                label = f"ID:{track_id}"
+                cv2.putText(frame, label, (x1, y1-10), 
+                          cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 2)
+
+def annotate_video(video_info, objects, output_path, start_time=None, end_time=None, streaming=False,
+                   workers=1, fourcc="mp4v"):
+    """Annotate the video with bounding boxes from tracked objects.
+
+    start_time and end_time (seconds in the uploaded video) limit the output
+    to that range of the merged video; frames before it are skipped without
+    decoding them to images. With streaming, objects must be sorted by
+    start_time (see get_objects_for_video) and are swept with a
+    StreamingFrameIndex instead of being indexed up front. With more than one
+    worker, segments split at fragment boundaries are rendered in parallel
+    processes and joined without re-encoding (ML/parallel_render.py).
+    """
     try:
         if not video_info:
             logging.error("No video info provided for annotation")
@@ -245,55 +494,55 @@ def annotate_video(video_info, objects, output_path):
         # Open the merged video
         cap = cv2.VideoCapture(video_info["path"])
         
+        # Frame numbers in the object data count from the start of the upload, not of the merged chunks
+        clip_first_frame = int(round(video_info.get("start_time", 0) * video_info["fps"]))
+        first_frame, last_frame = frame_range(video_info, start_time, end_time)
+        
+        # Prepare frame-indexed object data for faster lookup, or sweep the objects as the video plays
+        if streaming:
+            index = StreamingFrameIndex(objects)
+        else:
+            frame_objects = build_frame_index(objects)
+        
+        def boxes_of(frame_number, seconds):
+            if streaming:
+                return index.boxes(frame_number, seconds)
+            return frame_objects.get(frame_number, [])
+        
+        # Process each frame of the video (or range)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) - (first_frame - clip_first_frame)
+        if last_frame is not None:
+            total_frames = min(total_frames, last_frame - first_frame)
+        
+        if workers > 1:
+            cap.release()
+            written = render_annotated_parallel(video_info, boxes_of, output_path, clip_first_frame,
+                                                first_frame, first_frame + total_frames, workers, fourcc)
+            if streaming:
+                logging.info(f"At most {index.peak_objects} objects were held in memory")
+            logging.info(f"Annotated video ({written} frames) saved to {output_path}")
+            return True
+        
+        for _ in range(first_frame - clip_first_frame):
+            if not cap.grab():
+                break
+        
         # Create output video writer
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        out = cv2.VideoWriter(output_path, fourcc, video_info["fps"], 
+        out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*fourcc), video_info["fps"], 
                               (video_info["width"], video_info["height"]))
         
         # Process each frame
-        frame_number = 0
-        frame_objects = {}
-        
-        # Prepare frame-indexed object data for faster lookup
-        for obj in objects:
-            for frame_data in obj.get("frames", []):
-                frame_idx = frame_data.get("frame")
-                if frame_idx is not None:
-                    if frame_idx not in frame_objects:
-                        frame_objects[frame_idx] = []
-                    frame_objects[frame_idx].append({
-                        "track_id": obj.get("track_id"),
-                        "box": frame_data.get("box"),
-                        "interpolated": frame_data.get("interpolated", False)
-                    })
-        
-        # Process each frame of the video
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        frame_number = first_frame
         for _ in tqdm(range(total_frames), desc="Annotating video"):
             ret, frame = cap.read()
             if not ret:
                 break
             
             # Annotate with objects for this frame
-            if frame_number in frame_objects:
-                for obj_data in frame_objects[frame_number]:
-                    box = obj_data.get("box")
-                    track_id = obj_data.get("track_id")
-                    interpolated = obj_data.get("interpolated")
-                    
-                    if box and len(box) == 4:
-                        # Convert box coordinates to integers
-                        x1, y1, x2, y2 = map(int, box)
-                        
-                        # Draw rectangle with different color based on interpolation
-                        color = (0, 0, 255) if interpolated else (0, 255, 0)
-                        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-                        
-                        # Draw track ID label
-                        if track_id is not None:
-                            label = f"ID:{track_id}"
-                            cv2.putText(frame, label, (x1, y1-10), 
-                                      cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 2)
+            # Time of the frame in the upload; frame / fps keeps the sweep going if the backend reports no timestamps
+            seconds = max(video_info.get("start_time", 0) + cap.get(cv2.CAP_PROP_POS_MSEC) / 1000,
+                          frame_number / video_info["fps"])
+            draw_tracked_objects(frame, boxes_of(frame_number, seconds))
             
             # Write the annotated frame
             out.write(frame)
@@ -303,6 +552,8 @@ def annotate_video(video_info, objects, output_path):
         cap.release()
         out.release()
         
+        if streaming:
+            logging.info(f"At most {index.peak_objects} objects were held in memory")
         logging.info(f"Annotated video saved to {output_path}")
         return True
     
@@ -310,49 +561,132 @@ def annotate_video(video_info, objects, output_path):
         logging.error(f"Error annotating video: {e}")
         return False
 
-def main():
-    """Main function to orchestrate the process."""
+def render_annotated_parallel(video_info, boxes_of, output_path, clip_first_frame, first_frame, end_frame,
+                              workers, fourcc="mp4v"):
+    """Render frames first_frame to end_frame (numbers in the upload) in parallel segments.
+
+    Segments start at fragment boundaries, which are keyframes of the merged
+    video. The boxes of each segment are collected from boxes_of just before
+    it is handed to a worker, so only the segments being rendered are in
+    memory. Returns the number of frames written.
+    """
+    fps = video_info["fps"]
+    boundaries = [int(round(start * fps)) for start in video_info.get("fragment_starts", [])]
+    # Segments of at least two seconds, so that process start-up and seeking stay small
+    segments = plan_render_segments(first_frame, end_frame, workers, boundaries, min_segment_frames=int(fps * 2))
+    logging.info(f"Rendering {end_frame - first_frame} frames in {len(segments)} segments with {workers} processes")
+    
+    def tasks():
+        for i, (start, end) in enumerate(segments):
+            # The worker decodes the merged video, whose frame numbers start at its first fragment
+            payloads = {}
+            for frame_number in range(start, end):
+                frame_boxes = boxes_of(frame_number, frame_number / fps)
+                if frame_boxes:
+                    payloads[frame_number - clip_first_frame] = frame_boxes
+            yield RenderTask(
+                video_info["path"], segment_path(output_path, i), start - clip_first_frame,
+                end - clip_first_frame, fps, (video_info["width"], video_info["height"]),
+                draw_tracked_objects, payloads, fourcc=fourcc
+            )
+    
+    return render_parallel(tasks(), output_path, min(workers, len(segments)))
+
+def annotate_time_range(db, video_id, start_time=None, end_time=None, video_name=None, output_dir="output",
+                        streaming=None, workers=None):
+    """Annotate a video, or only a time range of it, and save the result.
+
+    Only the GridFS chunks that overlap [start_time, end_time] (seconds) are
+    downloaded, only the objects that overlap it are loaded, with their frames
+    filtered to the range, and only the frames in the range are encoded.
+    Without a range the whole video is annotated. streaming defaults to
+    config.ANNOTATE_STREAMING and workers (render processes, 0 = one per
+    core) to config.RENDER_WORKERS.
+
+    Returns the path of the annotated video, or None on failure.
+    """
+    if start_time is not None and end_time is not None and end_time <= start_time:
+        logging.error(f"Invalid time range: {start_time}s to {end_time}s")
+        return None
+    
+    if video_name is None:
+        video = db.videos.find_one({"_id": ObjectId(video_id)}, {"filename": 1})
+        video_name = video.get("filename", video_id) if video else video_id
+    
+    # Create temporary directory
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Download and merge the video chunks of the range
+        video_info = download_and_merge_chunks(db, video_id, temp_dir, start_time, end_time)
+        if not video_info:
+            logging.error("Failed to download and merge video chunks")
+            return None
+        
+        # Get objects for this video (and range)
+        if streaming is None:
+            streaming = config.ANNOTATE_STREAMING
+        if start_time is None and end_time is None:
+            objects = get_objects_for_video(db, video_name, streaming=streaming)
+        else:
+            first_frame, last_frame = frame_range(video_info, start_time, end_time)
+            objects = get_objects_for_video(db, video_name, first_frame, last_frame, start_time, end_time,
+                                            streaming=streaming)
+        
+        # Annotate the video
+        range_suffix = ""
+        if start_time is not None or end_time is not None:
+            end_label = f"{end_time:g}s" if end_time is not None else "end"
+            range_suffix = f"_{start_time or 0:g}s-{end_label}"
+        output_filename = f"annotated_{video_name.split('.')[0]}{range_suffix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp4"
+        os.makedirs(output_dir, exist_ok=True)
+        output_path = os.path.join(output_dir, output_filename)
+        
+        workers = resolve_workers(config.RENDER_WORKERS if workers is None else workers)
+        if not annotate_video(video_info, objects, output_path, start_time, end_time, streaming, workers):
+            return None
+        return output_path
+
+def main(video_id=None, start_time=None, end_time=None, workers=None):
+    """Main function to orchestrate the process.
+
+    Annotates the latest video, or video_id if given, optionally only between
+    start_time and end_time (seconds), rendering with workers processes.
+    """
     try:
-        # Connect to MongoDB
+        # Connect to MongoDB through the shared, configured client
         logging.info(f"Connecting to MongoDB at: {mongodb_uri}")
-        client = MongoClient(mongodb_uri)
+        client = get_mongo_client()
         db = client[db_name]
         
-        # Get the latest video
-        latest_video = get_latest_video(db)
-        if not latest_video:
-            logging.error("Failed to find latest video in database")
-            return
+        video_name = None
+        if video_id is None:
+            # Get the latest video
+            latest_video = get_latest_video(db)
+            if not latest_video:
+                logging.error("Failed to find latest video in database")
+                return
+            video_id = str(latest_video["_id"])
+            video_name = latest_video.get("filename", video_id)
+        logging.info(f"Processing video: {video_name or video_id} (ID: {video_id})")
+        if start_time is not None or end_time is not None:
+            logging.info(f"Annotating from {start_time or 0}s to {end_time if end_time is not None else 'the end'}")
         
-        video_id = str(latest_video["_id"])
-        video_name = latest_video.get("filename", video_id)
-        logging.info(f"Processing video: {video_name} (ID: {video_id})")
+        output_path = annotate_time_range(db, video_id, start_time, end_time, video_name, workers=workers)
         
-        # Create temporary directory
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # Download and merge video chunks
-            video_info = download_and_merge_chunks(db, video_id, temp_dir)
-            if not video_info:
-                logging.error("Failed to download and merge video chunks")
-                return
-            
-            # Get objects for this video
-            objects = get_objects_for_video(db, video_name)
-            
-            # Annotate the video
-            output_filename = f"annotated_{video_name.split('.')[0]}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp4"
-            output_path = os.path.join("output", output_filename)
-            
-            success = annotate_video(video_info, objects, output_path)
-            
-            if success:
-                logging.info("Process completed successfully")
-                print(f"Annotated video saved to: {output_path}")
-            else:
-                logging.error("Failed to complete annotation process")
+        if output_path:
+            logging.info("Process completed successfully")
+            print(f"Annotated video saved to: {output_path}")
+        else:
+            logging.error("Failed to complete annotation process")
     
     except Exception as e:
         logging.error(f"Error in main process: {e}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Annotate an uploaded video with its tracked objects")
+    parser.add_argument("--video-id", help="ID of the video to annotate (default: the latest video)")
+    parser.add_argument("--start", type=float, default=None, help="start of the time range to annotate, in seconds")
+    parser.add_argument("--end", type=float, default=None, help="end of the time range to annotate, in seconds")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes rendering segments in parallel (0 = one per core; default: RENDER_WORKERS)")
+    args = parser.parse_args()
+    main(args.video_id, args.start, args.end, args.workers)
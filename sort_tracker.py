@@ -1,56 +1,192 @@
 import numpy as np
-from scipy.optimize import linear_sum_assignment
 from collections import deque
 
+def convert_bbox_to_z(bbox):
+    """[x1, y1, x2, y2] -> [cx, cy, s, r] where s is the area and r the aspect ratio"""
+    w = bbox[2] - bbox[0]
+    h = bbox[3] - bbox[1]
+    x = bbox[0] + w / 2.
+    y = bbox[1] + h / 2.
+    s = w * h
+    r = w / float(h) if h > 0 else 1.
+    return np.array([x, y, s, r], dtype=np.float64)
+
+def convert_x_to_bbox(x):
+    """[cx, cy, s, r, ...] -> [x1, y1, x2, y2]"""
+    s = max(x[2], 0.)
+    r = max(x[3], 1e-6)
+    w = np.sqrt(s * r)
+    h = s / w if w > 0 else 0.
+    return np.array([x[0] - w / 2., x[1] - h / 2., x[0] + w / 2., x[1] + h / 2.], dtype=np.float64)
+
+def convert_bbox_to_z_batch(bboxes):
+    """Vectorized convert_bbox_to_z for an (N, 4) array"""
+    w = bboxes[:, 2] - bboxes[:, 0]
+    h = bboxes[:, 3] - bboxes[:, 1]
+    r = np.divide(w, h, out=np.ones_like(w), where=h > 0)
+    return np.stack([bboxes[:, 0] + w / 2., bboxes[:, 1] + h / 2., w * h, r], axis=1)
+
+def convert_x_to_bbox_batch(X):
+    """Vectorized convert_x_to_bbox for an (N, >=4) array of states"""
+    s = np.maximum(X[:, 2], 0.)
+    w = np.sqrt(s * np.maximum(X[:, 3], 1e-6))
+    h = np.divide(s, w, out=np.zeros_like(w), where=w > 0)
+    return np.stack([X[:, 0] - w / 2., X[:, 1] - h / 2., X[:, 0] + w / 2., X[:, 1] + h / 2.], axis=1)
+
 class KalmanBoxTracker:
+    """
+    Tracks one object with a constant-velocity Kalman filter
+
+    State is [cx, cy, s, r, vcx, vcy, vs]: box centre, area and aspect ratio,
+    plus the velocities of the centre and area. The aspect ratio is assumed
+    constant.
+    """
     count = 0
-    def __init__(self, bbox):
-        self.bbox = bbox  # [x1, y1, x2, y2]
+
+    # Shared model matrices
+    F = np.eye(7)
+    F[0, 4] = F[1, 5] = F[2, 6] = 1.
+    H = np.eye(4, 7)
+    R = np.diag([1., 1., 10., 10.])
+    Q = np.diag([1., 1., 1., 1., 0.01, 0.01, 0.0001])
+    P0 = np.diag([10., 10., 10., 10., 10000., 10000., 10000.])
+
+    def __init__(self, bbox, label=None):
+        self.bbox = np.asarray(bbox[:4], dtype=np.float64)  # last observed [x1, y1, x2, y2]
+        self.label = label
         self.id = KalmanBoxTracker.count
         KalmanBoxTracker.count += 1
+        self.x = np.zeros(7)
+        self.x[:4] = convert_bbox_to_z(self.bbox)
+        self.P = self.P0.copy()
         self.hits = 1
-        self.no_losses = 0
+        self.hit_streak = 1
+        self.age = 0
+        self.no_losses = 0  # frames since the last matched detection
         self.trace = deque(maxlen=10)
-        self.trace.append(bbox)
+        self.trace.append(self.bbox)
 
-    def update(self, bbox):
-        self.bbox = bbox
+    @classmethod
+    def predict_batch(cls, X, P):
+        """Kalman prediction for stacked states X (N, 7) and covariances P (N, 7, 7)"""
+        # Keep the predicted area positive
+        X[X[:, 2] + X[:, 6] <= 0, 6] = 0.
+        return X @ cls.F.T, cls.F @ P @ cls.F.T + cls.Q
+
+    @classmethod
+    def update_batch(cls, X, P, Z):
+        """Kalman correction for stacked states, covariances and measurements Z (N, 4)"""
+        y = Z - X[:, :4]
+        S = P[:, :4, :4] + cls.R
+        K = P[:, :, :4] @ np.linalg.inv(S)
+        X = X + (K @ y[:, :, None])[:, :, 0]
+        P = P - K @ P[:, :4, :]
+        return X, P
+
+    def mark_matched(self, bbox):
+        self.bbox = np.asarray(bbox[:4], dtype=np.float64)
         self.hits += 1
+        self.hit_streak += 1
         self.no_losses = 0
-        self.trace.append(bbox)
+        self.trace.append(self.bbox)
 
-    def predict(self):
+    def mark_predicted(self):
+        self.age += 1
+        if self.no_losses > 0:
+            self.hit_streak = 0
         self.no_losses += 1
-        return self.bbox
+
+    def update(self, bbox):
+        self.mark_matched(bbox)
+        X, P = self.update_batch(self.x[None], self.P[None], convert_bbox_to_z(self.bbox)[None])
+        self.x, self.P = X[0], P[0]
+
+    def predict(self):
+        X, P = self.predict_batch(self.x[None].copy(), self.P[None])
+        self.x, self.P = X[0], P[0]
+        self.mark_predicted()
+        return self.get_state()
+
+    def get_state(self):
+        """Current state estimate as [x1, y1, x2, y2]"""
+        return convert_x_to_bbox(self.x)
 
 class Sort:
-    def __init__(self, max_age=3, min_hits=1, iou_threshold=0.3):
+    def __init__(self, max_age=3, min_hits=1, iou_threshold=0.3, per_class=False):
         self.max_age = max_age
         self.min_hits = min_hits
         self.trackers = []
         self.frame_count = 0
         self.iou_threshold = iou_threshold
+        self.per_class = per_class
+
+    def assign(self, dets, classes=None):
+        """
+        Advance all trackers one frame and match them to the detections
 
-    def update(self, dets):
+        Trackers are matched against their Kalman-predicted boxes, so a track
+        that was missed for a few frames (up to max_age) can still be picked
+        up again. With per_class, detections only match trackers of the same
+        class.
+
+        Returns:
+            List with the tracker assigned to each detection, in detection order
+        """
         self.frame_count += 1
-        trks = np.array([trk.bbox for trk in self.trackers])
-        matched, unmatched_dets, unmatched_trks = associate_detections_to_trackers(dets, trks, self.iou_threshold)
-        # Update matched trackers
-        for t, trk in enumerate(self.trackers):
-            if t not in unmatched_trks:
-                d = matched[t]
-                trk.update(dets[d])
-            else:
-                trk.predict()
-        # Create new trackers for unmatched detections
-        for i in unmatched_dets:
-            self.trackers.append(KalmanBoxTracker(dets[i]))
+        dets = np.asarray(dets, dtype=np.float64).reshape(-1, 4) if len(dets) else np.empty((0, 4))
+        if classes is None or not self.per_class:
+            classes = [None] * len(dets)
+
+        # Predict every tracker in one batched Kalman step
+        if self.trackers:
+            X, P = KalmanBoxTracker.predict_batch(
+                np.array([trk.x for trk in self.trackers]), np.array([trk.P for trk in self.trackers]))
+            for trk, x, p in zip(self.trackers, X, P):
+                trk.x, trk.P = x, p
+                trk.mark_predicted()
+            predicted = convert_x_to_bbox_batch(X)
+        else:
+            predicted = np.empty((0, 4))
+        valid = np.all(np.isfinite(predicted), axis=1)
+        if not valid.all():
+            self.trackers = [trk for trk, ok in zip(self.trackers, valid) if ok]
+            predicted = predicted[valid]
+
+        assigned = [None] * len(dets)
+        trk_labels = np.array([trk.label for trk in self.trackers], dtype=object)
+        det_labels = np.array(classes, dtype=object)
+        for label in dict.fromkeys(classes):
+            det_idx = np.flatnonzero(det_labels == label)
+            trk_idx = np.flatnonzero(trk_labels == label)
+            matched, unmatched_dets, _ = associate_detections_to_trackers(
+                dets[det_idx], predicted[trk_idx], self.iou_threshold)
+            # Update matched trackers in one batched Kalman step
+            if matched:
+                trks = [self.trackers[trk_idx[t]] for t in matched]
+                matched_dets = det_idx[list(matched.values())]
+                X, P = KalmanBoxTracker.update_batch(
+                    np.array([trk.x for trk in trks]), np.array([trk.P for trk in trks]),
+                    convert_bbox_to_z_batch(dets[matched_dets]))
+                for trk, d, x, p in zip(trks, matched_dets, X, P):
+                    trk.x, trk.P = x, p
+                    trk.mark_matched(dets[d])
+                    assigned[d] = trk
+            # Create new trackers for unmatched detections
+            for d in sorted(unmatched_dets):
+                trk = KalmanBoxTracker(dets[det_idx[d]], label)
+                self.trackers.append(trk)
+                assigned[det_idx[d]] = trk
+
         # Remove dead trackers
         self.trackers = [t for t in self.trackers if t.no_losses <= self.max_age]
+        return assigned
+
+    def update(self, dets, classes=None):
+        self.assign(dets, classes)
         # Prepare output: [x1, y1, x2, y2, id]
         ret = []
         for trk in self.trackers:
-            if trk.hits >= self.min_hits or self.frame_count <= self.min_hits:
+            if trk.no_losses == 0 and (trk.hits >= self.min_hits or self.frame_count <= self.min_hits):
                 ret.append(np.append(trk.bbox, trk.id))
         return np.array(ret)
 
@@ -66,13 +202,31 @@ def iou(bb_test, bb_gt):
               + (bb_gt[2] - bb_gt[0]) * (bb_gt[3] - bb_gt[1]) - wh)
     return o
 
+def iou_batch(bb_test, bb_gt):
+    """IoU between every box in bb_test (N, 4) and every box in bb_gt (M, 4), as an (N, M) matrix"""
+    bb_test = np.asarray(bb_test, dtype=np.float64).reshape(-1, 4)
+    bb_gt = np.asarray(bb_gt, dtype=np.float64).reshape(-1, 4)
+    bb_test = np.expand_dims(bb_test, 1)
+    bb_gt = np.expand_dims(bb_gt, 0)
+    xx1 = np.maximum(bb_test[..., 0], bb_gt[..., 0])
+    yy1 = np.maximum(bb_test[..., 1], bb_gt[..., 1])
+    xx2 = np.minimum(bb_test[..., 2], bb_gt[..., 2])
+    yy2 = np.minimum(bb_test[..., 3], bb_gt[..., 3])
+    w = np.maximum(0., xx2 - xx1)
+    h = np.maximum(0., yy2 - yy1)
+    wh = w * h
+    union = ((bb_test[..., 2] - bb_test[..., 0]) * (bb_test[..., 3] - bb_test[..., 1])
+             + (bb_gt[..., 2] - bb_gt[..., 0]) * (bb_gt[..., 3] - bb_gt[..., 1]) - wh)
+    return np.divide(wh, union, out=np.zeros_like(wh), where=union > 0)
+
 def associate_detections_to_trackers(detections, trackers, iou_threshold=0.3):
     if len(trackers) == 0:
         return {}, list(range(len(detections))), []
-    iou_matrix = np.zeros((len(detections), len(trackers)), dtype=np.float32)
-    for d, det in enumerate(detections):
-        for t, trk in enumerate(trackers):
-            iou_matrix[d, t] = iou(det, trk)
+    if len(detections) == 0:
+        return {}, [], list(range(len(trackers)))
+    # scipy.optimize is slow to import, so it is imported when the first assignment is solved
+    from scipy.optimize import linear_sum_assignment
+    iou_matrix = iou_batch(detections, trackers)
     matched_indices = linear_sum_assignment(-iou_matrix)
     matched_indices = np.asarray(matched_indices).T
     unmatched_detections = list(set(range(len(detections))) - set(matched_indices[:, 0]))